@@ -1,53 +1,81 @@
-from fastapi import APIRouter, HTTPException, Body
+from fastapi import APIRouter, HTTPException, Body, Query
 from ..core.config import app_state, Account
 from pydantic import BaseModel
 from ..core.mihoyo_api import MihoyoAPI
-import json
+from ..core.account_health import AccountHealthChecker
+from ..core.login_watcher import LoginWatcher
+from ..core.qr_ticket_pool import QrTicketPool
+from ..core.executors import run_in
+from .ws import manager
 
 router = APIRouter()
 mihoyo_api = MihoyoAPI()
+# 批量检查使用独立的连接池 每主机连接数与并发上限一致
+health_checker = AccountHealthChecker(MihoyoAPI(max_per_host=16), concurrency=16)
+# 扫码登录状态由后端统一轮询 状态变化经WebSocket推送给所有页面
+login_watcher = LoginWatcher(mihoyo_api, manager.publish)
+# 预先申请并编码好的二维码 打开添加账户对话框时直接取用
+qr_pool = QrTicketPool(mihoyo_api)
 
 @router.get("/accounts", summary="获取所有已保存账户")
 async def get_accounts():
-    return {name: acc.model_dump() for name, acc in app_state.accounts.items()}
+    # 账户存储读写SQLite 在io线程池中执行 不阻塞事件循环
+    items = await run_in("io", app_state.accounts.items)
+    return {name: acc.model_dump() for name, acc in items}
+
+@router.get("/accounts/by-uid/{uid}", summary="按UID查找账户")
+async def get_account_by_uid(uid: str):
+    found = await run_in("io", app_state.accounts.find_by_uid, uid)
+    if found is None:
+        raise HTTPException(status_code=404, detail="账户不存在")
+    name, acc = found
+    return {"name": name, **acc.model_dump()}
+
+@router.post("/accounts/health/check", summary="后台批量检查所有账户的Stoken是否有效")
+async def check_accounts_health():
+    if not health_checker.start(await run_in("io", app_state.accounts.items)):
+        raise HTTPException(status_code=409, detail="账户检查任务已在运行")
+    return {"message": "账户检查任务已启动", "total": health_checker.total}
+
+@router.get("/accounts/health", summary="获取账户检查进度及每个账户最近一次的检查结果")
+async def get_accounts_health():
+    return health_checker.report()
 
 @router.delete("/accounts/{name}", summary="删除指定账户")
 async def delete_account(name: str):
-    if name not in app_state.accounts:
+    if await run_in("io", app_state.accounts.pop, name, None) is None:
         raise HTTPException(status_code=404, detail="账户不存在")
-    del app_state.accounts[name]
-    app_state.save_accounts()
+    health_checker.forget(name)
     return {"message": f"账户 {name} 已删除"}
 
 @router.get("/login/qr", summary="请求登录二维码")
-async def get_login_qr():
-    qr_data, error = mihoyo_api.fetch_qr_code()
+async def get_login_qr(fmt: str = Query("svg", alias="format")):
+    # format=svg 返回qr_image(SVG图片) format=matrix 返回qr_matrix(模块矩阵 每行一个01字符串)
+    # 二维码池在第一次请求时才启动 无人添加账户时不会向上游申请票据
+    if fmt not in ("svg", "matrix"):
+        raise HTTPException(status_code=400, detail="format只能为svg或matrix")
+    qr_data, error = await qr_pool.take()
     if error:
         raise HTTPException(status_code=500, detail=error)
+    qr_data.pop("qr_matrix" if fmt == "svg" else "qr_image")
+    # 取得二维码后立即开始监视 状态通过WebSocket的login_status消息推送
+    login_watcher.watch(qr_data["ticket"], qr_data["device"])
     return qr_data
 
 @router.get("/login/status", summary="查询二维码登录状态")
 async def get_login_status(ticket: str, device: str):
-    status_data, error = mihoyo_api.query_qr_status(ticket, device)
-    if error:
-        raise HTTPException(status_code=500, detail=error)
-        
-    # 如果状态是已确认 则在后端获取Stoken
-    if status_data.get("retcode") == 0 and status_data.get("data", {}).get("stat") == "Confirmed":
-        try:
-            raw_payload = json.loads(status_data["data"]["payload"]["raw"])
-            uid, game_token = raw_payload['uid'], raw_payload['token']
-            
-            cookie, stoken_error = mihoyo_api.get_stoken_from_game_token(uid, game_token)
-            if stoken_error:
-                raise HTTPException(status_code=500, detail=f"获取Stoken失败 {stoken_error}")
+    # 返回后端监视任务的最新状态 不会向上游发起请求 供重连后的页面补齐状态
+    return login_watcher.watch(ticket, device)
 
-            # 成功后将新账户信息附加到响应中
-            status_data["new_account"] = {"uid": uid, "cookie": cookie}
-        except Exception as e:
-             raise HTTPException(status_code=500, detail=f"处理扫码确认数据时出错 {e}")
+@router.delete("/login/status/{ticket}", summary="停止监视二维码登录状态")
+async def cancel_login_status(ticket: str):
+    if not login_watcher.cancel(ticket):
+        raise HTTPException(status_code=404, detail="该二维码未在监视中")
+    return {"message": "已停止监视"}
 
-    return status_data
+@router.get("/login/watcher", summary="获取登录状态监视任务及二维码池统计")
+async def get_login_watcher_stats():
+    return {**login_watcher.stats(), "qr_pool": qr_pool.stats()}
 
 # 定义一个用于接收POST body的模型
 class SaveAccountPayload(BaseModel):
@@ -57,11 +85,10 @@ class SaveAccountPayload(BaseModel):
 
 @router.post("/login/save", summary="保存新登录的账户")
 async def save_new_account(payload: SaveAccountPayload = Body(...)):
-    if payload.name in app_state.accounts:
+    if await run_in("io", app_state.accounts.__contains__, payload.name):
         raise HTTPException(status_code=409, detail="该账户名已存在")
     
     # 从payload创建Account模型
     new_account = Account(uid=payload.uid, cookie=payload.cookie)
-    app_state.accounts[payload.name] = new_account
-    app_state.save_accounts()
+    await run_in("io", app_state.accounts.__setitem__, payload.name, new_account)
     return {"message": f"账户 {payload.name} 已成功保存"}
\ No newline at end of file
@@ -0,0 +1,32 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from ..core.metrics import metrics
+from ..core.loop_monitor import loop_monitor
+from ..core.executors import executor_stats
+from ..core.request_budget import request_budget
+from .scanner import scanner_instance
+
+router = APIRouter()
+
+@router.get("/metrics", summary="Prometheus格式的各阶段耗时直方图", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@router.get("/metrics/summary", summary="各阶段耗时摘要 次数 平均值与p50/p95/p99(毫秒)")
+async def get_metrics_summary():
+    return metrics.summary()
+
+
+@router.get("/metrics/loop", summary="事件循环延迟 最近的卡顿及其调用栈 各线程池排队情况")
+async def get_loop_metrics():
+    # scan_loop为扫描会话所在的监督器事件循环
+    return {
+        **loop_monitor.stats(),
+        "scan_loop": scanner_instance.supervisor.loop_monitor.stats(),
+        "executors": executor_stats(),
+    }
+
+
+@router.get("/metrics/budget", summary="出站请求预算 各主机的令牌余量 各通道的排队数与等待时间")
+async def get_budget_metrics():
+    return request_budget.stats()
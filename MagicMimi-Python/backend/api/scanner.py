@@ -1,56 +1,100 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException
 from ..core.window_scanner import WindowScanner
 from ..core.config import app_state, ScanSettings
+from ..core.qr_decoders import decoder_registry
+from ..core.decode_ladder import parse_steps
+from ..core.ticket_ledger import ticket_ledger
+from ..core.executors import run_in
 from .ws import manager
-import asyncio
+from pydantic import BaseModel
+from typing import Optional
 
 router = APIRouter()
 scanner_instance = WindowScanner(app_state, manager)
 
 @router.post("/scan/start", summary="启动窗口扫描任务")
-async def start_scan(settings: ScanSettings, background_tasks: BackgroundTasks):
-    if app_state.is_scanning:
-        raise HTTPException(status_code=400, detail="扫描任务已在运行")
-    
+async def start_scan(settings: ScanSettings):
     # 验证账户是否存在
-    if settings.account_name not in app_state.accounts:
+    if not await run_in("io", app_state.accounts.__contains__, settings.account_name):
          raise HTTPException(status_code=404, detail=f"账户 '{settings.account_name}' 未找到")
+    try:
+        parse_steps(settings.decode_steps)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    app_state.is_scanning = True
-    app_state.stop_event = asyncio.Event() # 使用asyncio的Event
-    
-    # 使用后台任务来运行同步的扫描循环
-    background_tasks.add_task(run_scanner_in_thread, settings, app_state.stop_event)
-
+    # 会话在监督器的工作线程中启动 这里不等待截图源打开 状态变化经WebSocket的scan_state消息推送
+    success, message = scanner_instance.start(settings)
+    if not success:
+        raise HTTPException(status_code=400, detail=message)
     await manager.broadcast_log(f"扫描任务已启动，目标窗口句柄: {settings.hwnd}", "INFO")
-    return {"message": "扫描任务已启动"}
-
-def run_scanner_in_thread(settings: ScanSettings, stop_event: asyncio.Event):
-    # 这个函数将在一个独立的线程中被后台任务调用
-    # 它创建一个新的事件循环来运行异步的扫描循环
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    loop.run_until_complete(scanner_instance._scan_loop(settings, stop_event))
-    loop.close()
+    return {"message": message, "session": scanner_instance.session_status()}
 
 @router.post("/scan/stop", summary="停止窗口扫描任务")
-async def stop_scan():
-    if not app_state.is_scanning:
-        raise HTTPException(status_code=400, detail="没有正在运行的扫描任务")
-    
-    if app_state.stop_event:
-        app_state.stop_event.set() # 发送停止信号
-    
-    # 重置状态
-    app_state.is_scanning = False
-    
-    # 等待线程结束（可选，但最好有）
-    if app_state.scanner_thread and app_state.scanner_thread.is_alive():
-        app_state.scanner_thread.join(timeout=2.0)
-
-    await manager.broadcast_log("扫描任务已手动停止。", "INFO")
-    return {"message": "扫描任务已停止"}
+async def stop_scan(wait: bool = True):
+    # wait为True时等待会话清理完成再返回 清理在监督器线程中进行 不阻塞事件循环
+    success, message = scanner_instance.stop()
+    if not success:
+        raise HTTPException(status_code=400, detail=message)
+    if wait and not await scanner_instance.wait_stopped(timeout=5.0):
+        return {"message": "扫描任务停止超时 仍在后台清理", "session": scanner_instance.session_status()}
+    return {"message": "扫描任务已停止", "session": scanner_instance.session_status()}
 
 @router.get("/scan/status", summary="获取当前扫描状态")
 async def get_scan_status():
-    return {"is_scanning": app_state.is_scanning}
\ No newline at end of file
+    # pipeline包含截图/解码计数及自适应调度器的决策指标 connections为登录连接预热状态
+    # session为扫描会话的生命周期状态 idle/starting/running/stopping 及最近一次启动和停止的耗时
+    return {
+        "is_scanning": app_state.is_scanning,
+        "session": scanner_instance.session_status(),
+        "pipeline": scanner_instance.metrics(),
+        "connections": scanner_instance.connection_metrics(),
+        "tickets": ticket_ledger.stats(),
+    }
+
+@router.get("/scan/tickets", summary="获取票据台账 包括各状态计数 重复抑制次数和最近的票据")
+async def get_ticket_ledger(limit: int = 20):
+    return {"stats": ticket_ledger.stats(), "recent": ticket_ledger.recent(limit)}
+
+class ScanTargetRequest(BaseModel):
+    hwnd: Optional[int] = None
+    # 回放帧源 如 dir:frames/ 设置后忽略hwnd
+    source: Optional[str] = None
+
+@router.get("/scan/targets", summary="获取当前扫描会话中的目标窗口及各自的FPS和命中率")
+async def list_scan_targets():
+    engine = scanner_instance.pipeline
+    if engine is None:
+        return {"targets": {}}
+    return {"targets": engine.stats()["targets"]}
+
+@router.post("/scan/targets", summary="向运行中的扫描会话添加目标窗口")
+async def add_scan_target(request: ScanTargetRequest):
+    if request.hwnd is None and not request.source:
+        raise HTTPException(status_code=400, detail="需要提供hwnd或source")
+    success, result = await run_in("io", scanner_instance.add_target, request.hwnd, request.source)
+    if not success:
+        raise HTTPException(status_code=400, detail=result)
+    await manager.broadcast_log(f"已添加扫描目标 {result}", "INFO")
+    return {"message": "目标已添加", "target_id": result}
+
+@router.delete("/scan/targets/{target_id:path}", summary="从运行中的扫描会话移除目标窗口")
+async def remove_scan_target(target_id: str):
+    success, result = scanner_instance.remove_target(target_id)
+    if not success:
+        raise HTTPException(status_code=404, detail=result)
+    await manager.broadcast_log(f"已移除扫描目标 {result}", "INFO")
+    return {"message": "目标已移除", "target_id": result}
+
+@router.get("/scan/decoder", summary="获取当前使用的二维码解码后端及校准耗时 以及初筛和解码阶梯各级的命中情况")
+async def get_decoder_info():
+    ladder, prefilter = scanner_instance.ladder, scanner_instance.prefilter
+    return {
+        **decoder_registry.report(),
+        "prefilter": prefilter.stats() if prefilter else None,
+        "ladder": ladder.stats() if ladder else None,
+    }
+
+@router.post("/scan/decoder/calibrate", summary="重新校准二维码解码后端")
+async def calibrate_decoder():
+    await run_in("cpu", decoder_registry.calibrate)
+    return decoder_registry.report()
\ No newline at end of file
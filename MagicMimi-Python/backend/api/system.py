@@ -1,20 +1,24 @@
 from fastapi import APIRouter, HTTPException
+from ..core.executors import run_in
 
 router = APIRouter()
 
+def list_windows():
+    import pygetwindow as gw
+    import win32gui
+
+    windows = gw.getAllWindows()
+    return [
+        {"title": w.title, "hwnd": w._hWnd}
+        for w in windows
+        if w.title and w.width > 100 and win32gui.IsWindowVisible(w._hWnd)
+    ]
+
 @router.get("/windows", summary="获取可见窗口列表")
 async def get_windows():
     try:
-        import pygetwindow as gw
-        import win32gui
-        
-        windows = gw.getAllWindows()
-        window_list = [
-            {"title": w.title, "hwnd": w._hWnd}
-            for w in windows
-            if w.title and w.width > 100 and win32gui.IsWindowVisible(w._hWnd)
-        ]
-        return window_list
+        # 枚举窗口需要逐个查询窗口属性 窗口多时耗时明显 放到IO线程池中执行
+        return await run_in("io", list_windows)
     except ImportError:
         raise HTTPException(status_code=501, detail="此功能仅在Windows上可用")
     except Exception as e:
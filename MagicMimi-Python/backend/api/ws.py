@@ -1,46 +1,200 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from collections import deque
+from typing import Optional
+import asyncio
 import json
+import threading
 import time
 
+from ..core.log_ring import LogRing, log_ring
+
 router = APIRouter()
 
+class ClientChannel:
+    # 单个客户端的发送通道 有界队列由独立的发送任务消费 慢客户端只会拖慢自己
+    def __init__(self, websocket: WebSocket, max_queue: int, send_timeout: float):
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.queue = deque()
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.sent = 0
+        # 连接时需要补发的历史日志帧 由发送任务先于实时消息发出 不占用队列配额
+        self.replay = []
+
+    def offer(self, text: str) -> bool:
+        # 队列已满说明客户端落后太多 返回False由管理器驱逐
+        if len(self.queue) >= self.max_queue:
+            return False
+        self.queue.append(text)
+        self.wakeup.set()
+        return True
+
+    async def run(self, on_error):
+        try:
+            for text in self.replay:
+                await asyncio.wait_for(self.websocket.send_text(text), self.send_timeout)
+                self.sent += 1
+            self.replay = []
+            while True:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                while self.queue:
+                    # 单帧发送超时同样视为客户端失联
+                    await asyncio.wait_for(self.websocket.send_text(self.queue.popleft()), self.send_timeout)
+                    self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            on_error(self)
+
 class WebSocketManager:
-    def __init__(self):
+    # 广播方只把消息放进发件箱 不等待任何网络IO 可以在任意线程中调用
+    # 发件箱由定时任务每tick秒统一分发一次 期间的日志合并为一帧 fps等高频消息只保留最新值
+    # 每个客户端有自己的有界发送队列和发送任务 积压超过max_queue帧的客户端会被断开
+    # 日志同时写入带seq的环形缓冲 新连接按since补发错过的日志 客户端按seq去重
+    COALESCE_TYPES = ("fps",)
+
+    def __init__(self, tick: float = 0.1, max_queue: int = 64, max_batch: int = 200, max_outbox: int = 5000, send_timeout: float = 5.0, log_ring: LogRing = log_ring, replay_tail: int = 200):
+        self.log_ring = log_ring
+        self.replay_tail = replay_tail
+        self.tick = tick
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.max_batch = max_batch
         self.active_connections: list[WebSocket] = []
+        self._channels = {}
+        self.max_outbox = max_outbox
+        self._outbox = deque(maxlen=max_outbox)
+        self._latest = {}
+        self._lock = threading.Lock()
+        self._ticker = None
+        self.frames = 0
+        self.coalesced = 0
+        self.evicted = 0
 
-    async def connect(self, websocket: WebSocket):
+    async def connect(self, websocket: WebSocket, since: Optional[int] = None):
+        # since为客户端已收到的最后一条日志的seq 不传时补发最近replay_tail条
         await websocket.accept()
+        channel = ClientChannel(websocket, self.max_queue, self.send_timeout)
+        with self._lock:
+            # 与日志写入互斥 补发快照之后的日志一定会经发件箱送达 重叠部分由客户端按seq丢弃
+            records = self.log_ring.since(since, limit=self.max_batch * self.max_queue) if since is not None else self.log_ring.tail(self.replay_tail)
+            self._channels[websocket] = channel
+        channel.replay = [
+            json.dumps({"type": "logs", "entries": records[i:i + self.max_batch], "replay": True})
+            for i in range(0, len(records), self.max_batch)
+        ]
+        channel.task = asyncio.create_task(channel.run(self._evict))
         self.active_connections.append(websocket)
+        if self._ticker is None or self._ticker.done():
+            self._ticker = asyncio.create_task(self._tick_loop())
 
     def disconnect(self, websocket: WebSocket):
+        channel = self._channels.pop(websocket, None)
+        if channel is None:
+            return
+        channel.task.cancel()
         self.active_connections.remove(websocket)
 
+    def _evict(self, channel: ClientChannel):
+        self.evicted += 1
+        websocket = channel.websocket
+        self.disconnect(websocket)
+        asyncio.create_task(self._close_quietly(websocket))
+
+    @staticmethod
+    async def _close_quietly(websocket: WebSocket):
+        try:
+            # 1013 Try Again Later 前端会在断开后自动重连
+            await websocket.close(code=1013)
+        except Exception:
+            pass
+
+    def publish(self, message: dict):
+        # 没有客户端时直接丢弃 与逐个发送时的行为一致
+        if not self._channels:
+            return
+        with self._lock:
+            if message.get("type") in self.COALESCE_TYPES:
+                if message["type"] in self._latest:
+                    self.coalesced += 1
+                self._latest[message["type"]] = message
+            else:
+                self._outbox.append(message)
+
+    def _drain(self) -> list:
+        # 连续的日志合并成一个logs帧 其他消息保持原有顺序
+        with self._lock:
+            messages, self._outbox = list(self._outbox), deque(maxlen=self.max_outbox)
+            latest, self._latest = list(self._latest.values()), {}
+        frames, logs = [], []
+        for message in messages:
+            if message.get("type") == "log":
+                logs.append(message)
+                if len(logs) < self.max_batch:
+                    continue
+            if logs:
+                frames.append({"type": "logs", "entries": logs})
+                logs = []
+            if message.get("type") != "log":
+                frames.append(message)
+        if logs:
+            frames.append({"type": "logs", "entries": logs})
+        return frames + latest
+
+    async def _tick_loop(self):
+        while self._channels:
+            await asyncio.sleep(self.tick)
+            frames = self._drain()
+            if not frames:
+                continue
+            texts = [json.dumps(frame) for frame in frames]
+            self.frames += len(texts)
+            for channel in list(self._channels.values()):
+                for text in texts:
+                    if not channel.offer(text):
+                        self._evict(channel)
+                        break
+
     async def broadcast(self, message: dict):
-        # 使用json.dumps确保数据格式正确
-        for connection in self.active_connections:
-            await connection.send_text(json.dumps(message))
+        self.publish(message)
 
     async def broadcast_log(self, message: str, level: str = "INFO"):
-        log_entry = {
-            "type": "log",
-            "timestamp": time.strftime("%H:%M:%S"),
-            "level": level,
-            "message": message
-        }
-        await self.broadcast(log_entry)
+        self.log(message, level)
+
+    def log(self, message: str, level: str = "INFO"):
+        # 先写入环形缓冲取得seq 没有客户端时也会保留 供之后连接的客户端补发
+        with self._lock:
+            record = self.log_ring.append(level, message)
+            if self._channels:
+                self._outbox.append({"type": "log", **record})
 
     async def broadcast_fps(self, fps: float):
         fps_data = {"type": "fps", "value": f"{fps:.1f}"}
-        await self.broadcast(fps_data)
+        self.publish(fps_data)
+
+    def stats(self) -> dict:
+        return {
+            "clients": len(self._channels),
+            "queued": [len(channel.queue) for channel in self._channels.values()],
+            "frames": self.frames,
+            "coalesced": self.coalesced,
+            "evicted": self.evicted,
+            "logs": self.log_ring.stats(),
+        }
 
 manager = WebSocketManager()
 
 @router.websocket("/ws/logs")
-async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+async def websocket_endpoint(websocket: WebSocket, since: Optional[int] = None):
+    await manager.connect(websocket, since)
     try:
         while True:
             # 保持连接开放，等待断开
             await websocket.receive_text()
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
\ No newline at end of file
+        pass
+    finally:
+        manager.disconnect(websocket)
@@ -0,0 +1,91 @@
+import asyncio
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from .rate_limit import AsyncTokenBucket
+
+# 检查结果 healthy可以取得游戏Token invalid为接口明确拒绝(Stoken失效) error为网络等临时错误
+HEALTHY, INVALID, ERROR = "healthy", "invalid", "error"
+
+
+class AccountHealthChecker:
+    # 批量检查账户Stoken是否有效 通过getGameToken接口逐个验证
+    # 同时进行的请求数不超过concurrency 发起请求的速率不超过rate个每秒
+    # 每个账户的结果带检查时间缓存在results中 一次只运行一个批量任务
+    def __init__(self, api, concurrency: int = 16, rate: float = 50.0, burst: int = 10):
+        self.api = api
+        self.concurrency = concurrency
+        self.limiter = AsyncTokenBucket(rate, burst)
+        self.results: Dict[str, dict] = {}
+        self.total = 0
+        self.done = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, accounts: Iterable[Tuple[str, object]]) -> bool:
+        # 在后台启动批量检查 已有任务在运行时返回False
+        if self.running:
+            return False
+        accounts = list(accounts)
+        self.total, self.done = len(accounts), 0
+        self._task = asyncio.create_task(self.check_all(accounts))
+        return True
+
+    async def check_one(self, name: str, account) -> dict:
+        await self.limiter.acquire()
+        start = time.perf_counter()
+        token, error, retcode = await self.api.request_game_token(account)
+        if token:
+            status = HEALTHY
+        else:
+            status = ERROR if retcode is None else INVALID
+        result = {
+            "uid": account.uid,
+            "status": status,
+            "message": error,
+            "checked_at": time.time(),
+            "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+        }
+        self.results[name] = result
+        return result
+
+    async def check_all(self, accounts) -> Dict[str, dict]:
+        self.total, self.done = len(accounts), 0
+        self.started_at, self.finished_at = time.time(), None
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def worker(name, account):
+            async with semaphore:
+                try:
+                    await self.check_one(name, account)
+                except Exception as e:
+                    self.results[name] = {
+                        "uid": account.uid, "status": ERROR, "message": str(e),
+                        "checked_at": time.time(), "latency_ms": None,
+                    }
+                self.done += 1
+
+        await asyncio.gather(*(worker(name, account) for name, account in accounts))
+        self.finished_at = time.time()
+        return {name: self.results[name] for name, _ in accounts}
+
+    def forget(self, name: str):
+        self.results.pop(name, None)
+
+    def report(self) -> dict:
+        counts = {HEALTHY: 0, INVALID: 0, ERROR: 0}
+        for result in self.results.values():
+            counts[result["status"]] += 1
+        return {
+            "running": self.running,
+            "progress": {"done": self.done, "total": self.total},
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "summary": counts,
+            "accounts": self.results,
+        }
@@ -0,0 +1,130 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import MutableMapping
+from typing import Any, Callable, Iterator, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    name TEXT PRIMARY KEY,
+    uid TEXT NOT NULL,
+    cookie TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS accounts_uid ON accounts(uid);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class AccountStore(MutableMapping):
+    # 基于SQLite的账户存储 按账户名主键和UID索引 用法与原来的 名称 -> 账户 字典一致
+    # 每次增删改都是一条独立事务(WAL模式) 只写入变化的那一行 进程崩溃也不会留下半个文件
+    # 不在启动时整体加载 读取时按需查询
+    # factory(uid, cookie) 构造返回给调用方的账户对象 fields(account) 反过来取出 (uid, cookie)
+    # 后端使用Account模型 PySide版使用 {"uid", "stoken"} 字典
+    def __init__(
+        self,
+        path: str,
+        factory: Callable[[str, str], Any],
+        fields: Callable[[Any], Tuple[str, str]],
+    ):
+        self.path = path
+        self.factory = factory
+        self.fields = fields
+        self._lock = threading.Lock()
+        # 后端的接口和扫描任务可能在不同线程中访问 连接本身由锁保护
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def migrate_json(self, json_path: str, uid_key: str = "uid", cookie_key: str = "cookie") -> int:
+        # 从旧版整文件JSON导入 同一个文件只导入一次 已存在的同名账户不覆盖
+        # 原文件保留不动 返回导入的账户数
+        if not os.path.exists(json_path):
+            return 0
+        marker = f"migrated:{os.path.abspath(json_path)}"
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM meta WHERE key = ?", (marker,)).fetchone():
+                return 0
+            try:
+                with open(json_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (json.JSONDecodeError, IOError):
+                return 0
+            rows = [
+                (name, str(item[uid_key]), item[cookie_key], time.time())
+                for name, item in data.items()
+                if isinstance(item, dict) and uid_key in item and cookie_key in item
+            ]
+            with self._conn:
+                self._conn.execute("BEGIN")
+                before = self._count()
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO accounts (name, uid, cookie, updated) VALUES (?, ?, ?, ?)", rows
+                )
+                self._conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (marker, str(time.time())))
+                return self._count() - before
+
+    def _count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM accounts").fetchone()[0]
+
+    def __getitem__(self, name: str):
+        with self._lock:
+            row = self._conn.execute("SELECT uid, cookie FROM accounts WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            raise KeyError(name)
+        return self.factory(*row)
+
+    def __setitem__(self, name: str, account):
+        uid, cookie = self.fields(account)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO accounts (name, uid, cookie, updated) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET uid = excluded.uid, cookie = excluded.cookie, updated = excluded.updated",
+                (name, str(uid), cookie, time.time()),
+            )
+
+    def __delitem__(self, name: str):
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM accounts WHERE name = ?", (name,)).rowcount
+        if not deleted:
+            raise KeyError(name)
+
+    def __contains__(self, name) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM accounts WHERE name = ?", (name,)).fetchone() is not None
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            names = [row[0] for row in self._conn.execute("SELECT name FROM accounts ORDER BY rowid")]
+        return iter(names)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count()
+
+    def items(self):
+        # 一次查询取回全部账户 避免逐个名字查询
+        with self._lock:
+            rows = self._conn.execute("SELECT name, uid, cookie FROM accounts ORDER BY rowid").fetchall()
+        return [(name, self.factory(uid, cookie)) for name, uid, cookie in rows]
+
+    def find_by_uid(self, uid: str) -> Optional[Tuple[str, Any]]:
+        # 走uid索引 返回 (账户名, 账户) 没有则返回None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT name, uid, cookie FROM accounts WHERE uid = ? ORDER BY rowid LIMIT 1", (str(uid),)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], self.factory(row[1], row[2])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
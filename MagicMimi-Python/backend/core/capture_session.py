@@ -0,0 +1,231 @@
+import ctypes
+from ctypes import wintypes
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    user32 = ctypes.windll.user32
+    gdi32 = ctypes.windll.gdi32
+except AttributeError:
+    # 非Windows平台 只能使用回放帧源或替身后端
+    user32 = gdi32 = None
+
+SRCCOPY = 0x00CC0020
+DIB_RGB_COLORS = 0
+BI_RGB = 0
+PW_RENDERFULLCONTENT = 3
+SM_CXSCREEN, SM_CYSCREEN = 0, 1
+
+
+class BITMAPINFOHEADER(ctypes.Structure):
+    _fields_ = [
+        ("biSize", wintypes.DWORD), ("biWidth", wintypes.LONG), ("biHeight", wintypes.LONG),
+        ("biPlanes", wintypes.WORD), ("biBitCount", wintypes.WORD), ("biCompression", wintypes.DWORD),
+        ("biSizeImage", wintypes.DWORD), ("biXPelsPerMeter", wintypes.LONG), ("biYPelsPerMeter", wintypes.LONG),
+        ("biClrUsed", wintypes.DWORD), ("biClrImportant", wintypes.DWORD),
+    ]
+
+
+class BITMAPINFO(ctypes.Structure):
+    _fields_ = [("bmiHeader", BITMAPINFOHEADER), ("bmiColors", wintypes.DWORD * 3)]
+
+
+if user32 is not None:
+    HANDLE = ctypes.c_void_p
+    user32.GetWindowDC.argtypes = [HANDLE]
+    user32.GetWindowDC.restype = HANDLE
+    user32.ReleaseDC.argtypes = [HANDLE, HANDLE]
+    user32.PrintWindow.argtypes = [HANDLE, HANDLE, wintypes.UINT]
+    user32.IsWindow.argtypes = [HANDLE]
+    user32.GetClientRect.argtypes = [HANDLE, ctypes.POINTER(wintypes.RECT)]
+    user32.GetDesktopWindow.restype = HANDLE
+    gdi32.CreateCompatibleDC.argtypes = [HANDLE]
+    gdi32.CreateCompatibleDC.restype = HANDLE
+    gdi32.CreateDIBSection.argtypes = [HANDLE, ctypes.POINTER(BITMAPINFO), wintypes.UINT,
+                                       ctypes.POINTER(ctypes.c_void_p), HANDLE, wintypes.DWORD]
+    gdi32.CreateDIBSection.restype = HANDLE
+    gdi32.SelectObject.argtypes = [HANDLE, HANDLE]
+    gdi32.SelectObject.restype = HANDLE
+    gdi32.BitBlt.argtypes = [HANDLE, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                             HANDLE, ctypes.c_int, ctypes.c_int, wintypes.DWORD]
+    gdi32.DeleteObject.argtypes = [HANDLE]
+    gdi32.DeleteDC.argtypes = [HANDLE]
+
+
+class FrameSlot:
+    # 环形缓冲中的一格 array是可直接交给解码的BGRA视图
+    def __init__(self, array: np.ndarray, handle=None):
+        self.array = array
+        self.handle = handle
+
+
+class CaptureBackend:
+    # 截图后端接口 CaptureSession通过它分配缓冲并把画面写入缓冲
+    def is_alive(self) -> bool:
+        return True
+
+    def size(self) -> Optional[Tuple[int, int]]:
+        raise NotImplementedError
+
+    def allocate(self, width: int, height: int, count: int) -> List[FrameSlot]:
+        raise NotImplementedError
+
+    def grab(self, slot: FrameSlot) -> bool:
+        raise NotImplementedError
+
+    def release_slots(self, slots: Sequence[FrameSlot]):
+        pass
+
+    def release(self):
+        pass
+
+
+class GdiCaptureBackend(CaptureBackend):
+    # 使用DIB Section作为环形缓冲 GDI直接把画面写进numpy可见的内存 不再经过GetBitmapBits拷贝
+    # region为空时截取窗口客户区 否则从窗口DC的指定区域BitBlt(桌面中心模式)
+    def __init__(self, hwnd: int, print_window: bool = True, region: Optional[Tuple[int, int, int, int]] = None):
+        if user32 is None:
+            raise RuntimeError("GDI截图仅在Windows上可用")
+        self.hwnd = hwnd
+        self.print_window = print_window and region is None
+        self.region = region
+        self._window_dc = None
+        self._mem_dc = None
+
+    def is_alive(self) -> bool:
+        return bool(user32.IsWindow(self.hwnd))
+
+    def size(self):
+        if self.region:
+            return self.region[2], self.region[3]
+        rect = wintypes.RECT()
+        if not user32.GetClientRect(self.hwnd, ctypes.byref(rect)):
+            return None
+        return rect.right - rect.left, rect.bottom - rect.top
+
+    def allocate(self, width, height, count):
+        self._window_dc = user32.GetWindowDC(self.hwnd)
+        self._mem_dc = gdi32.CreateCompatibleDC(self._window_dc)
+        bmi = BITMAPINFO()
+        bmi.bmiHeader.biSize = ctypes.sizeof(BITMAPINFOHEADER)
+        bmi.bmiHeader.biWidth = width
+        bmi.bmiHeader.biHeight = -height  # 负值表示自上而下存储 与numpy行序一致
+        bmi.bmiHeader.biPlanes = 1
+        bmi.bmiHeader.biBitCount = 32
+        bmi.bmiHeader.biCompression = BI_RGB
+        slots = []
+        for _ in range(count):
+            bits = ctypes.c_void_p()
+            handle = gdi32.CreateDIBSection(self._window_dc, ctypes.byref(bmi), DIB_RGB_COLORS, ctypes.byref(bits), None, 0)
+            if not handle:
+                raise OSError("CreateDIBSection失败")
+            buffer = (ctypes.c_uint8 * (width * height * 4)).from_address(bits.value)
+            slots.append(FrameSlot(np.ctypeslib.as_array(buffer).reshape((height, width, 4)), handle))
+        return slots
+
+    def grab(self, slot):
+        gdi32.SelectObject(self._mem_dc, slot.handle)
+        height, width = slot.array.shape[:2]
+        if self.print_window:
+            ok = user32.PrintWindow(self.hwnd, self._mem_dc, PW_RENDERFULLCONTENT)
+        else:
+            x, y = self.region[:2] if self.region else (0, 0)
+            ok = gdi32.BitBlt(self._mem_dc, 0, 0, width, height, self._window_dc, x, y, SRCCOPY)
+        gdi32.GdiFlush()
+        return bool(ok)
+
+    def release_slots(self, slots: Sequence[FrameSlot]):
+        for slot in slots:
+            gdi32.DeleteObject(slot.handle)
+
+    def release(self):
+        if self._mem_dc:
+            gdi32.DeleteDC(self._mem_dc)
+            self._mem_dc = None
+        if self._window_dc:
+            user32.ReleaseDC(self.hwnd, self._window_dc)
+            self._window_dc = None
+
+
+def desktop_center_region(width: int, height: int) -> Tuple[int, int, int, int]:
+    screen_width = user32.GetSystemMetrics(SM_CXSCREEN)
+    screen_height = user32.GetSystemMetrics(SM_CYSCREEN)
+    return (screen_width - width) // 2, (screen_height - height) // 2, width, height
+
+
+class CountingCaptureBackend(CaptureBackend):
+    # 替身后端 不依赖Windows 用于统计每帧分配次数
+    # frames为回放的源图像 grab时原地拷贝进缓冲 模拟GDI写入
+    def __init__(self, width: int, height: int, frames: Optional[Sequence[np.ndarray]] = None):
+        self.width = width
+        self.height = height
+        self.frames = frames
+        self.allocations = 0
+        self.rebuilds = 0
+        self.grabs = 0
+
+    def resize(self, width: int, height: int):
+        self.width, self.height = width, height
+
+    def size(self):
+        return self.width, self.height
+
+    def allocate(self, width, height, count):
+        self.allocations += count
+        self.rebuilds += 1
+        return [FrameSlot(np.zeros((height, width, 4), dtype=np.uint8)) for _ in range(count)]
+
+    def grab(self, slot):
+        if self.frames:
+            np.copyto(slot.array, self.frames[self.grabs % len(self.frames)])
+        self.grabs += 1
+        return True
+
+    @property
+    def allocations_per_frame(self) -> float:
+        return self.allocations / self.grabs if self.grabs else 0.0
+
+
+class CaptureSession:
+    # 持有设备上下文和预分配的环形帧缓冲 只有窗口尺寸变化时才重建
+    # read()返回的数组直接指向环形缓冲 slots次读取之后会被覆盖 需要保留的调用方应自行拷贝
+    def __init__(self, backend: CaptureBackend, slots: int = 4):
+        self.backend = backend
+        self.slot_count = slots
+        self._slots: List[FrameSlot] = []
+        self._size = None
+        self._index = 0
+
+    def is_alive(self) -> bool:
+        return self.backend.is_alive()
+
+    def _rebuild(self, size):
+        self._release_slots()
+        width, height = size
+        self._slots = self.backend.allocate(width, height, self.slot_count)
+        self._size = size
+        self._index = 0
+
+    def _release_slots(self):
+        # 先释放DC 位图不再被选入后才能删除
+        self.backend.release()
+        if self._slots:
+            self.backend.release_slots(self._slots)
+        self._slots = []
+
+    def read(self) -> Optional[np.ndarray]:
+        size = self.backend.size()
+        if not size or size[0] <= 0 or size[1] <= 0:
+            return None
+        if size != self._size:
+            self._rebuild(size)
+        slot = self._slots[self._index]
+        self._index = (self._index + 1) % self.slot_count
+        if not self.backend.grab(slot):
+            return None
+        return slot.array
+
+    def close(self):
+        self._release_slots()
+        self._size = None
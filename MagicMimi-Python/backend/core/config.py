@@ -1,8 +1,13 @@
 from pydantic import BaseModel, Field
+from typing import List, Optional
 import json
 import os
 
+from .account_store import AccountStore
+
 SETTINGS_FILE = "api_settings.json"
+ACCOUNTS_DB = "mihoyo_accounts.db"
+# 旧版整文件JSON存储 首次启动时导入ACCOUNTS_DB
 ACCOUNTS_FILE = "mihoyo_accounts.json"
 
 class Account(BaseModel):
@@ -13,6 +18,17 @@ class ScanSettings(BaseModel):
     account_name: str
     hwnd: int
     game_type: int
+    # 可选的回放帧源 如 dir:frames/ video:rec.mp4 synthetic:1920x1080 设置后忽略hwnd
+    source: Optional[str] = None
+    # 同时扫描的其他窗口句柄 与hwnd共享同一扫描引擎
+    hwnds: List[int] = []
+    # 所有窗口合计的截图帧率上限 按窗口数平分 不填则由各窗口的调度器决定
+    max_fps: Optional[float] = None
+    # 解码阶梯 由粗到细依次尝试 如 ["half", "full", "contrast"] 不填则使用默认阶梯
+    decode_steps: Optional[List[str]] = None
+    # 解码前先用定位图案初筛 没有候选区域的帧不解码
+    # 漏检率目前只在合成画面上测过 默认关闭 用bench_scan.py --prefilter-check在录制画面上确认后再开启
+    prefilter: bool = False
 
 class ApiSettings(BaseModel):
     app_version: str = Field(default="2.70.1", description="米游社App版本号")
@@ -22,10 +38,10 @@ class ApiSettings(BaseModel):
 
 class AppState:
     def __init__(self):
+        # 由扫描监督器在会话状态变化时维护 会话的完整状态见ScanSupervisor
         self.is_scanning: bool = False
-        # 不再需要scanner_thread和stop_event
         self.api_settings: ApiSettings = self.load_api_settings()
-        self.accounts: dict[str, Account] = self.load_accounts()
+        self.accounts: AccountStore = self.load_accounts()
 
     def load_api_settings(self) -> ApiSettings:
         if os.path.exists(SETTINGS_FILE):
@@ -42,22 +58,15 @@ class AppState:
         with open(SETTINGS_FILE, 'w', encoding='utf-8') as f:
             json.dump(self.api_settings.model_dump(), f, indent=4) # 使用新版pydantic的model_dump
     
-    def load_accounts(self) -> dict[str, Account]:
-        if os.path.exists(ACCOUNTS_FILE):
-            try:
-                with open(ACCOUNTS_FILE, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    # 将字典转换为Account模型
-                    return {name: Account(**acc_data) for name, acc_data in data.items()}
-            except (json.JSONDecodeError, TypeError):
-                return {}
-        return {}
-
-    def save_accounts(self):
-        # 将Account模型转换回字典进行存储
-        data_to_save = {name: acc.model_dump() for name, acc in self.accounts.items()}
-        with open(ACCOUNTS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data_to_save, f, indent=4, ensure_ascii=False)
+    def load_accounts(self) -> AccountStore:
+        # 账户按需从SQLite读取 不再整体加载到内存
+        store = AccountStore(
+            ACCOUNTS_DB,
+            factory=lambda uid, cookie: Account(uid=uid, cookie=cookie),
+            fields=lambda acc: (acc.uid, acc.cookie),
+        )
+        store.migrate_json(ACCOUNTS_FILE)
+        return store
 
 # 创建一个全局单例
 app_state = AppState()
\ No newline at end of file
@@ -0,0 +1,122 @@
+import asyncio
+import time
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from .http_pool import DEFAULT_PORTS, AsyncHttpPool
+
+
+class ConnectionWarmer:
+    # 扫描会话开始时预热登录链路用到的主机 解析DNS 建立TLS连接并放入连接池
+    # 之后每隔heartbeat_interval秒发送HEAD请求保活 抢码时不再付出DNS和TLS握手的耗时
+    # acquire(url) 为每次保活请求发出前等待的协程函数 用于向全局预算取得许可
+    # 状态 idle -> warming -> ready / degraded(部分主机未连通) -> stopped
+    def __init__(
+        self,
+        pool: AsyncHttpPool,
+        urls: List[str],
+        connections: int = 2,
+        heartbeat_interval: float = 20.0,
+        retry_interval: float = 5.0,
+        acquire: Optional[Callable] = None,
+    ):
+        self.pool = pool
+        # 多个域名映射到同一替身服务时只预热一次
+        self.urls = list(dict.fromkeys(urls))
+        self.connections = connections
+        self.heartbeat_interval = heartbeat_interval
+        self.retry_interval = retry_interval
+        self.acquire = acquire
+        self.state = "idle"
+        self.heartbeats = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.hosts: Dict[str, dict] = {url: {"resolve_ms": None, "connect_ms": None, "warm": 0} for url in self.urls}
+        self._task: Optional[asyncio.Task] = None
+        self._ready: Optional[asyncio.Event] = None
+
+    def start(self):
+        # 需要在事件循环中调用 重复调用不会创建第二个预热任务
+        if self._task and not self._task.done():
+            return self._task
+        self._ready = asyncio.Event()
+        self.state = "warming"
+        self._task = asyncio.create_task(self._run())
+        return self._task
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        self.state = "stopped"
+        # 唤醒仍在等待首轮预热的调用方
+        if self._ready is not None:
+            self._ready.set()
+
+    async def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        # 等待首轮预热结束 无论是否全部成功 返回是否所有主机都已连通
+        if self._ready is None:
+            return False
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return self.state == "ready"
+
+    @property
+    def warm_connections(self) -> int:
+        return sum(self.pool.idle_count(url) for url in self.urls)
+
+    async def _warm(self, url: str):
+        parts = urlsplit(url)
+        host, port = parts.hostname, parts.port or DEFAULT_PORTS[parts.scheme]
+        info = self.hosts[url]
+        try:
+            start = time.perf_counter()
+            await self.pool.resolve(host, port)
+            info["resolve_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            start = time.perf_counter()
+            info["warm"] = await self.pool.prewarm(url, self.connections)
+            info["connect_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        except Exception as e:
+            self.failures += 1
+            self.last_error = f"{host} {e}"
+            info["warm"] = self.pool.idle_count(url)
+
+    async def _heartbeat(self, url: str):
+        info = self.hosts[url]
+        before = (lambda: self.acquire(url)) if self.acquire else None
+        info["warm"] = await self.pool.ping(url, before)
+        self.heartbeats += 1
+        # 服务端关闭或心跳失败的连接补齐到目标数量
+        if info["warm"] < self.connections:
+            await self._warm(url)
+
+    def _update_state(self):
+        self.state = "ready" if all(info["warm"] > 0 for info in self.hosts.values()) else "degraded"
+        self._ready.set()
+
+    async def _run(self):
+        await asyncio.gather(*(self._warm(url) for url in self.urls))
+        self._update_state()
+        while True:
+            # 未全部连通时缩短间隔重试
+            await asyncio.sleep(self.heartbeat_interval if self.state == "ready" else self.retry_interval)
+            results = await asyncio.gather(*(self._heartbeat(url) for url in self.urls), return_exceptions=True)
+            # 单个主机的心跳异常不终止保活任务 记录后下一轮重试
+            for url, result in zip(self.urls, results):
+                if isinstance(result, Exception):
+                    self.failures += 1
+                    self.last_error = f"{urlsplit(url).hostname} {result}"
+            self._update_state()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "ready": self.state == "ready",
+            "warm_connections": self.warm_connections,
+            "heartbeats": self.heartbeats,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "hosts": self.hosts,
+        }
@@ -0,0 +1,150 @@
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+import cv2
+import numpy as np
+
+from .metrics import metrics
+from .qr_decoders import DecodedQr, QrDecoder
+
+# 解码阶梯各级的耗时 含图像预处理
+decode_step_seconds = metrics.histogram("magicmimi_decode_step_seconds", "解码阶梯各级耗时(含预处理)", "step")
+
+
+class LadderStep(NamedTuple):
+    name: str
+    # 输入灰度图 返回交给解码后端的图像
+    prepare: Callable[[np.ndarray], np.ndarray]
+    # prepare输出相对输入的缩放比例 识别结果的坐标按它换算回原图
+    scale: float = 1.0
+
+
+def _downscale(gray):
+    return cv2.resize(gray, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA)
+
+
+# 各解码线程各自的CLAHE对象 只创建一次 apply使用对象内部的缓冲区 不能在线程间共用
+_local = threading.local()
+
+
+def _contrast(gray):
+    # 局部直方图均衡 拉开半透明遮罩或暗色背景下二维码的对比度
+    clahe = getattr(_local, "clahe", None)
+    if clahe is None:
+        clahe = _local.clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    return clahe.apply(gray)
+
+
+def _threshold(gray):
+    return cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 31, 5)
+
+
+def _sharpen(gray):
+    # 反锐化掩模 应对缩放或运动造成的模糊
+    return cv2.addWeighted(gray, 1.5, cv2.GaussianBlur(gray, (0, 0), 2), -0.5, 0)
+
+
+LADDER_STEPS: Dict[str, LadderStep] = {
+    step.name: step
+    for step in (
+        LadderStep("half", _downscale, 0.5),
+        LadderStep("full", lambda gray: gray),
+        LadderStep("contrast", _contrast),
+        LadderStep("threshold", _threshold),
+        LadderStep("sharpen", _sharpen),
+    )
+}
+
+# 默认阶梯 先用半分辨率 未识别再用原图 最后依次做对比度均衡和锐化
+DEFAULT_STEPS = ("half", "full", "contrast", "sharpen")
+
+
+def parse_steps(spec) -> tuple:
+    # 接受 "half,full,contrast" 或名称列表 为空时使用默认阶梯
+    if not spec:
+        return DEFAULT_STEPS
+    names = [name.strip() for name in spec.split(",")] if isinstance(spec, str) else list(spec)
+    unknown = [name for name in names if name not in LADDER_STEPS]
+    if unknown:
+        raise ValueError(f"未知的解码步骤 {', '.join(unknown)} 可选 {', '.join(LADDER_STEPS)}")
+    return tuple(names)
+
+
+def _rescale(code: DecodedQr, scale: float) -> DecodedQr:
+    x, y, w, h = code.rect
+    return DecodedQr(code.data, (round(x / scale), round(y / scale), round(w / scale), round(h / scale)))
+
+
+class DecodeLadder(QrDecoder):
+    # 由粗到细的解码 依次尝试各级 某一级识别到二维码即返回 只有未识别时才升级到更贵的一级
+    # 缩小后短边不足min_side像素时跳过缩放步骤(如ROI裁剪后的小图) 直接用原图
+    # 每一级的尝试次数 命中次数 耗时都有记录 用于在真实游戏画面上调整阶梯
+    # 与其他解码后端接口一致 可被多个解码线程同时调用
+    def __init__(self, decoder: QrDecoder, steps: Optional[Sequence[str]] = None, min_side: int = 240):
+        self.decoder = decoder
+        self.name = f"{decoder.name}-ladder"
+        self.steps = [LADDER_STEPS[name] for name in parse_steps(steps)]
+        self.min_side = min_side
+        self.frames = 0
+        self.misses = 0
+        self.attempts = Counter()
+        self.hits = Counter()
+        self.skipped = Counter()
+        self._lock = threading.Lock()
+
+    def decode(self, gray) -> List[DecodedQr]:
+        short_side = min(gray.shape[:2])
+        attempted, hit = [], None
+        codes = []
+        for step in self.steps:
+            if step.scale < 1 and short_side * step.scale < self.min_side:
+                attempted.append((step.name, None))
+                continue
+            start = time.perf_counter()
+            codes = self.decoder.decode(step.prepare(gray))
+            decode_step_seconds.labels(step.name).observe(time.perf_counter() - start)
+            attempted.append((step.name, True))
+            if codes:
+                hit = step
+                break
+        with self._lock:
+            self.frames += 1
+            for name, ran in attempted:
+                if ran:
+                    self.attempts[name] += 1
+                else:
+                    self.skipped[name] += 1
+            if hit is None:
+                self.misses += 1
+            else:
+                self.hits[hit.name] += 1
+        if hit is not None and hit.scale != 1.0:
+            codes = [_rescale(code, hit.scale) for code in codes]
+        return codes
+
+    def stats(self) -> dict:
+        # hit_rate为该级尝试中识别成功的比例 share为所有识别成功的帧中由该级给出的比例
+        with self._lock:
+            total_hits = sum(self.hits.values())
+            steps = []
+            for step in self.steps:
+                attempts, hits = self.attempts[step.name], self.hits[step.name]
+                timing = decode_step_seconds.labels(step.name).summary()
+                steps.append({
+                    "step": step.name,
+                    "attempts": attempts,
+                    "hits": hits,
+                    "skipped": self.skipped[step.name],
+                    "hit_rate": round(hits / attempts, 4) if attempts else None,
+                    "share": round(hits / total_hits, 4) if total_hits else None,
+                    "mean_ms": timing["mean_ms"],
+                    "p95_ms": timing["p95_ms"],
+                })
+            return {
+                "decoder": self.decoder.name,
+                "frames": self.frames,
+                "misses": self.misses,
+                "steps": steps,
+            }
@@ -0,0 +1,57 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict
+
+# 按用途划分的线程池 阻塞调用不再共用默认线程池 某一类任务积压不会拖住其他类
+# io 窗口枚举 打开截图源 停止扫描引擎等阻塞IO
+# cpu 二维码编码 解码后端校准等计算 线程数约为CPU核数的一半 为截图/解码线程留出余量
+# wait 等待扫描引擎识别结果的阻塞队列读取 每个扫描会话长期占用一个线程
+EXECUTOR_SIZES = {
+    "io": 4,
+    "cpu": max(2, (os.cpu_count() or 2) // 2),
+    "wait": 2,
+}
+
+_executors: Dict[str, ThreadPoolExecutor] = {}
+_pending: Dict[str, int] = {name: 0 for name in EXECUTOR_SIZES}
+_lock = threading.Lock()
+
+
+def get_executor(name: str) -> ThreadPoolExecutor:
+    executor = _executors.get(name)
+    if executor is None:
+        with _lock:
+            executor = _executors.get(name)
+            if executor is None:
+                executor = ThreadPoolExecutor(EXECUTOR_SIZES[name], thread_name_prefix=f"mimi-{name}")
+                _executors[name] = executor
+    return executor
+
+
+async def run_in(name: str, fn, *args, **kwargs):
+    # 在指定线程池中执行阻塞函数 当前协程等待结果 事件循环继续处理其他请求
+    executor = get_executor(name)
+    with _lock:
+        _pending[name] += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, partial(fn, *args, **kwargs))
+    finally:
+        with _lock:
+            _pending[name] -= 1
+
+
+def executor_stats() -> dict:
+    # pending为已提交但尚未完成的调用数 超过size说明该类任务在排队
+    with _lock:
+        return {name: {"size": size, "pending": _pending[name]} for name, size in EXECUTOR_SIZES.items()}
+
+
+def shutdown_executors():
+    with _lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,64 @@
+from typing import Optional
+
+import numpy as np
+
+
+class FrameChangeGate:
+    # 比较降采样后的分块指纹 画面没有变化时跳过灰度转换和解码
+    # 指纹只与上一次真正解码的帧比较 缓慢的渐变也会累积到阈值
+    # force_every 帧内至少解码一次 防止漏掉阈值以下的细微变化
+    def __init__(self, target_width: int = 160, block: int = 8, threshold: int = 6, force_every: int = 30):
+        self.target_width = target_width
+        self.block = block
+        self.threshold = threshold
+        self.force_every = force_every
+        self._reference: Optional[np.ndarray] = None
+        self._since_decode = 0
+        self.frames = 0
+        self.skipped = 0
+        self.forced = 0
+
+    def fingerprint(self, frame: np.ndarray) -> np.ndarray:
+        # 按步长取样 不做插值 只取一个通道(BGR(A)中的G)近似亮度
+        step = max(1, frame.shape[1] // self.target_width)
+        sample = frame[::step, ::step]
+        if sample.ndim == 3:
+            sample = sample[:, :, 1] if sample.shape[2] > 1 else sample[:, :, 0]
+        b = self.block
+        h, w = (sample.shape[0] // b) * b, (sample.shape[1] // b) * b
+        if h == 0 or w == 0:
+            return sample.astype(np.int16)
+        blocks = sample[:h, :w].reshape(h // b, b, w // b, b)
+        return blocks.mean(axis=(1, 3), dtype=np.float32).astype(np.int16)
+
+    def should_decode(self, frame: np.ndarray) -> bool:
+        self.frames += 1
+        fp = self.fingerprint(frame)
+        ref = self._reference
+        changed = ref is None or ref.shape != fp.shape or int(np.abs(fp - ref).max()) > self.threshold
+        if not changed and self.force_every and self._since_decode + 1 >= self.force_every:
+            self.forced += 1
+            changed = True
+        if changed:
+            self._reference = fp
+            self._since_decode = 0
+            return True
+        self._since_decode += 1
+        self.skipped += 1
+        return False
+
+    def reset(self):
+        self._reference = None
+        self._since_decode = 0
+
+    @property
+    def skip_rate(self) -> float:
+        return self.skipped / self.frames if self.frames else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "frames": self.frames,
+            "skipped": self.skipped,
+            "forced": self.forced,
+            "skip_rate": round(self.skip_rate, 4),
+        }
@@ -0,0 +1,245 @@
+import ctypes
+import os
+import time
+from typing import Callable, Optional, Sequence, Union
+
+import cv2
+import numpy as np
+
+from .capture_session import CaptureSession, CountingCaptureBackend, GdiCaptureBackend, desktop_center_region, user32
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+
+def to_gray(frame: np.ndarray) -> np.ndarray:
+    # 帧源可能返回灰度/BGR/BGRA 统一转成灰度供解码使用
+    if frame.ndim == 2:
+        return frame
+    if frame.shape[2] == 4:
+        return cv2.cvtColor(frame, cv2.COLOR_BGRA2GRAY)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+
+class FrameRateLimiter:
+    # 按固定帧率节流 fps为空则不限制
+    def __init__(self, fps: Optional[float] = None):
+        self.interval = 1.0 / fps if fps else 0.0
+        self._next_time = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = time.perf_counter()
+        if now < self._next_time:
+            time.sleep(self._next_time - now)
+        else:
+            self._next_time = now
+        self._next_time += self.interval
+
+
+class FrameSource:
+    # 帧源接口 扫描循环只通过它获取画面
+    # read() 返回 numpy 图像(灰度/BGR/BGRA) 暂时取不到帧时返回None
+    name = "base"
+
+    def read(self) -> Optional[np.ndarray]:
+        raise NotImplementedError
+
+    def is_alive(self) -> bool:
+        return True
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CaptureFrameSource(FrameSource):
+    # 基于CaptureSession的实时截图帧源 DC与帧缓冲在整个会话内复用
+    name = "capture"
+
+    def __init__(self, session: CaptureSession):
+        self.session = session
+
+    def is_alive(self) -> bool:
+        return self.session.is_alive()
+
+    def read(self):
+        # 只把截图调用本身的失败(如窗口在截图途中被销毁)当作丢帧 其他异常是程序错误 照常抛出
+        try:
+            return self.session.read()
+        except (OSError, ctypes.ArgumentError):
+            return None
+
+    def close(self):
+        self.session.close()
+
+
+class WindowFrameSource(CaptureFrameSource):
+    # 截取指定窗口的客户区 返回BGRA图像
+    name = "window"
+
+    def __init__(self, hwnd: int, print_window: bool = True, slots: int = 4):
+        self.hwnd = hwnd
+        super().__init__(CaptureSession(GdiCaptureBackend(hwnd, print_window=print_window), slots=slots))
+
+
+class DesktopRegionFrameSource(CaptureFrameSource):
+    # 截取桌面中心固定大小的区域
+    name = "desktop"
+
+    def __init__(self, width: int = 300, height: int = 300, slots: int = 4):
+        backend = GdiCaptureBackend(user32.GetDesktopWindow(), region=desktop_center_region(width, height))
+        super().__init__(CaptureSession(backend, slots=slots))
+
+
+class ImageDirFrameSource(FrameSource):
+    # 回放目录下的图片 按文件名排序 用于无窗口环境下的回归与基准测试
+    name = "dir"
+
+    def __init__(self, path: str, fps: Optional[float] = None, loop: bool = True, preload: bool = False):
+        self.files = sorted(
+            os.path.join(path, f) for f in os.listdir(path)
+            if f.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        if not self.files:
+            raise ValueError(f"目录中没有可回放的图片 {path}")
+        self.loop = loop
+        self.limiter = FrameRateLimiter(fps)
+        self._index = 0
+        # 预加载可以把PNG解码开销排除在测量之外
+        self._cache = [cv2.imread(f, cv2.IMREAD_UNCHANGED) for f in self.files] if preload else None
+
+    def is_alive(self) -> bool:
+        return self.loop or self._index < len(self.files)
+
+    def read(self):
+        if not self.is_alive():
+            return None
+        self.limiter.wait()
+        i = self._index % len(self.files)
+        self._index += 1
+        if self._cache is not None:
+            return self._cache[i]
+        return cv2.imread(self.files[i], cv2.IMREAD_UNCHANGED)
+
+
+class VideoFrameSource(FrameSource):
+    # 回放视频文件 fps为空时按解码速度尽快输出
+    name = "video"
+
+    def __init__(self, path: str, fps: Optional[float] = None, loop: bool = True):
+        self.capture = cv2.VideoCapture(path)
+        if not self.capture.isOpened():
+            raise ValueError(f"无法打开视频文件 {path}")
+        self.loop = loop
+        self.limiter = FrameRateLimiter(fps)
+        self._ended = False
+
+    def is_alive(self) -> bool:
+        return not self._ended
+
+    def read(self):
+        if self._ended:
+            return None
+        self.limiter.wait()
+        ok, frame = self.capture.read()
+        if not ok and self.loop:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self.capture.read()
+        if not ok:
+            self._ended = True
+            return None
+        return frame
+
+    def close(self):
+        self.capture.release()
+
+
+class SyntheticFrameSource(FrameSource):
+    # 回放内存中生成的帧 frames可以是帧列表 也可以是 index -> frame 的函数
+    name = "synthetic"
+
+    def __init__(
+        self,
+        frames: Union[Sequence[np.ndarray], Callable[[int], np.ndarray]],
+        fps: Optional[float] = None,
+        count: Optional[int] = None,
+    ):
+        self.frames = frames
+        self.count = count
+        self.limiter = FrameRateLimiter(fps)
+        self._index = 0
+
+    def is_alive(self) -> bool:
+        return self.count is None or self._index < self.count
+
+    def read(self):
+        if not self.is_alive():
+            return None
+        self.limiter.wait()
+        i = self._index
+        self._index += 1
+        if callable(self.frames):
+            return self.frames(i)
+        return self.frames[i % len(self.frames)]
+
+
+def render_qr_matrix(data: str, border: int = 4) -> np.ndarray:
+    # 生成二维码模块矩阵 True为黑色模块
+    import qrcode
+    qr = qrcode.QRCode(border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return np.array(qr.get_matrix(), dtype=bool)
+
+
+def synthetic_qr_frame(
+    width: int,
+    height: int,
+    data: Optional[str] = None,
+    position: Optional[tuple] = None,
+    module_size: int = 4,
+    noise: int = 0,
+    seed: int = 0,
+) -> np.ndarray:
+    # 生成一张BGR测试帧 可选在指定位置嵌入二维码
+    rng = np.random.default_rng(seed)
+    frame = np.full((height, width, 3), 90, dtype=np.uint8)
+    if noise:
+        frame = np.clip(frame.astype(np.int16) + rng.integers(-noise, noise + 1, frame.shape), 0, 255).astype(np.uint8)
+    if data:
+        modules = render_qr_matrix(data)
+        qr_img = np.where(np.kron(modules, np.ones((module_size, module_size), dtype=bool)), 0, 255).astype(np.uint8)
+        size = qr_img.shape[0]
+        x, y = position if position else ((width - size) // 2, (height - size) // 2)
+        frame[y:y + size, x:x + size] = qr_img[:height - y, :width - x, None]
+    return frame
+
+
+def open_frame_source(spec: str, fps: Optional[float] = None) -> FrameSource:
+    # 根据描述字符串创建帧源
+    # hwnd:1234 / desktop / dir:路径 / video:路径 / synthetic:宽x高[:二维码内容] / standin:宽x高[:二维码内容]
+    kind, _, arg = spec.partition(":")
+    if kind == "hwnd" or spec.isdigit():
+        return WindowFrameSource(int(arg or spec))
+    if kind == "desktop":
+        return DesktopRegionFrameSource()
+    if kind == "dir":
+        return ImageDirFrameSource(arg, fps=fps, preload=True)
+    if kind == "video":
+        return VideoFrameSource(arg, fps=fps)
+    if kind in ("synthetic", "standin"):
+        size, _, data = arg.partition(":")
+        width, height = (int(v) for v in (size or "1280x720").lower().split("x"))
+        frame = synthetic_qr_frame(width, height, data or None)
+        if kind == "standin":
+            # 走完整的CaptureSession路径 但由替身后端代替GDI 用于统计分配次数
+            bgra = cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA)
+            return CaptureFrameSource(CaptureSession(CountingCaptureBackend(width, height, [bgra])))
+        return SyntheticFrameSource([frame], fps=fps)
+    raise ValueError(f"无法识别的帧源 {spec}")
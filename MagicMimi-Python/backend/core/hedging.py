@@ -0,0 +1,128 @@
+import asyncio
+from collections import Counter
+from typing import Callable, Dict, Optional
+
+from .metrics import Histogram
+
+# 结果由哪一份请求给出 primary为首个请求 hedge为对冲请求 failed为全部失败
+PRIMARY, HEDGE, FAILED = "primary", "hedge", "failed"
+
+
+class HedgePolicy:
+    # 对冲请求 首个请求在delay秒内没有返回时 在另一条连接上再发一份相同的请求 采用先成功返回的结果
+    # 其余请求随即取消 被取消的连接由连接池关闭 不会被复用
+    # delay为None时按该步骤最近的p95耗时自适应 只有约5%的请求会被对冲 样本不足时使用default_delay
+    # 首个请求很快失败(如连接被重置)时不等delay 立即补发 只要还在最多max_attempts份之内
+    def __init__(
+        self,
+        delay: Optional[float] = None,
+        default_delay: float = 0.2,
+        min_delay: float = 0.02,
+        max_attempts: int = 2,
+        min_samples: int = 20,
+    ):
+        self.delay = delay
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.max_attempts = max_attempts
+        self.min_samples = min_samples
+        self.outcomes: Dict[str, Counter] = {}
+        self.last_delay: Dict[str, float] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_attempts > 1
+
+    def delay_for(self, histogram: Optional[Histogram]) -> float:
+        if self.delay is not None:
+            return self.delay
+        if histogram is not None:
+            counts, count, _ = histogram.snapshot()
+            if count >= self.min_samples:
+                return max(histogram.quantile(0.95, counts, count), self.min_delay)
+        return self.default_delay
+
+    def _record(self, step: str, outcome: str, launched: int):
+        outcomes = self.outcomes.setdefault(step, Counter())
+        outcomes[outcome] += 1
+        outcomes["requests"] += 1
+        if launched > 1:
+            outcomes["hedged"] += 1
+
+    async def run(
+        self,
+        step: str,
+        request: Callable,
+        accept: Callable = lambda result: True,
+        timeout: Optional[float] = None,
+        histogram: Optional[Histogram] = None,
+    ):
+        # request() 每次调用发出一份独立的请求 返回协程
+        # accept(result) 判断结果能否直接采用 如业务错误码非0时先等待其余请求 全部结束仍无可采用的结果时返回最早的那个
+        # 超过timeout秒仍没有结果时抛出asyncio.TimeoutError
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout is not None else None
+        delay = self.delay_for(histogram)
+        self.last_delay[step] = delay
+        tasks: Dict[asyncio.Task, int] = {}
+        fallback: Optional[asyncio.Task] = None
+        launched = 0
+
+        def launch():
+            nonlocal launched
+            tasks[asyncio.ensure_future(request())] = launched
+            launched += 1
+
+        launch()
+        next_hedge = loop.time() + delay
+        try:
+            while True:
+                if not tasks:
+                    if launched < self.max_attempts and (deadline is None or loop.time() < deadline):
+                        # 已发出的请求都失败了 立即补发
+                        launch()
+                        next_hedge = loop.time() + delay
+                    else:
+                        self._record(step, FAILED, launched)
+                        return fallback.result()
+                now = loop.time()
+                if deadline is not None and now >= deadline:
+                    if fallback is not None:
+                        # 已有业务上失败的响应 比超时更有信息量
+                        self._record(step, FAILED, launched)
+                        return fallback.result()
+                    raise asyncio.TimeoutError(f"{step}超过{timeout:.2f}秒未返回")
+                wait = deadline - now if deadline is not None else None
+                if launched < self.max_attempts:
+                    until_hedge = max(next_hedge - now, 0.0)
+                    wait = until_hedge if wait is None else min(wait, until_hedge)
+                done, _ = await asyncio.wait(tasks, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if launched < self.max_attempts and loop.time() >= next_hedge:
+                        launch()
+                        next_hedge = loop.time() + delay
+                    continue
+                # 同时完成时优先采用先发出的请求
+                for task in sorted(done, key=tasks.get):
+                    index = tasks.pop(task)
+                    if task.exception() is None and accept(task.result()):
+                        self._record(step, PRIMARY if index == 0 else HEDGE, launched)
+                        return task.result()
+                    if fallback is None:
+                        fallback = task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            step: {
+                "requests": outcomes["requests"],
+                "hedged": outcomes["hedged"],
+                "primary_wins": outcomes[PRIMARY],
+                "hedge_wins": outcomes[HEDGE],
+                "failed": outcomes[FAILED],
+                "delay_ms": round(self.last_delay.get(step, 0.0) * 1000, 1),
+            }
+            for step, outcomes in self.outcomes.items()
+        }
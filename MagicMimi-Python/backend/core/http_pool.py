@@ -0,0 +1,292 @@
+import asyncio
+import json as jsonlib
+import socket
+import ssl
+import time
+import zlib
+from collections import deque
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+# 复用连接失败时允许自动重发的方法 scan/confirm等POST请求可能已被服务端处理 不能重放
+IDEMPOTENT_METHODS = frozenset(("GET", "HEAD", "PUT", "DELETE", "OPTIONS"))
+
+
+class HttpError(Exception):
+    pass
+
+
+class HttpResponse:
+    def __init__(self, status: int, reason: str, headers: Dict[str, str], body: bytes):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return jsonlib.loads(self.body.decode("utf-8"))
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise HttpError(f"{self.status} {self.reason}")
+
+
+class _Connection:
+    def __init__(self, key, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+        self.created = time.monotonic()
+        self.last_used = self.created
+        self.requests = 0
+
+    def is_usable(self, idle_timeout: float) -> bool:
+        if self.writer.is_closing() or self.reader.at_eof():
+            return False
+        return time.monotonic() - self.last_used < idle_timeout
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncHttpPool:
+    # 基于asyncio的HTTP/1.1客户端 每个主机维护一组keep-alive连接
+    # 同一主机的并发连接数受max_per_host限制 空闲连接在idle_timeout后丢弃
+    def __init__(
+        self,
+        max_per_host: int = 4,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 10.0,
+        idle_timeout: float = 55.0,
+        dns_ttl: float = 300.0,
+        ssl_context: Optional[ssl.SSLContext] = None,
+        default_headers: Optional[Dict[str, str]] = None,
+    ):
+        self.max_per_host = max_per_host
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.idle_timeout = idle_timeout
+        self.dns_ttl = dns_ttl
+        self.ssl_context = ssl_context or ssl.create_default_context()
+        self.default_headers = default_headers or {}
+        self._idle: Dict[Tuple, deque] = {}
+        self._slots: Dict[Tuple, asyncio.Semaphore] = {}
+        self._resolved: Dict[Tuple[str, int], Tuple[str, float]] = {}
+        self.opened = 0
+        self.reused = 0
+
+    @staticmethod
+    def _split(url: str):
+        parts = urlsplit(url)
+        scheme = parts.scheme or "https"
+        port = parts.port or DEFAULT_PORTS[scheme]
+        target = parts.path or "/"
+        if parts.query:
+            target += "?" + parts.query
+        return (scheme, parts.hostname, port), target
+
+    def _slot(self, key) -> asyncio.Semaphore:
+        # 信号量延迟创建 保证绑定到实际使用连接池的事件循环
+        if key not in self._slots:
+            self._slots[key] = asyncio.Semaphore(self.max_per_host)
+        return self._slots[key]
+
+    def _take_idle(self, key) -> Optional[_Connection]:
+        idle = self._idle.get(key)
+        while idle:
+            conn = idle.pop()
+            if conn.is_usable(self.idle_timeout):
+                return conn
+            conn.close()
+        return None
+
+    def _release(self, conn: _Connection):
+        conn.last_used = time.monotonic()
+        self._idle.setdefault(conn.key, deque()).append(conn)
+
+    async def resolve(self, host: str, port: int) -> str:
+        # DNS结果缓存dns_ttl秒 预热时解析一次 之后建连直接使用IP
+        cached = self._resolved.get((host, port))
+        if cached and time.monotonic() - cached[1] < self.dns_ttl:
+            return cached[0]
+        infos = await asyncio.wait_for(
+            asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM),
+            self.connect_timeout,
+        )
+        address = infos[0][4][0]
+        self._resolved[(host, port)] = (address, time.monotonic())
+        return address
+
+    async def _open(self, key) -> _Connection:
+        scheme, host, port = key
+        ssl_context = self.ssl_context if scheme == "https" else None
+        address = await self.resolve(host, port)
+        # 按IP建连 TLS仍以原域名做SNI和证书校验
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(address, port, ssl=ssl_context, server_hostname=host if ssl_context else None),
+            self.connect_timeout,
+        )
+        self.opened += 1
+        return _Connection(key, reader, writer)
+
+    async def _send(self, conn: _Connection, method: str, target: str, headers: Dict[str, str], body: bytes):
+        scheme, host, port = conn.key
+        host_header = host if port == DEFAULT_PORTS[scheme] else f"{host}:{port}"
+        lines = [f"{method} {target} HTTP/1.1", f"Host: {host_header}"]
+        merged = {"Accept-Encoding": "gzip", "Connection": "keep-alive", **self.default_headers, **headers}
+        if body or method in ("POST", "PUT", "PATCH"):
+            merged["Content-Length"] = str(len(body))
+        lines += [f"{k}: {v}" for k, v in merged.items()]
+        conn.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await conn.writer.drain()
+
+        head = await conn.reader.readuntil(b"\r\n\r\n")
+        status_line, *header_lines = head.decode("latin-1").split("\r\n")
+        _, status, *reason = status_line.split(" ", 2)
+        status = int(status)
+        resp_headers = {}
+        for line in header_lines:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                resp_headers[name.strip().lower()] = value.strip()
+
+        keep_alive = resp_headers.get("connection", "").lower() != "close"
+        if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+            data = b""
+        elif resp_headers.get("transfer-encoding", "").lower() == "chunked":
+            data = await self._read_chunked(conn.reader)
+        elif "content-length" in resp_headers:
+            data = await conn.reader.readexactly(int(resp_headers["content-length"]))
+        else:
+            data = await conn.reader.read()
+            keep_alive = False
+        if resp_headers.get("content-encoding") == "gzip":
+            data = zlib.decompress(data, 16 + zlib.MAX_WBITS)
+        conn.requests += 1
+        return HttpResponse(status, reason[0] if reason else "", resp_headers, data), keep_alive
+
+    @staticmethod
+    async def _read_chunked(reader: asyncio.StreamReader) -> bytes:
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b";")[0].strip(), 16)
+            if size == 0:
+                # 跳过trailer直到空行
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return b"".join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        json=None,
+        params: Optional[dict] = None,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+    ) -> HttpResponse:
+        key, target = self._split(url)
+        if params:
+            target += ("&" if "?" in target else "?") + urlencode(params)
+        headers = dict(headers or {})
+        body = b""
+        if json is not None:
+            body = jsonlib.dumps(json).encode("utf-8")
+            headers.setdefault("Content-Type", "application/json")
+
+        async with self._slot(key):
+            conn = self._take_idle(key)
+            reused = conn is not None
+            for attempt in range(2):
+                if conn is None:
+                    conn = await self._open(key)
+                try:
+                    response, keep_alive = await asyncio.wait_for(
+                        self._send(conn, method, target, headers, body), timeout or self.read_timeout
+                    )
+                except (ConnectionError, asyncio.IncompleteReadError) as e:
+                    conn.close()
+                    conn = None
+                    # 复用的空闲连接可能已被服务端关闭 幂等请求换一条新连接重试一次
+                    if reused and attempt == 0 and method in IDEMPOTENT_METHODS:
+                        reused = False
+                        continue
+                    raise HttpError(f"连接中断 {e}") from e
+                except BaseException:
+                    conn.close()
+                    raise
+                if reused:
+                    self.reused += 1
+                if keep_alive:
+                    self._release(conn)
+                else:
+                    conn.close()
+                return response
+
+    async def prewarm(self, url: str, count: int = 1) -> int:
+        # 提前建立到url所在主机的连接并放入空闲池 返回该主机当前的空闲连接数
+        key, _ = self._split(url)
+        count = min(count, self.max_per_host)
+        async with self._slot(key):
+            idle = self._idle.setdefault(key, deque())
+            while len(idle) < count:
+                self._release(await self._open(key))
+        return self.idle_count(url)
+
+    async def ping(self, url: str, before: Optional[Callable] = None) -> int:
+        # 对url所在主机的空闲连接逐条发送HEAD请求 使连接保持活跃 失效的连接直接丢弃
+        # 每次只取出一条 其余连接仍可被登录请求使用 任意状态码都说明连接可用
+        # before为每次发送前等待的协程函数 如向限速预算取得许可 等待期间连接仍留在池中
+        key, target = self._split(url)
+        idle = self._idle.get(key) or deque()
+        alive = 0
+        for conn in list(idle):
+            if before is not None and conn in idle:
+                await before()
+            if conn not in idle:
+                continue
+            idle.remove(conn)
+            if not conn.is_usable(self.idle_timeout):
+                conn.close()
+                continue
+            try:
+                _, keep_alive = await asyncio.wait_for(self._send(conn, "HEAD", target, {}, b""), self.read_timeout)
+            except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ValueError):
+                # OSError包括ssl.SSLError 心跳失败的连接直接丢弃
+                conn.close()
+                continue
+            except BaseException:
+                # 已从空闲池取出的连接不会再被归还 被取消时同样要关闭
+                conn.close()
+                raise
+            if keep_alive:
+                self._release(conn)
+                alive += 1
+            else:
+                conn.close()
+        return alive
+
+    def idle_count(self, url: str) -> int:
+        key, _ = self._split(url)
+        return sum(1 for conn in self._idle.get(key, ()) if conn.is_usable(self.idle_timeout))
+
+    async def get(self, url: str, **kwargs) -> HttpResponse:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> HttpResponse:
+        return await self.request("POST", url, **kwargs)
+
+    def stats(self) -> dict:
+        return {
+            "opened": self.opened,
+            "reused": self.reused,
+            "idle": {f"{k[0]}://{k[1]}:{k[2]}": len(v) for k, v in self._idle.items()},
+        }
+
+    async def close(self):
+        for idle in self._idle.values():
+            while idle:
+                idle.pop().close()
@@ -0,0 +1,134 @@
+import json
+import mmap
+import os
+import threading
+import time
+from collections import deque
+from typing import List, Optional
+
+
+class MmapSpill:
+    # 内存映射的定长环形文件 保存被挤出内存环的日志 文件大小固定为size字节
+    # 每条记录为一行JSON 写满后回到文件开头覆盖最旧的记录 索引只保存(seq, offset, length)
+    def __init__(self, path: str, size: int = 8 * 1024 * 1024):
+        self.path = path
+        self.size = size
+        self._file = open(path, "w+b")
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._index = deque()
+        self._pos = 0
+
+    def write(self, record: dict):
+        data = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        if len(data) > self.size:
+            return
+        start = self._pos
+        if start + len(data) > self.size:
+            # 尾部放不下时回绕 尾部剩余的记录是最旧的 一并作废
+            while self._index and self._index[0][1] >= start:
+                self._index.popleft()
+            start = 0
+        end = start + len(data)
+        while self._index and self._index[0][1] < end and self._index[0][1] + self._index[0][2] > start:
+            self._index.popleft()
+        self._map[start:end] = data
+        self._index.append((record["seq"], start, len(data)))
+        self._pos = end
+
+    def since(self, seq: int, limit: int) -> List[dict]:
+        records = []
+        for record_seq, offset, length in self._index:
+            if record_seq > seq:
+                records.append(json.loads(self._map[offset:offset + length]))
+                if len(records) >= limit:
+                    break
+        return records
+
+    @property
+    def first_seq(self) -> Optional[int]:
+        return self._index[0][0] if self._index else None
+
+    def __len__(self):
+        return len(self._index)
+
+    def close(self):
+        # 溢出文件只在本次运行中有意义 关闭时一并删除 重复调用无副作用
+        if self._map.closed:
+            return
+        self._map.close()
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class LogRing:
+    # 结构化日志环形缓冲 每条记录带递增的seq 新连接或重连的客户端按seq补发错过的日志
+    # 内存中最多保留capacity条 设置spill_path时被挤出的记录写入定长的内存映射文件 适合长时间运行
+    def __init__(self, capacity: int = 2000, spill_path: Optional[str] = None, spill_size: int = 8 * 1024 * 1024):
+        self.capacity = capacity
+        self._records = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._seq = 0
+        self.spill = MmapSpill(spill_path, spill_size) if spill_path else None
+
+    def append(self, level: str, message: str, **fields) -> dict:
+        with self._lock:
+            self._seq += 1
+            record = {
+                "seq": self._seq,
+                "time": time.time(),
+                "timestamp": time.strftime("%H:%M:%S"),
+                "level": level,
+                "message": message,
+                **fields,
+            }
+            if self.spill is not None and len(self._records) == self.capacity:
+                self.spill.write(self._records[0])
+            self._records.append(record)
+            return record
+
+    def since(self, seq: int, limit: int = 1000) -> List[dict]:
+        # 返回seq之后的记录 按seq升序 最多limit条 更早的已被淘汰的记录无法补发
+        with self._lock:
+            records = []
+            if self.spill is not None and self._records and seq + 1 < self._records[0]["seq"]:
+                records = self.spill.since(seq, limit)
+            for record in self._records:
+                if len(records) >= limit:
+                    break
+                if record["seq"] > seq:
+                    records.append(record)
+            return records
+
+    def tail(self, count: int) -> List[dict]:
+        with self._lock:
+            return list(self._records)[-count:] if count > 0 else []
+
+    def close(self):
+        # 服务关闭时调用 释放并删除溢出文件 之后的日志只保存在内存中
+        with self._lock:
+            if self.spill is not None:
+                self.spill.close()
+                self.spill = None
+
+    @property
+    def last_seq(self) -> int:
+        return self._seq
+
+    def stats(self) -> dict:
+        with self._lock:
+            first = self.spill.first_seq if self.spill is not None and len(self.spill) else None
+            if first is None and self._records:
+                first = self._records[0]["seq"]
+            return {
+                "last_seq": self._seq,
+                "first_seq": first,
+                "in_memory": len(self._records),
+                "spilled": len(self.spill) if self.spill is not None else 0,
+            }
+
+
+log_ring = LogRing(spill_path=os.environ.get("MAGICMIMI_LOG_SPILL"))
@@ -0,0 +1,161 @@
+import asyncio
+import json
+import time
+from typing import Callable, Dict, Optional
+
+# 二维码状态 Init未扫码 Scanned已扫码待确认 Confirmed已确认 Expired已过期 Failed为本地判定的失败
+INIT, SCANNED, CONFIRMED, EXPIRED, FAILED = "Init", "Scanned", "Confirmed", "Expired", "Failed"
+TERMINAL_STATES = (CONFIRMED, EXPIRED, FAILED)
+
+
+class LoginWatch:
+    # 单个二维码票据的轮询状态
+    def __init__(self, ticket: str, device: str):
+        self.ticket = ticket
+        self.device = device
+        self.stat = INIT
+        self.message = ""
+        self.new_account: Optional[dict] = None
+        self.started = time.time()
+        self.updated = self.started
+        self.polls = 0
+        self.errors = 0
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def done(self) -> bool:
+        return self.stat in TERMINAL_STATES
+
+    def to_dict(self) -> dict:
+        return {
+            "ticket": self.ticket,
+            "stat": self.stat,
+            "done": self.done,
+            "message": self.message,
+            "new_account": self.new_account,
+            "polls": self.polls,
+            "updated": self.updated,
+        }
+
+
+class LoginWatcher:
+    # 后端统一轮询二维码登录状态 每个票据只有一个轮询任务 无论有多少个页面在等待
+    # 状态变化时通过publish推送 {"type": "login_status", ...} 消息 页面不再各自轮询
+    # 轮询间隔自适应 未扫码时从min_interval逐步放宽到max_interval 已扫码后按scanned_interval密集查询
+    # 网络错误按max_interval退避 连续max_errors次失败或超过ttl秒仍未完成视为失败
+    # 结束的票据保留retention秒 供重连的页面查询最终结果
+    def __init__(
+        self,
+        api,
+        publish: Callable[[dict], None],
+        min_interval: float = 1.0,
+        max_interval: float = 3.0,
+        scanned_interval: float = 0.5,
+        backoff: float = 1.5,
+        max_errors: int = 5,
+        ttl: float = 300.0,
+        retention: float = 120.0,
+    ):
+        self.api = api
+        self.publish = publish
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.scanned_interval = scanned_interval
+        self.backoff = backoff
+        self.max_errors = max_errors
+        self.ttl = ttl
+        self.retention = retention
+        self.watches: Dict[str, LoginWatch] = {}
+        self.upstream_requests = 0
+
+    def watch(self, ticket: str, device: str) -> dict:
+        # 开始监视票据 已在监视时直接返回当前状态 不会重复创建轮询任务
+        self._prune()
+        watch = self.watches.get(ticket)
+        if watch is None:
+            watch = LoginWatch(ticket, device)
+            self.watches[ticket] = watch
+            watch.task = asyncio.create_task(self._run(watch))
+        return watch.to_dict()
+
+    def get(self, ticket: str) -> Optional[dict]:
+        watch = self.watches.get(ticket)
+        return watch.to_dict() if watch is not None else None
+
+    def cancel(self, ticket: str) -> bool:
+        # 页面关闭二维码时停止轮询 已结束的票据不受影响
+        watch = self.watches.get(ticket)
+        if watch is None or watch.done:
+            return False
+        watch.task.cancel()
+        self._transition(watch, FAILED, "已取消")
+        return True
+
+    def _prune(self):
+        now = time.time()
+        for ticket, watch in list(self.watches.items()):
+            if watch.done and now - watch.updated > self.retention:
+                del self.watches[ticket]
+
+    def _transition(self, watch: LoginWatch, stat: str, message: str = ""):
+        watch.stat = stat
+        watch.message = message
+        watch.updated = time.time()
+        self.publish({"type": "login_status", **watch.to_dict()})
+
+    async def _run(self, watch: LoginWatch):
+        interval = self.min_interval
+        deadline = time.monotonic() + self.ttl
+        try:
+            while time.monotonic() < deadline:
+                await asyncio.sleep(interval)
+                data, error = await self.api.query_qr_status(watch.ticket, watch.device)
+                watch.polls += 1
+                self.upstream_requests += 1
+                if error is None and data.get("retcode") != 0:
+                    error = data.get("message", f"查询状态返回错误 {data.get('retcode')}")
+                if error:
+                    watch.errors += 1
+                    if watch.errors >= self.max_errors:
+                        self._transition(watch, FAILED, f"查询状态失败 {error}")
+                        return
+                    interval = self.max_interval
+                    continue
+                watch.errors = 0
+                stat = (data.get("data") or {}).get("stat") or INIT
+                if stat == CONFIRMED:
+                    await self._confirm(watch, data["data"])
+                    return
+                if stat != watch.stat:
+                    self._transition(watch, stat)
+                    if watch.done:
+                        return
+                    interval = self.min_interval
+                else:
+                    interval = min(interval * self.backoff, self.max_interval)
+                if stat == SCANNED:
+                    interval = self.scanned_interval
+            self._transition(watch, EXPIRED, "等待超时")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._transition(watch, FAILED, f"监视登录状态出错 {e}")
+
+    async def _confirm(self, watch: LoginWatch, data: dict):
+        # 已确认 在后端用游戏Token换取Stoken 结果随Confirmed状态一起推送
+        try:
+            raw_payload = json.loads(data["payload"]["raw"])
+            uid, game_token = raw_payload["uid"], raw_payload["token"]
+        except Exception as e:
+            self._transition(watch, FAILED, f"处理扫码确认数据时出错 {e}")
+            return
+        cookie, stoken_error = await self.api.get_stoken_from_game_token(uid, game_token)
+        if stoken_error:
+            self._transition(watch, FAILED, f"获取Stoken失败 {stoken_error}")
+            return
+        watch.new_account = {"uid": str(uid), "cookie": cookie}
+        self._transition(watch, CONFIRMED)
+
+    def stats(self) -> dict:
+        active = sum(1 for watch in self.watches.values() if not watch.done)
+        return {"active": active, "tracked": len(self.watches), "upstream_requests": self.upstream_requests}
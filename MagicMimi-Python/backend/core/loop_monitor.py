@@ -0,0 +1,116 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Callable, Optional
+
+from .metrics import metrics
+
+# 事件循环延迟 心跳协程实际醒来的时间比预定时间晚了多少
+loop_lag_seconds = metrics.histogram("magicmimi_loop_lag_seconds", "事件循环调度延迟", "loop")
+
+
+class LoopLagMonitor:
+    # 心跳协程每interval秒醒来一次 实际醒来时间与预定时间之差即为事件循环的调度延迟 记入直方图
+    # 另有一个看门狗线程 心跳超过threshold秒未更新时 抓取事件循环线程当时的调用栈 用于定位阻塞点
+    # 卡顿结束后以 {duration_ms, stack} 记入最近卡顿列表 并调用on_stall回调(在看门狗线程中调用)
+    def __init__(
+        self,
+        interval: float = 0.05,
+        threshold: float = 0.1,
+        name: str = "main",
+        on_stall: Optional[Callable[[dict], None]] = None,
+        keep: int = 20,
+    ):
+        self.interval = interval
+        self.threshold = threshold
+        self.histogram = loop_lag_seconds.labels(name)
+        self.on_stall = on_stall
+        self.stalls = deque(maxlen=keep)
+        self.stall_count = 0
+        self.max_lag = 0.0
+        self._beat = time.perf_counter()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        # 在要监视的事件循环中调用
+        if self._task is not None and not self._task.done():
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.perf_counter()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _heartbeat(self):
+        while True:
+            # 从上一次心跳算起 心跳协程自身未能及时开始睡眠的时间也计入延迟
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            lag = max(now - self._beat - self.interval, 0.0)
+            self._beat = now
+            self.histogram.observe(lag)
+            if lag > self.max_lag:
+                self.max_lag = lag
+
+    def _watch(self):
+        stall_start, stack = None, None
+        while not self._stopped.wait(self.interval):
+            beat = self._beat
+            silent = time.perf_counter() - beat - self.interval
+            if silent > self.threshold:
+                if stall_start is None:
+                    # 卡顿进行中 此时事件循环线程的调用栈就是阻塞它的代码
+                    stall_start = beat
+                    stack = self._loop_stack()
+            elif stall_start is not None:
+                self._record(beat - stall_start - self.interval, stack)
+                stall_start, stack = None, None
+
+    def _loop_stack(self) -> list:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return []
+        return [f"{entry.filename}:{entry.lineno} {entry.name}" for entry in traceback.extract_stack(frame)[-8:]]
+
+    def _record(self, duration: float, stack: list):
+        stall = {"time": time.time(), "duration_ms": round(duration * 1000, 1), "stack": stack}
+        self.stall_count += 1
+        self.stalls.append(stall)
+        if self.on_stall is not None:
+            try:
+                self.on_stall(stall)
+            except Exception:
+                pass
+
+    def stats(self) -> dict:
+        # 分位数按桶插值估计 不超过实测的最大延迟
+        lag = self.histogram.summary()
+        max_lag_ms = round(self.max_lag * 1000, 3)
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if lag[key] is not None:
+                lag[key] = min(lag[key], max_lag_ms)
+        return {
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "lag": lag,
+            "max_lag_ms": max_lag_ms,
+            "stall_count": self.stall_count,
+            "recent_stalls": list(self.stalls),
+        }
+
+
+# 后端主事件循环的监视器 服务启动时开始
+loop_monitor = LoopLagMonitor()
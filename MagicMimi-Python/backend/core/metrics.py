@@ -0,0 +1,140 @@
+import bisect
+import threading
+import time
+from typing import Dict, Optional, Sequence
+
+# 默认桶边界(秒) 覆盖0.1ms到10s 足够区分截图/解码与网络请求
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+class Histogram:
+    # 固定桶直方图 observe只做一次二分查找和几次加法 可以常开
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+
+    def time(self):
+        return _Timer(self)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.count, self.sum
+
+    def quantile(self, q: float, counts=None, count=None) -> Optional[float]:
+        # 在桶内线性插值估计分位数 落在最后一个桶时返回最大边界
+        if counts is None:
+            counts, count, _ = self.snapshot()
+        if not count:
+            return None
+        rank = q * count
+        seen = 0
+        for i, bucket_count in enumerate(counts):
+            if seen + bucket_count >= rank and bucket_count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+    def summary(self) -> dict:
+        counts, count, total = self.snapshot()
+        to_ms = lambda v: round(v * 1000, 3) if v is not None else None
+        return {
+            "count": count,
+            "mean_ms": to_ms(total / count) if count else None,
+            "p50_ms": to_ms(self.quantile(0.5, counts, count)),
+            "p95_ms": to_ms(self.quantile(0.95, counts, count)),
+            "p99_ms": to_ms(self.quantile(0.99, counts, count)),
+        }
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class HistogramFamily:
+    # 同一指标名下按一个标签区分的一组直方图 如 stage=capture/decode
+    def __init__(self, name: str, help_text: str, label: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        self.children: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, value: str) -> Histogram:
+        child = self.children.get(value)
+        if child is None:
+            with self._lock:
+                child = self.children.setdefault(value, Histogram(self.buckets))
+        return child
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for value, child in sorted(self.children.items()):
+            counts, count, total = child.snapshot()
+            label = f'{self.label}="{value}"'
+            cumulative = 0
+            for bound, bucket_count in zip(child.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound:g}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{label}}} {total:.9g}")
+            lines.append(f"{self.name}_count{{{label}}} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.families: Dict[str, HistogramFamily] = {}
+
+    def histogram(self, name: str, help_text: str, label: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> HistogramFamily:
+        if name not in self.families:
+            self.families[name] = HistogramFamily(name, help_text, label, buckets)
+        return self.families[name]
+
+    def render_prometheus(self) -> str:
+        lines = []
+        for family in self.families.values():
+            lines += family.render()
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> dict:
+        return {
+            name: {value: child.summary() for value, child in sorted(family.children.items())}
+            for name, family in self.families.items()
+        }
+
+
+metrics = MetricsRegistry()
+
+# 扫描各阶段 capture截图 gate变化检测 convert灰度转换 decode解码
+scan_stage_seconds = metrics.histogram("magicmimi_scan_stage_seconds", "扫描各阶段耗时", "stage")
+# 登录各步骤 scan/game_token/confirm为三次HTTP请求 total为识别到登录完成的总耗时
+login_step_seconds = metrics.histogram("magicmimi_login_step_seconds", "登录各步骤耗时", "step")
+# 对冲请求中单份请求的网络耗时 从取得限速令牌开始计时 对冲延迟取它的p95
+hedge_attempt_seconds = metrics.histogram("magicmimi_hedge_attempt_seconds", "对冲请求单次尝试的网络耗时", "step")
@@ -1,22 +1,79 @@
-import requests
+import asyncio
 import uuid
 import json
 import hashlib
 import time
 import numpy as np
-import qrcode
-import io
-import base64
-from .config import app_state
+from .connection_warmer import ConnectionWarmer
+from .executors import run_in
+from .hedging import HedgePolicy
+from .http_pool import AsyncHttpPool
+from .metrics import hedge_attempt_seconds, login_step_seconds
+from .qr_render import render_qr
+from .request_budget import BULK, LOGIN, POLL, TOKEN, request_budget
+from .token_cache import GameTokenCache
+
+# 抢码关键路径上的主机 扫描会话开始时预热
+LOGIN_HOSTS = ("api-sdk.mihoyo.com", "api-takumi.mihoyo.com")
+
+def retcode_ok(data):
+    return data.get("retcode") == 0
+
+# 登录链路各步骤的耗时直方图 含排队和对冲 反映用户实际等待的时间
+SCAN_SECONDS = login_step_seconds.labels("scan")
+GAME_TOKEN_SECONDS = login_step_seconds.labels("game_token")
+CONFIRM_SECONDS = login_step_seconds.labels("confirm")
+LOGIN_SECONDS = login_step_seconds.labels("total")
+# 对冲请求每份请求的网络耗时 不含等待限速令牌的时间 对冲延迟按它自适应
+SCAN_ATTEMPT_SECONDS = hedge_attempt_seconds.labels("scan")
+GAME_TOKEN_ATTEMPT_SECONDS = hedge_attempt_seconds.labels("game_token")
+CONFIRM_ATTEMPT_SECONDS = hedge_attempt_seconds.labels("confirm")
 
 class MihoyoAPI:
-    def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({'User-Agent': 'okhttp/4.8.0'})
-        self.session.trust_env = False # 禁用系统代理
+    # 所有米哈游接口均为协程 底层复用按主机划分的keep-alive连接池
+    # 登录链路的scan/getGameToken/confirm使用对冲请求 见HedgePolicy hedge=None时使用默认策略
+    # 每一步最多等待step_timeout秒 且不超过二维码的剩余有效期
+    # 所有请求先向全局预算RequestBudget取得许可 抢码走login通道 后台流量不会挤占它 budget=None时使用进程内共用的预算
+    def __init__(self, hosts=None, settings=None, connect_timeout=5.0, read_timeout=10.0, max_per_host=4, ssl_context=None, hedge=None, step_timeout=3.0, budget=None):
+        self.http = AsyncHttpPool(
+            max_per_host=max_per_host,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            ssl_context=ssl_context,
+            default_headers={'User-Agent': 'okhttp/4.8.0'},
+        )
+        # 可将域名映射到本地替身服务 如 {"api-sdk.mihoyo.com": "http://127.0.0.1:8000"}
+        self.hosts = hosts or {}
+        self._settings = settings
+        self.token_cache = GameTokenCache(self.fetch_game_token)
+        self.hedge = hedge or HedgePolicy()
+        self.step_timeout = step_timeout
+        self.budget = budget or request_budget
+        # 保活的HEAD请求同样计入对应主机的预算 走bulk通道
+        warm_hosts = {self._url(host, "/"): host for host in LOGIN_HOSTS}
+        self.warmer = ConnectionWarmer(
+            self.http, list(warm_hosts),
+            acquire=lambda url: self.budget.acquire(warm_hosts[url], BULK),
+        )
+
+    @property
+    def settings(self):
+        # 未显式传入时使用后端全局配置 PySide版只用到登录接口 不依赖后端配置
+        if self._settings is not None:
+            return self._settings
+        from .config import app_state
+        return app_state.api_settings
+
+    def _url(self, host, path):
+        return self.hosts.get(host, f"https://{host}") + path
+
+    async def close(self):
+        self.warmer.stop()
+        self.token_cache.untrack()
+        await self.http.close()
 
     def _get_ds(self, salt_type="app", query="", body=""):
-        settings = app_state.api_settings
+        settings = self.settings
         salt_map = {"web": settings.salt_web, "app": settings.salt_app}
         salt = salt_map.get(salt_type)
         t = str(int(time.time()))
@@ -27,10 +84,10 @@ class MihoyoAPI:
         c = hashlib.md5(hash_string.encode()).hexdigest()
         return f"{t},{r},{c}"
 
-    def fetch_qr_code(self):
-        settings = app_state.api_settings
+    async def fetch_qr_ticket(self):
+        # 只向上游申请二维码票据 不生成图片 返回 {"ticket", "device", "url"}
+        settings = self.settings
         device_id = str(uuid.uuid4()).upper()
-        url = "https://hk4e-sdk.mihoyo.com/hk4e_cn/combo/panda/qrcode/fetch"
         payload = {"app_id": settings.qr_login_app_id, "device": device_id}
         headers = {
             'x-rpc-device_id': device_id,
@@ -39,51 +96,37 @@ class MihoyoAPI:
             'DS': self._get_ds(body=payload)
         }
         try:
-            res = self.session.post(url, json=payload, headers=headers, timeout=10)
-            res.raise_for_status()
-            data = res.json()
+            data = await self._post_json("hk4e-sdk.mihoyo.com", "/hk4e_cn/combo/panda/qrcode/fetch", POLL, json=payload, headers=headers)
             if data.get("retcode") == 0 and "data" in data:
                 qr_data = data["data"]
                 if all(k in qr_data for k in ['url', 'ticket']):
-                    img = qrcode.make(qr_data['url'])
-                    # 将图片保存到内存中的字节流
-                    buffered = io.BytesIO()
-                    img.save(buffered, format="PNG")
-                    # 将字节流编码为Base64字符串
-                    img_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
-                    
-                    # 构造返回给前端的数据
-                    response_data = {
-                        "ticket": qr_data["ticket"],
-                        "device": device_id,
-                        # 前端直接使用此图片数据
-                        "qr_image": f"data:image/png;base64,{img_base64}"
-                    }
-                    return response_data, None
+                    return {"ticket": qr_data["ticket"], "device": device_id, "url": qr_data["url"]}, None
             return None, data.get("message", f"API返回数据异常 {data}")
         except Exception as e:
             return None, f"网络请求失败 {e}"
 
-    def query_qr_status(self, ticket, device_id):
-        settings = app_state.api_settings
-        url = "https://hk4e-sdk.mihoyo.com/hk4e_cn/combo/panda/qrcode/query"
+    async def fetch_qr_code(self):
+        ticket_data, error = await self.fetch_qr_ticket()
+        if error:
+            return None, error
+        # 二维码编码在线程中进行 不阻塞事件循环 前端直接使用qr_image作为图片
+        rendered = await run_in("cpu", render_qr, ticket_data["url"])
+        return {"ticket": ticket_data["ticket"], "device": ticket_data["device"], **rendered}, None
+
+    async def query_qr_status(self, ticket, device_id):
+        settings = self.settings
         payload = {"app_id": settings.qr_login_app_id, "device": device_id, "ticket": ticket}
         headers = {'x-rpc-device_id': device_id, 'x-rpc-app_version': settings.app_version, 'x-rpc-client_type': '2', 'DS': self._get_ds(body=payload)}
         try:
-            res = self.session.post(url, json=payload, headers=headers, timeout=10)
-            res.raise_for_status()
-            data = res.json()
+            data = await self._post_json("hk4e-sdk.mihoyo.com", "/hk4e_cn/combo/panda/qrcode/query", POLL, json=payload, headers=headers)
             return data, None
         except Exception as e:
             return None, f"网络请求失败 {e}"
-            
-    def get_stoken_from_game_token(self, uid, game_token):
-        url = "https://passport-api.mihoyo.com/account/ma-cn-session/app/getTokenByGameToken"
+
+    async def get_stoken_from_game_token(self, uid, game_token):
         payload = {"account_id": int(uid), "game_token": game_token}
         try:
-            res = self.session.post(url, json=payload, timeout=10)
-            res.raise_for_status()
-            data = res.json()
+            data = await self._post_json("passport-api.mihoyo.com", "/account/ma-cn-session/app/getTokenByGameToken", TOKEN, json=payload)
             if data.get("retcode") == 0:
                 token_info = data.get("data", {})
                 stoken = token_info.get("token", {}).get("token")
@@ -96,36 +139,109 @@ class MihoyoAPI:
         except Exception as e:
             return None, str(e)
 
-    def attempt_game_login(self, ticket, game_type, account):
+    async def fetch_game_token(self, account, timeout=None, lane=TOKEN):
+        # 登录链路和Token预取使用对冲请求
+        game_token, error, _ = await self.request_game_token(account, hedged=True, timeout=timeout, lane=lane)
+        return game_token, error
+
+    async def _request_json(self, method, host, path, lane, attempt_histogram=None, **kwargs):
+        # 对米哈游接口的请求都经过这里 先按host和通道向全局预算取得许可
+        # attempt_histogram记录取得许可之后的网络耗时 供对冲请求计算延迟
+        await self.budget.acquire(host, lane)
+        start = time.perf_counter()
+        res = await self.http.request(method, self._url(host, path), **kwargs)
+        if attempt_histogram is not None:
+            attempt_histogram.observe(time.perf_counter() - start)
+        res.raise_for_status()
+        return res.json()
+
+    async def _get_json(self, host, path, lane, attempt_histogram=None, **kwargs):
+        return await self._request_json("GET", host, path, lane, attempt_histogram, **kwargs)
+
+    async def _post_json(self, host, path, lane, attempt_histogram=None, **kwargs):
+        return await self._request_json("POST", host, path, lane, attempt_histogram, **kwargs)
+
+    async def request_game_token(self, account, hedged=False, timeout=None, lane=BULK):
+        # 返回 (game_token, error, retcode) 网络异常时retcode为None 便于区分Stoken失效和临时故障
+        # 未指定通道的单次请求(如批量检查)走bulk通道
+        # 只有对冲请求计入单次尝试耗时 批量检查的请求不影响对冲延迟
+        attempts = GAME_TOKEN_ATTEMPT_SECONDS if hedged else None
+        send = lambda: self._get_json("api-takumi.mihoyo.com", "/auth/api/getGameToken", lane, attempts, headers={'cookie': account.cookie})
+        try:
+            with GAME_TOKEN_SECONDS.time():
+                if hedged:
+                    gt_data = await self.hedge.run("game_token", send, accept=retcode_ok, timeout=timeout, histogram=GAME_TOKEN_ATTEMPT_SECONDS)
+                else:
+                    gt_data = await asyncio.wait_for(send(), timeout)
+            retcode = gt_data.get("retcode")
+            if retcode != 0:
+                return None, f"获取GameToken失败 {gt_data.get('message', 'Stoken可能失效')}", retcode
+            return gt_data["data"]["game_token"], None, 0
+        except asyncio.TimeoutError:
+            return None, "获取GameToken超时", None
+        except Exception as e:
+            return None, f"获取GameToken失败 {e}", None
+
+    async def attempt_game_login(self, ticket, game_type, account, expires_at=None):
+        success, message, _ = await self.request_game_login(ticket, game_type, account, expires_at)
+        return success, message
+
+    async def request_game_login(self, ticket, game_type, account, expires_at=None):
+        # 返回 (success, message, retryable) 超时和网络异常时retryable为True 票据可以稍后重新提交
+        # 接口以retcode拒绝或二维码已过期时retryable为False
+        # expires_at为二维码过期时间(Unix秒) 已知时每一步的等待时间都不超过二维码的剩余有效期
+        with LOGIN_SECONDS.time():
+            return await self._attempt_game_login(ticket, game_type, account, expires_at)
+
+    def _step_timeout(self, expires_at):
+        if expires_at is None:
+            return self.step_timeout
+        return min(self.step_timeout, expires_at - time.time())
+
+    async def _attempt_game_login(self, ticket, game_type, account, expires_at=None):
         device = str(uuid.uuid1())
         host = "api-sdk.mihoyo.com"
-        
+
         try:
-            # 扫描请求
+            # 扫描请求 对冲请求与首个请求使用相同的device 服务端看到的是同一次扫码
+            timeout = self._step_timeout(expires_at)
+            if timeout <= 0: return False, "二维码已过期", False
             scan_path = f"/hk4e_cn/combo/panda/qrcode/scan" if game_type == 4 else f"/hkrpg_cn/combo/panda/qrcode/scan"
             scan_payload = {"app_id": game_type, "device": device, "ticket": ticket}
-            res_scan = self.session.post(f"https://{host}{scan_path}", json=scan_payload)
-            res_scan.raise_for_status()
-            scan_data = res_scan.json()
-            if scan_data.get("retcode") != 0: return False, f"Scan失败 {scan_data.get('message', '未知')}"
-
-            # 获取游戏Token
-            res_gt = self.session.get("https://api-takumi.mihoyo.com/auth/api/getGameToken", headers={'cookie': account.cookie})
-            res_gt.raise_for_status()
-            gt_data = res_gt.json()
-            if gt_data.get("retcode") != 0: return False, f"获取GameToken失败 {gt_data.get('message', 'Stoken可能失效')}"
-            game_token = gt_data["data"]["game_token"]
+            with SCAN_SECONDS.time():
+                scan_data = await self.hedge.run(
+                    "scan", lambda: self._post_json(host, scan_path, LOGIN, SCAN_ATTEMPT_SECONDS, json=scan_payload),
+                    accept=retcode_ok, timeout=timeout, histogram=SCAN_ATTEMPT_SECONDS,
+                )
+            if scan_data.get("retcode") != 0: return False, f"Scan失败 {scan_data.get('message', '未知')}", False
+
+            # 优先使用扫描会话开始时预取的游戏Token 缓存未命中时才现取
+            game_token = self.token_cache.get(account)
+            if not game_token:
+                timeout = self._step_timeout(expires_at)
+                if timeout <= 0: return False, "二维码已过期", False
+                game_token, error, retcode = await self.request_game_token(account, hedged=True, timeout=timeout, lane=LOGIN)
+                # retcode为None说明是超时或网络异常 Stoken失效等接口拒绝不再重试
+                if error: return False, error, retcode is None
 
             # 确认登录
+            timeout = self._step_timeout(expires_at)
+            if timeout <= 0: return False, "二维码已过期", False
             confirm_path = f"/hk4e_cn/combo/panda/qrcode/confirm" if game_type == 4 else f"/hkrpg_cn/combo/panda/qrcode/confirm"
             confirm_payload = {
                 "app_id": game_type, "device": device, "ticket": ticket,
                 "payload": {"proto": "Account", "raw": json.dumps({"uid": account.uid, "token": game_token})}
             }
-            res_confirm = self.session.post(f"https://{host}{confirm_path}", json=confirm_payload)
-            res_confirm.raise_for_status()
-            confirm_data = res_confirm.json()
-            
-            return confirm_data.get("retcode") == 0, confirm_data.get("message", "登录确认成功")
+            with CONFIRM_SECONDS.time():
+                confirm_data = await self.hedge.run(
+                    "confirm", lambda: self._post_json(host, confirm_path, LOGIN, CONFIRM_ATTEMPT_SECONDS, json=confirm_payload),
+                    accept=retcode_ok, timeout=timeout, histogram=CONFIRM_ATTEMPT_SECONDS,
+                )
+            # token已用于确认 作废并在后台换新
+            self.token_cache.consume(account)
+
+            return confirm_data.get("retcode") == 0, confirm_data.get("message", "登录确认成功"), False
+        except asyncio.TimeoutError as e:
+            return False, f"请求超时 {e}", True
         except Exception as e:
-            return False, f"网络请求异常 {e}"
\ No newline at end of file
+            return False, f"网络请求异常 {e}", True
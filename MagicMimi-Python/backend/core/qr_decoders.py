@@ -0,0 +1,200 @@
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .frame_source import synthetic_qr_frame, to_gray
+
+
+class DecodedQr(NamedTuple):
+    # 与pyzbar的Decoded保持相同的data/rect字段 便于ROI跟踪与调用方复用
+    data: bytes
+    rect: Tuple[int, int, int, int]
+
+
+class QrDecoder:
+    # 解码后端接口 输入灰度图 返回识别到的二维码列表
+    name = "base"
+
+    def decode(self, gray: np.ndarray) -> List[DecodedQr]:
+        raise NotImplementedError
+
+
+class PyzbarDecoder(QrDecoder):
+    name = "pyzbar"
+
+    def __init__(self):
+        from pyzbar import pyzbar
+        self._pyzbar = pyzbar
+        self._symbols = [pyzbar.ZBarSymbol.QRCODE]
+
+    def decode(self, gray):
+        return [DecodedQr(code.data, tuple(code.rect)) for code in self._pyzbar.decode(gray, symbols=self._symbols)]
+
+
+def _points_to_rect(points) -> Tuple[int, int, int, int]:
+    x, y, w, h = cv2.boundingRect(np.asarray(points, dtype=np.float32).reshape(-1, 2))
+    return int(x), int(y), int(w), int(h)
+
+
+class OpenCvDecoder(QrDecoder):
+    # 解码器实例由所有解码线程共用 QRCodeDetector内部有状态 每个线程各自创建一个
+    name = "opencv"
+
+    def __init__(self):
+        self._local = threading.local()
+        self._local.detector = cv2.QRCodeDetector()
+
+    @property
+    def _detector(self):
+        detector = getattr(self._local, "detector", None)
+        if detector is None:
+            detector = self._local.detector = cv2.QRCodeDetector()
+        return detector
+
+    def decode(self, gray):
+        ok, texts, points, _ = self._detector.detectAndDecodeMulti(np.ascontiguousarray(gray))
+        if not ok or points is None:
+            return []
+        return [DecodedQr(text.encode("utf-8"), _points_to_rect(pts)) for text, pts in zip(texts, points) if text]
+
+
+class WeChatQrDecoder(QrDecoder):
+    # 需要opencv-contrib-python 未安装时跳过 检测器同样按线程创建
+    name = "wechat"
+
+    def __init__(self):
+        self._local = threading.local()
+        self._local.detector = cv2.wechat_qrcode_WeChatQRCode()
+
+    @property
+    def _detector(self):
+        detector = getattr(self._local, "detector", None)
+        if detector is None:
+            detector = self._local.detector = cv2.wechat_qrcode_WeChatQRCode()
+        return detector
+
+    def decode(self, gray):
+        texts, points = self._detector.detectAndDecode(np.ascontiguousarray(gray))
+        return [DecodedQr(text.encode("utf-8"), _points_to_rect(pts)) for text, pts in zip(texts, points) if text]
+
+
+class ZxingCppDecoder(QrDecoder):
+    # 需要zxing-cpp 未安装时跳过
+    name = "zxingcpp"
+
+    def __init__(self):
+        import zxingcpp
+        self._zxingcpp = zxingcpp
+        self._formats = zxingcpp.BarcodeFormat.QRCode
+
+    def decode(self, gray):
+        results = self._zxingcpp.read_barcodes(np.ascontiguousarray(gray), formats=self._formats)
+        decoded = []
+        for result in results:
+            pos = result.position
+            points = [(p.x, p.y) for p in (pos.top_left, pos.top_right, pos.bottom_right, pos.bottom_left)]
+            decoded.append(DecodedQr(result.text.encode("utf-8"), _points_to_rect(points)))
+        return decoded
+
+
+DECODER_TYPES = (PyzbarDecoder, OpenCvDecoder, WeChatQrDecoder, ZxingCppDecoder)
+
+
+def reference_corpus() -> List[Tuple[np.ndarray, Optional[str]]]:
+    # 校准用的参考样本 (灰度帧, 期望内容) 期望为None表示不应识别出任何二维码
+    payload = "https://user.mihoyo.com/qr_code_in_game.html?app_id=4&ticket=0123456789abcdef0123456789abcdef"
+    corpus = []
+    for i, (width, height, module, position, noise) in enumerate([
+        (1280, 720, 4, None, 0),
+        (1280, 720, 3, (900, 400), 12),
+        (1920, 1080, 5, (200, 150), 8),
+    ]):
+        frame = synthetic_qr_frame(width, height, payload, position=position, module_size=module, noise=noise, seed=i)
+        corpus.append((to_gray(frame), payload))
+    corpus.append((to_gray(synthetic_qr_frame(1280, 720, noise=12)), None))
+    return corpus
+
+
+class DecoderRegistry:
+    # 管理所有可用的解码后端 启动时用参考样本校准 选出本机上最快且结果正确的后端
+    def __init__(self):
+        self.decoders: Dict[str, QrDecoder] = {}
+        self.unavailable: Dict[str, str] = {}
+        self.results: Dict[str, dict] = {}
+        self.active: Optional[QrDecoder] = None
+        self.calibrated_at: Optional[float] = None
+        self._lock = threading.Lock()
+        for decoder_type in DECODER_TYPES:
+            self.register(decoder_type)
+
+    def register(self, decoder_type):
+        try:
+            self.decoders[decoder_type.name] = decoder_type()
+        except Exception as e:
+            self.unavailable[decoder_type.name] = str(e)
+
+    def _measure(self, decoder: QrDecoder, corpus, rounds: int) -> dict:
+        timings = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for gray, expected in corpus:
+                texts = [code.data.decode("utf-8", "ignore") for code in decoder.decode(gray)]
+                if texts != ([expected] if expected else []):
+                    return {"ok": False, "error": f"参考样本识别结果不符 {texts}"}
+            timings.append((time.perf_counter() - start) / len(corpus))
+        return {"ok": True, "latency_ms": round(sorted(timings)[len(timings) // 2] * 1000, 3)}
+
+    def calibrate(self, corpus=None, rounds: int = 3) -> Optional[QrDecoder]:
+        with self._lock:
+            return self._calibrate(corpus, rounds)
+
+    def _calibrate(self, corpus, rounds: int) -> Optional[QrDecoder]:
+        # 持锁调用
+        corpus = corpus or reference_corpus()
+        results = {}
+        for name, decoder in self.decoders.items():
+            try:
+                results[name] = self._measure(decoder, corpus, rounds)
+            except Exception as e:
+                results[name] = {"ok": False, "error": str(e)}
+        passed = [name for name, r in results.items() if r["ok"]]
+        self.results = results
+        self.calibrated_at = time.time()
+        if passed:
+            self.active = self.decoders[min(passed, key=lambda n: results[n]["latency_ms"])]
+        else:
+            # 没有后端通过校准时仍然保留一个可用后端 避免扫描完全不可用
+            self.active = next(iter(self.decoders.values()), None)
+        return self.active
+
+    def get(self) -> QrDecoder:
+        if self.active is None:
+            with self._lock:
+                # 启动时的校准可能正在进行 等它完成后直接使用其结果 不再重复校准
+                if self.active is None:
+                    self._calibrate(None, 3)
+        if self.active is None:
+            raise RuntimeError("没有可用的二维码解码后端")
+        return self.active
+
+    def select(self, name: str) -> QrDecoder:
+        if name not in self.decoders:
+            raise KeyError(f"解码后端不可用 {name}")
+        self.active = self.decoders[name]
+        return self.active
+
+    def report(self) -> dict:
+        active = self.active.name if self.active else None
+        return {
+            "active": active,
+            "latency_ms": self.results.get(active, {}).get("latency_ms"),
+            "calibrated_at": self.calibrated_at,
+            "candidates": self.results,
+            "unavailable": self.unavailable,
+        }
+
+
+decoder_registry = DecoderRegistry()
@@ -0,0 +1,296 @@
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .frame_source import render_qr_matrix, synthetic_qr_frame, to_gray
+from .metrics import scan_stage_seconds
+from .qr_decoders import DecodedQr, QrDecoder
+
+PREFILTER_SECONDS = scan_stage_seconds.labels("prefilter")
+
+# 定位图案横穿中心的明暗宽度比 暗:亮:暗:亮:暗 = 1:1:3:1:1
+FINDER_RATIOS = np.array([1, 1, 3, 1, 1], dtype=np.float32)
+
+
+def _finder_runs(dark: np.ndarray, min_width: int, tolerance: float):
+    # 逐行找出符合1:1:3:1:1的连续五段 返回 (行号, 中心列, 图案宽度) 全部为向量运算
+    height, width = dark.shape
+    change = np.ones((height, width + 1), dtype=bool)
+    np.not_equal(dark[:, 1:], dark[:, :-1], out=change[:, 1:width])
+    rows, starts = np.nonzero(change)
+    lengths = np.diff(starts)
+    if len(lengths) < 5:
+        empty = np.empty(0, dtype=np.intp)
+        return empty, empty, empty
+    # 第i段从starts[i]开始 与第i+4段在同一行时才构成一组
+    n = len(lengths) - 4
+    ok = rows[4:4 + n] == rows[:n]
+    ok &= dark[rows[:n], np.minimum(starts[:n], width - 1)]
+    runs = [lengths[k:k + n] for k in range(5)]
+    total = runs[0] + runs[1] + runs[2] + runs[3] + runs[4]
+    ok &= total >= min_width
+    module = total.astype(np.float32) / 7
+    # 每段允许偏差 tolerance倍自身期望宽度再加半个模块(缩小后的边缘像素)
+    for run, ratio in zip(runs, FINDER_RATIOS):
+        ok &= np.abs(run - module * ratio) <= module * (ratio * tolerance + 0.5)
+    index = np.nonzero(ok)[0]
+    centers = starts[index + 2] + lengths[index + 2] // 2
+    return rows[index], centers, total[index]
+
+
+def _is_finder(patch: np.ndarray, size: float) -> bool:
+    # 在原图的小块上确认回字形 暗方块中有亮环 亮环中还有暗方块 即轮廓有子轮廓且子轮廓还有子轮廓
+    # 小块用Otsu单独二值化 低对比度的二维码也能分开明暗
+    _, binary = cv2.threshold(patch, 0, 1, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    contours, hierarchy = cv2.findContours(binary, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+    if hierarchy is None:
+        return False
+    hierarchy = hierarchy[0]
+    center_x, center_y = patch.shape[1] / 2, patch.shape[0] / 2
+    for outer, (_, _, child, _) in enumerate(hierarchy):
+        if child < 0 or hierarchy[child][2] < 0:
+            continue
+        x, y, w, h = cv2.boundingRect(contours[outer])
+        if not (x <= center_x <= x + w and y <= center_y <= y + h):
+            continue
+        if not (0.6 * size <= w <= 1.5 * size and 0.6 * size <= h <= 1.5 * size):
+            continue
+        ix, iy, iw, ih = cv2.boundingRect(contours[hierarchy[child][2]])
+        # 中心暗方块宽3个模块 即图案宽度的3/7
+        if 0.2 * w <= iw <= 0.65 * w and 0.2 * h <= ih <= 0.65 * h:
+            return True
+    return False
+
+
+class FinderPrefilter:
+    # 二维码初筛 在缩小的灰度图上寻找回字形定位图案 只把含有定位图案的区域交给解码后端
+    # 自适应阈值二值化后 横向和纵向都出现1:1:3:1:1明暗比例的位置为候选 整帧一次向量运算完成
+    # 候选再在原图的小块上确认确实是嵌套的方块 排除文字笔画和细边框
+    # 相距不超过reach倍图案宽度的定位图案属于同一个二维码 区域为它们的外接矩形 四周留出约4个模块的空白区
+    # 只找到一个定位图案时无法判断二维码朝哪边延伸 区域向四周各扩展reach倍图案宽度
+    # 找不到定位图案时返回空列表 区域合计超过full_ratio时直接返回整帧
+    def __init__(
+        self,
+        max_side: int = 960,
+        block_size: int = 21,
+        offset: int = 6,
+        min_width: int = 10,
+        tolerance: float = 0.5,
+        reach: float = 8.5,
+        full_ratio: float = 0.5,
+        max_candidates: int = 400,
+    ):
+        self.max_side = max_side
+        self.block_size = block_size
+        self.offset = offset
+        self.min_width = min_width
+        self.tolerance = tolerance
+        self.reach = reach
+        self.full_ratio = full_ratio
+        self.max_candidates = max_candidates
+
+    def find_patterns(self, gray: np.ndarray) -> Tuple[float, Optional[np.ndarray]]:
+        # 返回 (缩放比例, 定位图案数组) 每行为 (中心x, 中心y, 图案宽度)
+        # 确认后的定位图案为原图坐标 缩放比例为1 候选过多无法逐个确认时数组为None
+        height, width = gray.shape[:2]
+        scale = min(1.0, self.max_side / max(height, width))
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+        dark = cv2.adaptiveThreshold(
+            small, 1, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, self.block_size, self.offset,
+        ).view(bool)
+        h_rows, h_cols, h_width = _finder_runs(dark, self.min_width, self.tolerance)
+        if not len(h_rows):
+            return scale, np.empty((0, 3), dtype=np.float32)
+        v_cols, v_rows, v_width = _finder_runs(np.ascontiguousarray(dark.T), self.min_width, self.tolerance)
+        if not len(v_rows):
+            return scale, np.empty((0, 3), dtype=np.float32)
+        # 横向与纵向的命中点相距不超过1像素处才是定位图案的中心
+        horizontal = np.zeros(small.shape[:2], dtype=np.uint8)
+        horizontal[h_rows, h_cols] = 1
+        vertical = np.zeros(small.shape[:2], dtype=np.uint8)
+        vertical[v_rows, v_cols] = 1
+        kernel = np.ones((3, 3), dtype=np.uint8)
+        both = cv2.dilate(horizontal, kernel) & cv2.dilate(vertical, kernel)
+        count, labels, _, centroids = cv2.connectedComponentsWithStats(both)
+        if count <= 1:
+            return scale, np.empty((0, 3), dtype=np.float32)
+        sizes = np.zeros(count, dtype=np.float32)
+        np.maximum.at(sizes, labels[h_rows, h_cols], h_width)
+        np.maximum.at(sizes, labels[v_rows, v_cols], v_width)
+        patterns = np.column_stack([centroids[1:], sizes[1:]]).astype(np.float32)
+        patterns = patterns[patterns[:, 2] > 0]
+        if len(patterns) > self.max_candidates:
+            # 纹理极其密集的画面 逐个确认反而更慢 交给调用方整帧解码
+            return scale, None
+        # 换算回原图坐标后逐个确认
+        patterns /= scale
+        keep = []
+        for cx, cy, size in patterns:
+            half = int(size * 0.8) + 2
+            x0, y0 = max(int(cx) - half, 0), max(int(cy) - half, 0)
+            patch = gray[y0:int(cy) + half, x0:int(cx) + half]
+            keep.append(patch.shape[0] > 4 and patch.shape[1] > 4 and _is_finder(patch, size))
+        return 1.0, patterns[np.array(keep, dtype=bool)]
+
+    def candidates(self, gray: np.ndarray) -> List[Tuple[int, int, int, int]]:
+        # 返回原图坐标的候选区域列表 (x, y, w, h)
+        height, width = gray.shape[:2]
+        _, patterns = self.find_patterns(gray)
+        if patterns is None:
+            return [(0, 0, width, height)]
+        if not len(patterns):
+            return []
+        # 按可达范围把定位图案分组 范围重叠的属于同一组
+        scale = min(1.0, 512 / max(height, width))
+        mask = np.zeros((round(height * scale), round(width * scale)), dtype=np.uint8)
+        for cx, cy, size in patterns * scale:
+            half = size * self.reach / 2
+            cv2.rectangle(mask, (int(cx - half), int(cy - half)), (int(cx + half), int(cy + half)), 1, -1)
+        _, labels, _, _ = cv2.connectedComponentsWithStats(mask)
+        groups = labels[np.minimum((patterns[:, 1] * scale).astype(int), mask.shape[0] - 1), np.minimum((patterns[:, 0] * scale).astype(int), mask.shape[1] - 1)]
+        regions = []
+        for group in np.unique(groups):
+            members = patterns[groups == group]
+            size = members[:, 2].max()
+            x0, y0 = members[:, 0].min(), members[:, 1].min()
+            x1, y1 = members[:, 0].max(), members[:, 1].max()
+            span = max(x1 - x0, y1 - y0)
+            if span < size:
+                # 只有一个定位图案
+                margin_x = margin_y = size * self.reach
+            else:
+                # 只找到同一边上的两个定位图案时 另一个方向向两侧各扩展一个边长
+                margin_x = size * 8 / 7 + (span if x1 - x0 < span / 2 else 0)
+                margin_y = size * 8 / 7 + (span if y1 - y0 < span / 2 else 0)
+            rx0, ry0 = max(int(x0 - margin_x), 0), max(int(y0 - margin_y), 0)
+            rx1, ry1 = min(int(x1 + margin_x) + 1, width), min(int(y1 + margin_y) + 1, height)
+            regions.append((rx0, ry0, rx1 - rx0, ry1 - ry0))
+        if sum(w * h for _, _, w, h in regions) > self.full_ratio * width * height:
+            return [(0, 0, width, height)]
+        return regions
+
+
+class PrefilteredDecoder(QrDecoder):
+    # 先初筛再解码 没有候选区域的帧不调用解码后端 有候选区域时只解码这些区域
+    # 被初筛拒绝的帧每audit_every帧仍完整解码一次 解出二维码即为初筛漏检 用于在真实画面上估计漏检率
+    # 与其他解码后端接口一致 可被多个解码线程同时调用
+    def __init__(self, decoder: QrDecoder, prefilter: Optional[FinderPrefilter] = None, audit_every: int = 10):
+        self.decoder = decoder
+        self.prefilter = prefilter or FinderPrefilter()
+        self.name = f"{decoder.name}-prefilter"
+        self.audit_every = audit_every
+        self.frames = 0
+        self.rejected = 0
+        self.regions = 0
+        self.audits = 0
+        self.missed = 0
+        self._lock = threading.Lock()
+
+    def decode(self, gray) -> List[DecodedQr]:
+        start = time.perf_counter()
+        regions = self.prefilter.candidates(gray)
+        PREFILTER_SECONDS.observe(time.perf_counter() - start)
+        with self._lock:
+            self.frames += 1
+            self.regions += len(regions)
+            if not regions:
+                self.rejected += 1
+                audit = self.audit_every and self.rejected % self.audit_every == 0
+                if audit:
+                    self.audits += 1
+        if not regions:
+            if not audit:
+                return []
+            codes = self.decoder.decode(gray)
+            if codes:
+                with self._lock:
+                    self.missed += 1
+            return codes
+        codes = []
+        for x, y, w, h in regions:
+            for code in self.decoder.decode(gray[y:y + h, x:x + w]):
+                cx, cy, cw, ch = code.rect
+                codes.append(DecodedQr(code.data, (cx + x, cy + y, cw, ch)))
+        return codes
+
+    def stats(self) -> dict:
+        # miss_rate为抽查的被拒帧中实际含有二维码的比例
+        with self._lock:
+            return {
+                "decoder": self.decoder.name,
+                "frames": self.frames,
+                "rejected": self.rejected,
+                "reject_rate": round(self.rejected / self.frames, 4) if self.frames else None,
+                "regions_per_frame": round(self.regions / (self.frames - self.rejected), 2) if self.frames > self.rejected else None,
+                "audits": self.audits,
+                "missed": self.missed,
+                "miss_rate": round(self.missed / self.audits, 4) if self.audits else None,
+                "latency": PREFILTER_SECONDS.summary(),
+            }
+
+
+def prefilter_corpus(count: int = 40, seed: int = 0) -> List[Tuple[np.ndarray, Optional[Tuple[int, int, int, int]]]]:
+    # 初筛漏检率的测试样本 (灰度帧, 二维码所在矩形) 矩形不含四周的空白区 为None表示不含二维码
+    # 含二维码的帧覆盖不同的模块大小 位置 噪声 低对比度(半透明遮罩) 模糊
+    # 不含二维码的帧为噪声背景上的随机矩形和文字 近似游戏界面
+    rng = np.random.default_rng(seed)
+    payload = "https://user.mihoyo.com/qr_code_in_game.html?app_id=4&ticket=0123456789abcdef0123456789abcdef"
+    border = 4
+    modules = render_qr_matrix(payload, border).shape[0]
+    corpus = []
+    for i in range(count):
+        width, height = (1920, 1080) if i % 2 else (1280, 720)
+        module = int(rng.integers(3, 9))
+        size = modules * module
+        position = (int(rng.integers(0, width - size)), int(rng.integers(0, height - size)))
+        frame = to_gray(synthetic_qr_frame(width, height, payload, position=position, module_size=module, noise=int(rng.integers(0, 13)), seed=i))
+        kind = i % 4
+        if kind == 1:
+            frame = (frame.astype(np.float32) * rng.uniform(0.15, 0.4) + rng.uniform(40, 120)).astype(np.uint8)
+        elif kind == 2:
+            frame = cv2.GaussianBlur(frame, (0, 0), rng.uniform(0.8, 0.45 * module))
+        quiet = border * module
+        corpus.append((frame, (position[0] + quiet, position[1] + quiet, size - 2 * quiet, size - 2 * quiet)))
+    for i in range(count):
+        width, height = (1920, 1080) if i % 2 else (1280, 720)
+        frame = to_gray(synthetic_qr_frame(width, height, noise=int(rng.integers(0, 13)), seed=count + i))
+        for _ in range(int(rng.integers(5, 30))):
+            x, y = int(rng.integers(0, width - 20)), int(rng.integers(0, height - 20))
+            w, h = int(rng.integers(10, 400)), int(rng.integers(10, 200))
+            cv2.rectangle(frame, (x, y), (x + w, y + h), int(rng.integers(0, 256)), int(rng.choice([-1, 1, 2, 4])))
+        for _ in range(int(rng.integers(3, 15))):
+            x, y = int(rng.integers(0, width - 200)), int(rng.integers(20, height))
+            cv2.putText(frame, "Genshin UID 100000001", (x, y), cv2.FONT_HERSHEY_SIMPLEX, rng.uniform(0.5, 1.5), int(rng.integers(0, 256)), 2)
+        corpus.append((frame, None))
+    return corpus
+
+
+def measure_prefilter(prefilter: FinderPrefilter, corpus=None) -> dict:
+    # 漏检 含二维码的帧没有任何候选区域完整覆盖二维码 误报 不含二维码的帧有候选区域
+    corpus = corpus if corpus is not None else prefilter_corpus()
+    positives = negatives = missed = false_alarms = 0
+    timings = []
+    for gray, rect in corpus:
+        start = time.perf_counter()
+        regions = prefilter.candidates(gray)
+        timings.append(time.perf_counter() - start)
+        if rect is None:
+            negatives += 1
+            false_alarms += bool(regions)
+            continue
+        positives += 1
+        x, y, w, h = rect
+        if not any(rx <= x and ry <= y and x + w <= rx + rw and y + h <= ry + rh for rx, ry, rw, rh in regions):
+            missed += 1
+    timings.sort()
+    return {
+        "positives": positives,
+        "negatives": negatives,
+        "false_negative_rate": missed / positives if positives else None,
+        "false_positive_rate": false_alarms / negatives if negatives else None,
+        "p50_ms": round(timings[len(timings) // 2] * 1000, 3) if timings else None,
+        "max_ms": round(timings[-1] * 1000, 3) if timings else None,
+    }
@@ -0,0 +1,53 @@
+import base64
+from typing import List
+
+import qrcode
+
+
+def qr_matrix(data: str, border: int = 4) -> List[List[bool]]:
+    # 生成二维码模块矩阵 True为黑色模块 只做编码 不经过PIL
+    # border为四周留白的模块数 规范要求至少4个 少了在非白色背景的页面上手机不易识别
+    qr = qrcode.QRCode(border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+def matrix_rows(matrix: List[List[bool]]) -> List[str]:
+    # 矩阵的紧凑表示 每行一个由0和1组成的字符串 供前端自行绘制
+    return ["".join("1" if cell else "0" for cell in row) for row in matrix]
+
+
+def matrix_to_svg(matrix: List[List[bool]]) -> str:
+    # 每行连续的黑色模块合并为一个矩形 整张图只有一个path元素
+    # 以模块为单位的viewBox 由浏览器按显示尺寸缩放 不需要预先放大
+    size = len(matrix)
+    parts = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < size:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < size and row[x]:
+                x += 1
+            parts.append(f"M{start} {y}h{x - start}v1h-{x - start}z")
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="#fff"/>'
+        f'<path d="{"".join(parts)}" fill="#000"/></svg>'
+    )
+
+
+def svg_data_uri(svg: str) -> str:
+    return "data:image/svg+xml;base64," + base64.b64encode(svg.encode("utf-8")).decode("ascii")
+
+
+def render_qr(data: str, border: int = 4) -> dict:
+    # 一次编码同时得到两种输出 qr_image可直接用作<img>的src qr_matrix为原始模块矩阵
+    matrix = qr_matrix(data, border)
+    return {
+        "qr_image": svg_data_uri(matrix_to_svg(matrix)),
+        "qr_matrix": matrix_rows(matrix),
+    }
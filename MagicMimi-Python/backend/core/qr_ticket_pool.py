@@ -0,0 +1,136 @@
+import asyncio
+import time
+from typing import List, Optional, Tuple
+
+from .executors import run_in
+from .qr_render import render_qr
+from .ticket_ledger import extract_expiry
+
+
+class QrTicket:
+    # 已向上游申请并编码好的二维码 取出后直接返回给页面
+    def __init__(self, ticket: str, device: str, url: str, expires_at: float, rendered: dict):
+        self.ticket = ticket
+        self.device = device
+        self.url = url
+        self.expires_at = expires_at
+        self.rendered = rendered
+
+    def to_dict(self) -> dict:
+        return {"ticket": self.ticket, "device": self.device, "expires_at": self.expires_at, **self.rendered}
+
+
+class QrTicketPool:
+    # 预先申请并编码好的二维码票据池 请求二维码时直接从池中取出 不再等待上游请求和编码
+    # 后台任务保持池中有size个可用票据 在过期前evict_margin秒淘汰 保证取出的二维码还有足够时间扫码
+    # 每个票据只会发出一次 超过idle_timeout秒没有人取用时停止补充 下次取用时重新开始
+    def __init__(
+        self,
+        api,
+        size: int = 2,
+        default_ttl: float = 180.0,
+        evict_margin: float = 60.0,
+        retry_interval: float = 5.0,
+        idle_timeout: float = 600.0,
+    ):
+        self.api = api
+        self.size = size
+        self.default_ttl = default_ttl
+        self.evict_margin = evict_margin
+        self.retry_interval = retry_interval
+        self.idle_timeout = idle_timeout
+        self._tickets: List[QrTicket] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.last_used = time.monotonic()
+        self.last_error: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self.fetched = 0
+        self.evicted = 0
+
+    def start(self):
+        # 需要在事件循环中调用 已在运行时只唤醒补充任务
+        self.last_used = time.monotonic()
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._refill_loop())
+        else:
+            self._wakeup.set()
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _evict(self):
+        deadline = time.time() + self.evict_margin
+        fresh = [ticket for ticket in self._tickets if ticket.expires_at > deadline]
+        self.evicted += len(self._tickets) - len(fresh)
+        self._tickets = fresh
+
+    async def take(self) -> Tuple[Optional[dict], Optional[str]]:
+        # 返回 (二维码数据, 错误) 池中有可用票据时不产生任何IO
+        self._evict()
+        if self._tickets:
+            self.hits += 1
+            # 先发出最早申请的票据 淘汰后剩余的有效期都不少于evict_margin秒
+            ticket = self._tickets.pop(0)
+            self.start()
+            return ticket.to_dict(), None
+        self.misses += 1
+        # 池为空时先现场申请 拿到之后再启动补充 避免补充任务与本次申请同时向上游请求
+        ticket, error = await self._fetch()
+        self.start()
+        if error:
+            return None, error
+        return ticket.to_dict(), None
+
+    async def _fetch(self) -> Tuple[Optional[QrTicket], Optional[str]]:
+        ticket_data, error = await self.api.fetch_qr_ticket()
+        if error:
+            self.last_error = error
+            return None, error
+        self.fetched += 1
+        # 编码在线程中进行 不阻塞事件循环
+        rendered = await run_in("cpu", render_qr, ticket_data["url"])
+        # 二维码链接带有expire参数时以它为准 否则按default_ttl估计
+        expires_at = extract_expiry(ticket_data["url"]) or time.time() + self.default_ttl
+        return QrTicket(ticket_data["ticket"], ticket_data["device"], ticket_data["url"], expires_at, rendered), None
+
+    async def _refill_loop(self):
+        while time.monotonic() - self.last_used < self.idle_timeout:
+            self._evict()
+            if len(self._tickets) < self.size:
+                ticket, error = await self._fetch()
+                if ticket is not None:
+                    if ticket.expires_at - time.time() <= self.evict_margin:
+                        # 有效期短于淘汰余量 放入池中也会立即被淘汰 只能在取用时现场申请
+                        self.last_error = "二维码有效期过短 无法预先申请"
+                        break
+                    self._tickets.append(ticket)
+                    continue
+                timeout = self.retry_interval
+            else:
+                # 睡到最早的票据需要淘汰时 或有票据被取走时
+                oldest = min(ticket.expires_at for ticket in self._tickets)
+                timeout = max(oldest - self.evict_margin - time.time(), 0.0) + 0.01
+                timeout = min(timeout, self.idle_timeout)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        # 长时间无人使用 丢弃剩余票据 不再持续向上游申请
+        self._tickets = []
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "available": len(self._tickets),
+            "hits": self.hits,
+            "misses": self.misses,
+            "fetched": self.fetched,
+            "evicted": self.evicted,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+
+class AsyncTokenBucket:
+    # 令牌桶限速 rate为每秒补充的令牌数 burst为桶容量 acquire在令牌不足时异步等待
+    # reserve为取令牌后桶中至少要留下的令牌数 低优先级的请求用它给高优先级的请求留出余量
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = None
+        self.waited = 0.0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def tokens(self) -> float:
+        self._refill(time.monotonic())
+        return self._tokens
+
+    def try_acquire(self, tokens: float = 1.0, reserve: float = 0.0) -> bool:
+        self._refill(time.monotonic())
+        if self._tokens >= tokens + reserve:
+            self._tokens -= tokens
+            return True
+        return False
+
+    def refund(self, tokens: float = 1.0):
+        # 取到令牌后没有用上(如等待者已被取消)时退回
+        self._tokens = min(self.burst, self._tokens + tokens)
+
+    def wait_time(self, tokens: float = 1.0, reserve: float = 0.0) -> float:
+        # 距离桶中攒够tokens+reserve个令牌还要多少秒
+        return max(tokens + reserve - self.tokens, 0.0) / self.rate
+
+    async def acquire(self, tokens: float = 1.0):
+        # 锁延迟创建 保证绑定到实际使用的事件循环 排队的协程按先来后到获取令牌
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while not self.try_acquire(tokens):
+                delay = (tokens - self._tokens) / self.rate
+                self.waited += delay
+                await asyncio.sleep(delay)
@@ -0,0 +1,163 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+from .metrics import metrics
+from .rate_limit import AsyncTokenBucket
+
+# 出站请求的优先级通道 数字越小越优先
+# login 抢码时的scan/getGameToken/confirm  token Token预取与Stoken兑换
+# poll 二维码票据申请与登录状态轮询  bulk 批量检查等后台任务
+LOGIN, TOKEN, POLL, BULK = 0, 1, 2, 3
+LANE_NAMES = {LOGIN: "login", TOKEN: "token", POLL: "poll", BULK: "bulk"}
+
+# 各通道取走令牌后桶中至少要留下的令牌数 后台流量再多也会给抢码留出几次突发的余量
+LANE_RESERVE = {LOGIN: 0, TOKEN: 1, POLL: 2, BULK: 4}
+
+# 每台主机的限速 (每秒请求数, 突发容量) 未列出的主机使用DEFAULT_HOST_LIMIT
+DEFAULT_HOST_LIMIT = (50.0, 20.0)
+HOST_LIMITS: Dict[str, Tuple[float, float]] = {}
+
+# 从申请到取得令牌的等待时间 按通道区分
+budget_wait_seconds = metrics.histogram("magicmimi_budget_wait_seconds", "出站请求等待限速令牌的时间", "lane")
+
+
+class _HostBudget:
+    def __init__(self, rate: float, burst: float):
+        self.bucket = AsyncTokenBucket(rate, burst)
+        # 排队的请求 [lane, seq, loop, future, queued] 按通道优先 同通道先来先得
+        self.queue = []
+        self.depth = Counter()
+        self.max_depth = Counter()
+        self.granted = Counter()
+        # 已安排的唤醒 (事件循环, 唤醒时间)
+        self.timer: Optional[tuple] = None
+
+
+class RequestBudget:
+    # 所有出站请求共用的限速调度 每台主机一个令牌桶 令牌不足时按通道优先级排队
+    # 高优先级的请求到来时直接越过排队中的低优先级请求 低优先级的请求还要在桶里留下LANE_RESERVE个令牌
+    # 进程内所有MihoyoAPI共用同一个实例 它们可能运行在不同线程的事件循环中(后端主循环 扫描会话循环)
+    # 因此排队状态由线程锁保护 放行时通过等待者所在的事件循环唤醒它
+    def __init__(self, host_limits: Optional[Dict[str, Tuple[float, float]]] = None, default_limit: Tuple[float, float] = DEFAULT_HOST_LIMIT, reserve: Optional[Dict[int, float]] = None):
+        self.host_limits = dict(HOST_LIMITS if host_limits is None else host_limits)
+        self.default_limit = default_limit
+        self.reserve = dict(LANE_RESERVE if reserve is None else reserve)
+        self.hosts: Dict[str, _HostBudget] = {}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def _host(self, host: str) -> _HostBudget:
+        state = self.hosts.get(host)
+        if state is None:
+            state = self.hosts[host] = _HostBudget(*self.host_limits.get(host, self.default_limit))
+        return state
+
+    def _reserve(self, state: _HostBudget, lane: int) -> float:
+        # 留出的余量小于桶容量 否则低优先级通道永远取不到令牌
+        return min(self.reserve.get(lane, 0), state.bucket.burst - 1)
+
+    async def acquire(self, host: str, lane: int = BULK):
+        # 取得向host发出一次请求的许可 令牌不足时等待 等待期间被取消不会占用令牌
+        start = time.perf_counter()
+        wait_histogram = budget_wait_seconds.labels(LANE_NAMES.get(lane, str(lane)))
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            state = self._host(host)
+            # 没有同级或更高优先级的请求在排队时直接取令牌
+            if (not state.queue or state.queue[0][0] > lane) and state.bucket.try_acquire(1, self._reserve(state, lane)):
+                state.granted[lane] += 1
+                wait_histogram.observe(0.0)
+                return
+            future = loop.create_future()
+            entry = [lane, next(self._seq), loop, future, True]
+            heapq.heappush(state.queue, entry)
+            state.depth[lane] += 1
+            state.max_depth[lane] = max(state.max_depth[lane], state.depth[lane])
+            self._pump(state)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                self._dequeue(state, entry)
+                if future.done() and not future.cancelled():
+                    # 已放行但调用方不再需要 退回令牌给后面的请求
+                    state.bucket.refund()
+                    state.granted[lane] -= 1
+                self._pump(state)
+            raise
+        wait_histogram.observe(time.perf_counter() - start)
+
+    def _dequeue(self, state: _HostBudget, entry: list):
+        if entry[4]:
+            entry[4] = False
+            state.depth[entry[0]] -= 1
+
+    def _pump(self, state: _HostBudget):
+        # 持锁调用 按优先级放行队首的请求 令牌不足时安排在攒够令牌时再检查
+        queue = state.queue
+        while queue:
+            entry = queue[0]
+            lane, _, loop, future, _ = entry
+            if future.done() or loop.is_closed():
+                heapq.heappop(queue)
+                self._dequeue(state, entry)
+                continue
+            reserve = self._reserve(state, lane)
+            if not state.bucket.try_acquire(1, reserve):
+                self._schedule(state, loop, state.bucket.wait_time(1, reserve))
+                return
+            heapq.heappop(queue)
+            self._dequeue(state, entry)
+            state.granted[lane] += 1
+            loop.call_soon_threadsafe(self._resolve, state, future, lane)
+
+    def _schedule(self, state: _HostBudget, loop, delay: float):
+        due = time.monotonic() + delay
+        timer = state.timer
+        if timer is not None and not timer[0].is_closed() and timer[1] <= due:
+            return
+        state.timer = (loop, due)
+        loop.call_soon_threadsafe(loop.call_later, delay, self._wake, state, due)
+
+    def _wake(self, state: _HostBudget, due: float):
+        with self._lock:
+            if state.timer is not None and state.timer[1] == due:
+                state.timer = None
+            self._pump(state)
+
+    def _resolve(self, state: _HostBudget, future: asyncio.Future, lane: int):
+        # 在等待者的事件循环中执行 等待者已被取消时退回令牌
+        if not future.done():
+            future.set_result(None)
+            return
+        with self._lock:
+            state.bucket.refund()
+            state.granted[lane] -= 1
+            self._pump(state)
+
+    def stats(self) -> dict:
+        # queued为当前排队数 max_queued为出现过的最大排队数 granted为已放行的请求数
+        lane_counts = lambda counter: {name: counter[lane] for lane, name in LANE_NAMES.items()}
+        with self._lock:
+            hosts = {
+                host: {
+                    "rate": state.bucket.rate,
+                    "burst": state.bucket.burst,
+                    "tokens": round(state.bucket.tokens, 2),
+                    "queued": lane_counts(state.depth),
+                    "max_queued": lane_counts(state.max_depth),
+                    "granted": lane_counts(state.granted),
+                }
+                for host, state in self.hosts.items()
+            }
+        wait = {name: child.summary() for name, child in sorted(budget_wait_seconds.children.items())}
+        return {"hosts": hosts, "wait": wait}
+
+
+# 进程内所有出站请求共用的预算
+request_budget = RequestBudget()
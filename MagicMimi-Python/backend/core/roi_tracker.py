@@ -0,0 +1,116 @@
+import time
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+Rect = Tuple[int, int, int, int]  # left, top, width, height
+
+
+def crop_image(image: np.ndarray, crop: Optional[Rect]) -> np.ndarray:
+    if crop is None:
+        return image
+    x, y, w, h = crop
+    return image[y:y + h, x:x + w]
+
+
+class RoiTracker:
+    # 记住上次识别到二维码的位置 优先只解码其周围带边距的裁剪区域
+    # 按计划(每full_scan_every帧)或连续max_misses次未命中时回退到全帧扫描
+    # 最近hold_seconds秒内识别到过二维码时 recently_hit为True 供调度器判断画面变化是否为二维码刷新
+    def __init__(
+        self,
+        padding: float = 0.5,
+        min_padding: int = 32,
+        full_scan_every: int = 30,
+        max_misses: int = 10,
+        hold_seconds: float = 5.0,
+    ):
+        self.padding = padding
+        self.min_padding = min_padding
+        self.full_scan_every = full_scan_every
+        self.max_misses = max_misses
+        self.hold_seconds = hold_seconds
+        self.last_hit_at: Optional[float] = None
+        self.region: Optional[Rect] = None
+        self._frame_size = None
+        self._since_full = 0
+        self._misses = 0
+        self.roi_scans = 0
+        self.roi_hits = 0
+        self.full_scans = 0
+        self.full_hits = 0
+
+    def reset(self):
+        self.region = None
+        self.last_hit_at = None
+        self._since_full = 0
+        self._misses = 0
+
+    @property
+    def recently_hit(self) -> bool:
+        last_hit_at = self.last_hit_at
+        return last_hit_at is not None and time.monotonic() - last_hit_at <= self.hold_seconds
+
+    def _padded_region(self, width: int, height: int) -> Rect:
+        x, y, w, h = self.region
+        pad_x = max(self.min_padding, int(w * self.padding))
+        pad_y = max(self.min_padding, int(h * self.padding))
+        left, top = max(0, x - pad_x), max(0, y - pad_y)
+        right, bottom = min(width, x + w + pad_x), min(height, y + h + pad_y)
+        return left, top, right - left, bottom - top
+
+    def _learn(self, codes, offset_x: int, offset_y: int):
+        rects = [code.rect for code in codes]
+        left = min(r[0] for r in rects) + offset_x
+        top = min(r[1] for r in rects) + offset_y
+        right = max(r[0] + r[2] for r in rects) + offset_x
+        bottom = max(r[1] + r[3] for r in rects) + offset_y
+        self.region = (left, top, right - left, bottom - top)
+        self.last_hit_at = time.monotonic()
+
+    def next_crop(self, width: int, height: int) -> Optional[Rect]:
+        # 返回本帧要解码的区域 None表示全帧扫描
+        if (width, height) != self._frame_size:
+            # 窗口尺寸变化后旧位置不再可信
+            self._frame_size = (width, height)
+            self.reset()
+        if self.region is None:
+            return None
+        if self._since_full >= self.full_scan_every or self._misses >= self.max_misses:
+            return None
+        return self._padded_region(width, height)
+
+    def record(self, crop: Optional[Rect], codes: List):
+        # 记录一次解码结果 crop为next_crop返回的区域
+        if crop is not None:
+            self.roi_scans += 1
+            self._since_full += 1
+            if codes:
+                self.roi_hits += 1
+                self._misses = 0
+                self._learn(codes, crop[0], crop[1])
+            else:
+                self._misses += 1
+            return
+        self.full_scans += 1
+        self._since_full = 0
+        self._misses = 0
+        if codes:
+            self.full_hits += 1
+            self._learn(codes, 0, 0)
+
+    def decode(self, gray: np.ndarray, decode_fn: Callable[[np.ndarray], List]) -> List:
+        height, width = gray.shape[:2]
+        crop = self.next_crop(width, height)
+        codes = decode_fn(crop_image(gray, crop))
+        self.record(crop, codes)
+        return codes
+
+    def stats(self) -> dict:
+        return {
+            "region": self.region,
+            "roi_scans": self.roi_scans,
+            "roi_hits": self.roi_hits,
+            "full_scans": self.full_scans,
+            "full_hits": self.full_hits,
+        }
@@ -0,0 +1,399 @@
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+
+from .frame_gate import FrameChangeGate
+from .frame_source import FrameSource, to_gray
+from .metrics import scan_stage_seconds
+from .qr_decoders import QrDecoder
+from .roi_tracker import RoiTracker, crop_image
+from .scan_scheduler import AdaptiveScanScheduler
+
+
+# 各阶段耗时直方图 提前取出子项 热路径上只有一次observe
+CAPTURE_SECONDS = scan_stage_seconds.labels("capture")
+GATE_SECONDS = scan_stage_seconds.labels("gate")
+CONVERT_SECONDS = scan_stage_seconds.labels("convert")
+DECODE_SECONDS = scan_stage_seconds.labels("decode")
+
+
+class LatestQueue:
+    # 有界队列 满时丢弃最旧的元素而不是阻塞生产者 保证消费者总是拿到最新的数据
+    def __init__(self, maxsize: int = 1):
+        self.maxsize = maxsize
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout: Optional[float] = None):
+        # 超时或队列已关闭时返回None
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            return self._items.popleft() if self._items else None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class FairFrameQueue:
+    # 多目标共享的待解码帧队列 每个目标只保留最新一帧 新帧覆盖旧帧(计入dropped)
+    # 解码线程按目标轮转取帧 某个窗口画面变化频繁也不会挤占其他窗口的解码机会
+    def __init__(self):
+        self._frames = {}
+        self._order = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, target, frame):
+        with self._cond:
+            if target in self._frames:
+                self.dropped += 1
+            else:
+                self._order.append(target)
+            self._frames[target] = frame
+            self._cond.notify()
+
+    def get(self, timeout: Optional[float] = None):
+        # 返回(target, frame) 超时或队列已关闭时返回None
+        with self._cond:
+            if not self._order and not self._closed:
+                self._cond.wait(timeout)
+            if not self._order:
+                return None
+            target = self._order.popleft()
+            return target, self._frames.pop(target)
+
+    def discard(self, target):
+        with self._cond:
+            if self._frames.pop(target, None) is not None:
+                self._order.remove(target)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        return len(self._order)
+
+
+class ScanTarget:
+    # 扫描引擎中的一个目标(通常是一个游戏窗口) 帧源 变化检测 ROI跟踪和截图调度各自独立
+    def __init__(self, target_id: str, source: FrameSource, scheduler: AdaptiveScanScheduler):
+        self.target_id = target_id
+        self.source = source
+        self.scheduler = scheduler
+        self.frame_gate = FrameChangeGate()
+        self.roi_tracker = RoiTracker()
+        self.roi_lock = threading.Lock()
+        self.source_lost = False
+        self.removed = False
+        self.captured = 0
+        self.decoded = 0
+        self.hits = 0
+        # 下一次截图的时间点 由截图线程按最早到期优先调度
+        self.next_due = 0.0
+        self.capturing = False
+        self._fps_sample = (time.perf_counter(), 0)
+
+    def sample_fps(self) -> float:
+        # 返回自上次调用以来的截图帧率
+        now, captured = time.perf_counter(), self.captured
+        last_time, last_captured = self._fps_sample
+        self._fps_sample = (now, captured)
+        elapsed = now - last_time
+        return (captured - last_captured) / elapsed if elapsed > 0 else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "captured": self.captured,
+            "decoded": self.decoded,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.decoded if self.decoded else 0.0,
+            "source_lost": self.source_lost,
+            "gate": self.frame_gate.stats(),
+            "roi": self.roi_tracker.stats(),
+            "scheduler": self.scheduler.metrics(),
+        }
+
+
+class ScanEngine:
+    # 多目标扫描引擎 所有目标共享截图线程池和解码线程池
+    # 截图线程每次选取最早到期的目标截图 各目标的间隔由各自的调度器决定
+    # 设置max_fps时总截图帧率按目标数平分 设置cpu_budget时CPU预算也按目标数平分
+    # 识别结果以(target_id, 内容)放入qr_queue 由登录调度方消费 运行中可随时增删目标
+    def __init__(
+        self,
+        decoder: QrDecoder,
+        capture_workers: int = 1,
+        decode_workers: int = 2,
+        scheduler_factory: Optional[Callable[[], AdaptiveScanScheduler]] = None,
+        max_fps: Optional[float] = None,
+        cpu_budget: Optional[float] = None,
+        stop_when_empty: bool = True,
+        result_queue_size: int = 16,
+    ):
+        self.decoder = decoder
+        self.capture_workers = capture_workers
+        self.decode_workers = decode_workers
+        self.scheduler_factory = scheduler_factory or AdaptiveScanScheduler
+        self.max_fps = max_fps
+        self.cpu_budget = cpu_budget
+        # 所有目标都因窗口关闭而失效时自动停止 主动移除目标不会触发
+        self.stop_when_empty = stop_when_empty
+        self.targets: Dict[str, ScanTarget] = {}
+        self.frame_queue = FairFrameQueue()
+        self.qr_queue = LatestQueue(result_queue_size)
+        self.source_lost = False
+        self.lost_targets = []
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+        self._capture_threads = []
+        self._decode_threads = []
+        self._fps_sample = (time.perf_counter(), 0)
+
+    @property
+    def running(self) -> bool:
+        return not self._stop_event.is_set()
+
+    @property
+    def captured(self) -> int:
+        return sum(target.captured for target in list(self.targets.values()))
+
+    def add_target(self, target_id: str, source: FrameSource, scheduler: Optional[AdaptiveScanScheduler] = None) -> ScanTarget:
+        with self._cond:
+            if target_id in self.targets:
+                raise ValueError(f"扫描目标 {target_id} 已存在")
+            target = ScanTarget(target_id, source, scheduler or self.scheduler_factory())
+            self.targets[target_id] = target
+            self._rebalance()
+            self._cond.notify_all()
+        return target
+
+    def remove_target(self, target_id: str) -> bool:
+        with self._cond:
+            target = self.targets.pop(target_id, None)
+            if target is None:
+                return False
+            target.removed = True
+            self._rebalance()
+            # 正在截图的目标由截图线程在本次截图结束后关闭帧源
+            if not target.capturing:
+                target.source.close()
+        self.frame_queue.discard(target)
+        return True
+
+    def _rebalance(self):
+        if self.cpu_budget and self.targets:
+            share = self.cpu_budget / len(self.targets)
+            for target in self.targets.values():
+                target.scheduler.cpu_budget = share
+
+    def _frame_budget_interval(self) -> float:
+        # 总帧率预算平分后每个目标的最小截图间隔
+        if not self.max_fps:
+            return 0.0
+        return max(1, len(self.targets)) / self.max_fps
+
+    def start(self):
+        self._capture_threads = [
+            threading.Thread(target=self._capture_loop, name=f"scan-capture-{i}", daemon=True)
+            for i in range(self.capture_workers)
+        ]
+        self._decode_threads = [
+            threading.Thread(target=self._decode_loop, name=f"scan-decode-{i}", daemon=True)
+            for i in range(self.decode_workers)
+        ]
+        for thread in self._capture_threads + self._decode_threads:
+            thread.start()
+
+    def request_stop(self):
+        # 通知所有线程退出并唤醒等待识别结果的消费方 不等待线程结束 可在任意线程中调用
+        self._shutdown()
+
+    def stop(self, timeout: float = 2.0, wait_decoders: bool = True):
+        # wait_decoders为False时只等待截图线程 解码线程在完成手上这一帧后自行退出
+        # 一次全帧解码可能需要上百毫秒 不等待它可以让停止立即完成
+        self._shutdown()
+        threads = self._capture_threads + (self._decode_threads if wait_decoders else [])
+        for thread in threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout)
+        with self._cond:
+            targets = list(self.targets.values())
+            self.targets.clear()
+        for target in targets:
+            target.source.close()
+
+    def _shutdown(self):
+        self._stop_event.set()
+        self.frame_queue.close()
+        self.qr_queue.close()
+        with self._cond:
+            self._cond.notify_all()
+
+    def _next_target(self) -> Optional[ScanTarget]:
+        # 取最早到期且没有其他截图线程正在处理的目标 未到期时等待
+        with self._cond:
+            while not self._stop_event.is_set():
+                idle = [t for t in self.targets.values() if not t.capturing]
+                if idle:
+                    target = min(idle, key=lambda t: t.next_due)
+                    wait = target.next_due - time.perf_counter()
+                    if wait <= 0:
+                        target.capturing = True
+                        return target
+                else:
+                    wait = 0.5
+                self._cond.wait(min(wait, 0.5))
+        return None
+
+    def _capture(self, target: ScanTarget):
+        start = time.perf_counter()
+        if not target.source.is_alive():
+            target.source_lost = True
+            return None
+        frame = target.source.read()
+        captured_at = time.perf_counter()
+        CAPTURE_SECONDS.observe(captured_at - start)
+        if frame is None:
+            # 截图失败可能因为窗口最小化
+            return 1.0
+        target.captured += 1
+        # 画面没有变化时不进入解码队列 灰度图是新数组 不受截图环形缓冲复用影响
+        changed = target.frame_gate.should_decode(frame)
+        gated_at = time.perf_counter()
+        GATE_SECONDS.observe(gated_at - captured_at)
+        if changed:
+            gray = to_gray(frame)
+            CONVERT_SECONDS.observe(time.perf_counter() - gated_at)
+            self.frame_queue.put(target, gray)
+        # 最近刚识别到二维码的画面发生变化 很可能是二维码刷新 视为疑似命中
+        # 只看最近的命中 很久以前出现过的二维码不会让调度器一直停在最短间隔
+        partial = changed and target.roi_tracker.recently_hit
+        delay = target.scheduler.observe(changed, time.perf_counter() - start, partial=partial)
+        return max(delay, self._frame_budget_interval() - (time.perf_counter() - start))
+
+    def _capture_loop(self):
+        while True:
+            target = self._next_target()
+            if target is None:
+                break
+            try:
+                delay = self._capture(target)
+            except Exception:
+                delay = 1.0
+            with self._cond:
+                target.capturing = False
+                if target.removed:
+                    target.source.close()
+                elif delay is None:
+                    self.targets.pop(target.target_id, None)
+                    self._rebalance()
+                    self.source_lost = True
+                    self.lost_targets.append(target.target_id)
+                    if self.stop_when_empty and not self.targets:
+                        self._stop_event.set()
+                else:
+                    target.next_due = time.perf_counter() + delay
+                self._cond.notify_all()
+            if delay is None:
+                self.frame_queue.discard(target)
+                target.source.close()
+                if not self.running:
+                    self._shutdown()
+
+    def _decode_loop(self):
+        while not self._stop_event.is_set():
+            item = self.frame_queue.get(timeout=0.5)
+            if item is None:
+                continue
+            target, gray = item
+            if target.removed:
+                continue
+            start = time.perf_counter()
+            height, width = gray.shape[:2]
+            with target.roi_lock:
+                crop = target.roi_tracker.next_crop(width, height)
+            decode_start = time.perf_counter()
+            codes = self.decoder.decode(crop_image(gray, crop))
+            DECODE_SECONDS.observe(time.perf_counter() - decode_start)
+            with target.roi_lock:
+                target.roi_tracker.record(crop, codes)
+            target.scheduler.record_work(time.perf_counter() - start)
+            if codes:
+                target.scheduler.note_hit()
+            target.decoded += 1
+            for code in codes:
+                target.hits += 1
+                self.qr_queue.put((target.target_id, code.data.decode("utf-8", "ignore")))
+
+    def sample_fps(self) -> float:
+        # 返回自上次调用以来所有目标合计的截图帧率
+        now, captured = time.perf_counter(), self.captured
+        last_time, last_captured = self._fps_sample
+        self._fps_sample = (now, captured)
+        elapsed = now - last_time
+        return (captured - last_captured) / elapsed if elapsed > 0 else 0.0
+
+    def target_fps(self) -> Dict[str, float]:
+        return {target_id: target.sample_fps() for target_id, target in list(self.targets.items())}
+
+    def stats(self) -> dict:
+        targets = list(self.targets.values())
+        return {
+            "captured": sum(t.captured for t in targets),
+            "decoded": sum(t.decoded for t in targets),
+            "hits": sum(t.hits for t in targets),
+            "dropped_frames": self.frame_queue.dropped,
+            "targets": {t.target_id: t.stats() for t in targets},
+        }
+
+
+class ScanPipeline(ScanEngine):
+    # 单目标的扫描流水线 截图生产者 -> 解码工作线程 -> 二维码结果队列(由登录调度方消费)
+    # 阶段之间丢弃过期帧 登录请求进行中也不会停止截图
+    # pyzbar/OpenCV解码时会释放GIL 多个解码线程可以在多核上并行
+    def __init__(
+        self,
+        source: FrameSource,
+        decoder: QrDecoder,
+        workers: int = 2,
+        scheduler: Optional[AdaptiveScanScheduler] = None,
+        result_queue_size: int = 16,
+    ):
+        super().__init__(decoder, decode_workers=workers, result_queue_size=result_queue_size)
+        self.source = source
+        self.target = self.add_target("default", source, scheduler)
+        self.scheduler = self.target.scheduler
+        self.frame_gate = self.target.frame_gate
+        self.roi_tracker = self.target.roi_tracker
+
+    def stats(self) -> dict:
+        target = self.target
+        return {
+            "captured": target.captured,
+            "decoded": target.decoded,
+            "hits": target.hits,
+            "dropped_frames": self.frame_queue.dropped,
+            "gate": target.frame_gate.stats(),
+            "roi": target.roi_tracker.stats(),
+            "scheduler": target.scheduler.metrics(),
+        }
@@ -0,0 +1,90 @@
+import threading
+import time
+from collections import Counter
+
+
+class AdaptiveScanScheduler:
+    # 根据近期画面活动动态调整截图间隔 取代固定的sleep
+    # 命中/疑似二维码时立即提速到最小间隔 画面变化时逐步加速 静止时逐步退避
+    # cpu_budget为扫描工作(截图+解码)允许占用的单核比例 超出时强制拉长间隔
+    def __init__(
+        self,
+        min_interval: float = 0.02,
+        max_interval: float = 0.5,
+        speedup: float = 0.5,
+        backoff: float = 1.25,
+        cpu_budget: float = 0.5,
+        window: float = 1.0,
+    ):
+        if not cpu_budget > 0:
+            raise ValueError(f"cpu_budget必须大于0 当前为{cpu_budget}")
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.speedup = speedup
+        self.backoff = backoff
+        self.cpu_budget = cpu_budget
+        self.window = window
+        self.interval = min_interval
+        self.state = "active"
+        self.cpu_share = 0.0
+        self.decisions = Counter()
+        self._lock = threading.Lock()
+        self._busy = 0.0
+        self._frames = 0
+        self._window_start = time.perf_counter()
+        self._budget_floor = 0.0
+        self._pending_hit = False
+
+    def record_work(self, seconds: float):
+        # 解码线程等其他阶段上报的耗时 计入CPU预算
+        with self._lock:
+            self._busy += seconds
+
+    def note_hit(self):
+        # 解码线程识别到二维码后调用 下一帧立即提速
+        with self._lock:
+            self._pending_hit = True
+
+    def _update_budget(self, now: float):
+        elapsed = now - self._window_start
+        if elapsed < self.window:
+            return
+        self.cpu_share = self._busy / elapsed
+        work_per_frame = self._busy / self._frames if self._frames else 0.0
+        # 使 工作时间/(工作时间+间隔) 不超过预算所需的最小间隔
+        self._budget_floor = work_per_frame * (1.0 / self.cpu_budget - 1.0) if self.cpu_budget < 1 else 0.0
+        self._busy, self._frames, self._window_start = 0.0, 0, now
+
+    def observe(self, changed: bool, work_time: float, partial: bool = False) -> float:
+        # 截图线程每帧调用一次 返回距离下一次截图应等待的秒数
+        with self._lock:
+            now = time.perf_counter()
+            self._busy += work_time
+            self._frames += 1
+            self._update_budget(now)
+
+            if self._pending_hit or partial:
+                self.interval, reason = self.min_interval, "burst"
+                self._pending_hit = False
+            elif changed:
+                self.interval, reason = max(self.min_interval, self.interval * self.speedup), "active"
+            else:
+                self.interval, reason = min(self.max_interval, self.interval * self.backoff), "idle"
+
+            delay = self.interval
+            if self._budget_floor > delay:
+                delay, reason = min(self.max_interval, self._budget_floor), "throttled"
+            self.state = reason
+            self.decisions[reason] += 1
+            return max(0.0, delay - work_time)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "interval_ms": round(self.interval * 1000, 1),
+                "budget_floor_ms": round(self._budget_floor * 1000, 1),
+                "cpu_share": round(self.cpu_share, 3),
+                "cpu_budget": self.cpu_budget,
+                "decisions": dict(self.decisions),
+            }
@@ -0,0 +1,176 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Optional
+
+from .loop_monitor import LoopLagMonitor
+
+# 扫描会话状态 idle空闲 starting正在打开截图源和预热 running扫描中 stopping正在停止
+IDLE, STARTING, RUNNING, STOPPING = "idle", "starting", "running", "stopping"
+
+
+class ScanSupervisor:
+    # 扫描会话的生命周期管理 所有会话都运行在同一个长期存在的工作线程事件循环中
+    # run_session(settings, mark_running) 为会话协程 打开截图源后调用mark_running进入running状态 自行结束时返回原因
+    # 停止时直接取消会话任务 正在等待识别结果或登录请求的协程立即收到CancelledError并进入清理
+    # 不依赖任何轮询标志 停止耗时只取决于清理本身(主要是等待正在进行的一次截图或解码结束)
+    # 状态每次变化都调用on_state(status) 在工作线程中调用 回调需线程安全
+    def __init__(
+        self,
+        run_session: Callable[..., Awaitable],
+        on_state: Optional[Callable[[dict], None]] = None,
+        name: str = "scan",
+    ):
+        self.run_session = run_session
+        self.on_state = on_state
+        self.name = name
+        self.state = IDLE
+        self.session_id = 0
+        self.settings = None
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+        self.stop_reason: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self.start_latency_ms: Optional[float] = None
+        self.stop_latency_ms: Optional[float] = None
+        self.loop_monitor = LoopLagMonitor(name=name)
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._task: Optional[asyncio.Task] = None
+        self._future: Optional[Future] = None
+        self._requested_at = 0.0
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self._loop.call_soon(ready.set)
+            self._loop.call_soon(self.loop_monitor.start)
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name=f"{self.name}-supervisor", daemon=True)
+        self._thread.start()
+        ready.wait()
+
+    @property
+    def active(self) -> bool:
+        return self.state != IDLE
+
+    def start(self, settings) -> tuple:
+        # 可在任意线程中调用 返回 (是否成功, 消息) 不等待会话真正开始
+        with self._lock:
+            if self.state != IDLE:
+                return False, f"扫描任务正在{self._state_text()}"
+            self._ensure_worker()
+            self.session_id += 1
+            self.settings = settings
+            self.stop_reason = None
+            self.last_error = None
+            self.start_latency_ms = None
+            self.stop_latency_ms = None
+            self._requested_at = time.perf_counter()
+            self._set_state(STARTING)
+            self._future = asyncio.run_coroutine_threadsafe(self._run(self.session_id, settings), self._loop)
+        return True, "扫描任务已启动"
+
+    def stop(self, reason: str = "手动停止") -> Optional[Future]:
+        # 可在任意线程中调用 返回会话结束时完成的Future 没有运行中的会话时返回None
+        with self._lock:
+            if self.state in (IDLE, STOPPING):
+                return self._future if self.state == STOPPING else None
+            self.stop_reason = reason
+            self._requested_at = time.perf_counter()
+            self._set_state(STOPPING)
+            future = self._future
+        self._loop.call_soon_threadsafe(self._cancel_task)
+        return future
+
+    async def wait_stopped(self, timeout: float = 5.0) -> bool:
+        # 在其他事件循环中等待当前会话结束
+        future = self._future
+        if future is None:
+            return True
+        try:
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def _cancel_task(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    def _mark_running(self):
+        with self._lock:
+            if self.state != STARTING:
+                return
+            self.start_latency_ms = round((time.perf_counter() - self._requested_at) * 1000, 1)
+            self.started_at = time.time()
+            self._set_state(RUNNING)
+
+    async def _run(self, session_id: int, settings):
+        self._task = asyncio.current_task()
+        if self.state == STOPPING:
+            # 会话还没开始就被要求停止
+            self._finish(session_id)
+            return
+        try:
+            reason = await self.run_session(settings, self._mark_running)
+            if self.stop_reason is None:
+                self.stop_reason = reason or "会话结束"
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self.last_error = str(e)
+            self.stop_reason = "出错"
+        finally:
+            self._task = None
+            self._finish(session_id)
+
+    def _finish(self, session_id: int):
+        with self._lock:
+            if session_id != self.session_id:
+                return
+            if self.state == STOPPING:
+                self.stop_latency_ms = round((time.perf_counter() - self._requested_at) * 1000, 1)
+            self.stopped_at = time.time()
+            self._set_state(IDLE)
+
+    def _state_text(self) -> str:
+        return {STARTING: "启动", RUNNING: "运行", STOPPING: "停止"}.get(self.state, "空闲")
+
+    def _set_state(self, state: str):
+        self.state = state
+        if self.on_state is not None:
+            try:
+                self.on_state(self.status())
+            except Exception:
+                pass
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "session_id": self.session_id,
+            "started_at": self.started_at,
+            "stopped_at": self.stopped_at,
+            "stop_reason": self.stop_reason,
+            "last_error": self.last_error,
+            "start_latency_ms": self.start_latency_ms,
+            "stop_latency_ms": self.stop_latency_ms,
+        }
+
+    def shutdown(self):
+        self.stop("服务关闭")
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop_loop)
+
+    def _stop_loop(self):
+        # 在事件循环中调用 取消监控心跳后再排队停止 让被取消的任务先运行完毕
+        self.loop_monitor.stop()
+        self._loop.call_soon(self._loop.stop)
@@ -0,0 +1,171 @@
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Optional
+
+TICKET_PATTERN = re.compile(r"ticket=([a-fA-F0-9]+)")
+# 二维码链接中的过期时间(Unix秒)
+EXPIRE_PATTERN = re.compile(r"[?&]expire=(\d+)")
+
+# 票据状态 seen(已识别) -> submitted(已提交scan) -> won/lost 超过ttl仍未结束的记为expired
+# 登录因超时或网络异常失败时submitted退回seen 退避期过后可以再次提交
+SEEN, SUBMITTED, WON, LOST, EXPIRED = "seen", "submitted", "won", "lost", "expired"
+
+
+def extract_ticket(qr_data: str) -> Optional[str]:
+    match = TICKET_PATTERN.search(qr_data)
+    return match.group(1) if match else None
+
+
+def extract_expiry(qr_data: str) -> Optional[float]:
+    match = EXPIRE_PATTERN.search(qr_data)
+    return float(match.group(1)) if match else None
+
+
+class TicketEntry:
+    __slots__ = ("ticket", "state", "source", "first_seen", "updated", "sightings", "message", "retries", "retry_at")
+
+    def __init__(self, ticket: str, source: Optional[str], now: float):
+        self.ticket = ticket
+        self.state = SEEN
+        self.source = source
+        self.first_seen = now
+        self.updated = now
+        self.sightings = 1
+        self.message = None
+        self.retries = 0
+        self.retry_at = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "ticket": self.ticket,
+            "state": self.state,
+            "source": self.source,
+            "age": round(time.time() - self.first_seen, 1),
+            "sightings": self.sightings,
+            "message": self.message,
+            "retries": self.retries,
+        }
+
+
+class TicketLedger:
+    # 所有扫描会话共享的票据台账 每个ticket只会提交一次scan请求
+    # 多个窗口或交替出现的二维码重复识别到同一ticket时直接抑制 并计入duplicates
+    # 索引按首次识别时间排序 超过ttl未结束的票据转为expired 超过retention或容量上限时淘汰最旧的记录
+    # 暂时性失败的票据退回seen 在retry_backoff秒内再次识别到也不会重复提交
+    def __init__(self, ttl: float = 300.0, retention: float = 900.0, max_entries: int = 4096, retry_backoff: float = 1.0):
+        self.ttl = ttl
+        self.retry_backoff = retry_backoff
+        self.retention = retention
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, TicketEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.transitions = Counter()
+        self.duplicates = Counter()
+        self.evicted = 0
+
+    def _sweep(self, now: float):
+        # 有序字典头部是最早识别的票据 遇到未过期的即可停止
+        for entry in self._entries.values():
+            if now - entry.first_seen < self.ttl:
+                break
+            if entry.state in (SEEN, SUBMITTED):
+                entry.state = EXPIRED
+                entry.updated = now
+                self.transitions[EXPIRED] += 1
+        while self._entries:
+            entry = next(iter(self._entries.values()))
+            if now - entry.first_seen < self.retention and len(self._entries) <= self.max_entries:
+                break
+            self._entries.popitem(last=False)
+            self.evicted += 1
+
+    def observe(self, ticket: str, source: Optional[str] = None) -> TicketEntry:
+        # 只登记识别到的ticket 不提交 用于暂时无法登录(如账户缺失)的情况
+        now = time.time()
+        with self._lock:
+            self._sweep(now)
+            return self._observe(ticket, source, now)
+
+    def _observe(self, ticket: str, source: Optional[str], now: float) -> TicketEntry:
+        entry = self._entries.get(ticket)
+        if entry is None:
+            entry = TicketEntry(ticket, source, now)
+            self._entries[ticket] = entry
+            self.transitions[SEEN] += 1
+        return entry
+
+    def claim(self, ticket: str, source: Optional[str] = None) -> bool:
+        # 识别到ticket时调用 尚未提交过时标记为submitted并返回True 由调用方发起登录
+        # 已提交或已结束的ticket返回False并计入duplicates 调用方不应再请求/qrcode/scan
+        now = time.time()
+        with self._lock:
+            self._sweep(now)
+            entry = self._observe(ticket, source, now)
+            if entry.state != SEEN:
+                entry.sightings += 1
+                self.duplicates[entry.state] += 1
+                return False
+            if now < entry.retry_at:
+                entry.sightings += 1
+                self.duplicates["backoff"] += 1
+                return False
+            entry.state = SUBMITTED
+            entry.updated = now
+            self.transitions[SUBMITTED] += 1
+            return True
+
+    def release(self, ticket: str, message: Optional[str] = None, backoff: Optional[float] = None):
+        # 登录因超时/网络异常/扫描停止而未得到接口结果时调用 票据退回seen 退避期过后可再次claim
+        with self._lock:
+            entry = self._entries.get(ticket)
+            if entry is None or entry.state != SUBMITTED:
+                return
+            now = time.time()
+            entry.state = SEEN
+            entry.updated = now
+            entry.message = message
+            entry.retries += 1
+            entry.retry_at = now + (self.retry_backoff if backoff is None else backoff)
+            self.transitions["released"] += 1
+
+    def resolve(self, ticket: str, won: bool, message: Optional[str] = None):
+        with self._lock:
+            entry = self._entries.get(ticket)
+            if entry is None or entry.state not in (SEEN, SUBMITTED, EXPIRED):
+                return
+            entry.state = WON if won else LOST
+            entry.updated = time.time()
+            entry.message = message
+            self.transitions[entry.state] += 1
+
+    def state(self, ticket: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(ticket)
+            return entry.state if entry else None
+
+    def recent(self, limit: int = 20) -> list:
+        with self._lock:
+            entries = list(self._entries.values())[-limit:]
+            return [entry.to_dict() for entry in reversed(entries)]
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._sweep(time.time())
+            states = Counter(entry.state for entry in self._entries.values())
+            return {
+                "tracked": len(self._entries),
+                "states": dict(states),
+                "transitions": dict(self.transitions),
+                "duplicates": sum(self.duplicates.values()),
+                "duplicates_by_state": dict(self.duplicates),
+                "evicted": self.evicted,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+ticket_ledger = TicketLedger()
@@ -0,0 +1,87 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+
+class GameTokenCache:
+    # 按账户缓存game_token 扫描会话开始时预取 到期前在后台刷新
+    # 识别到二维码后只需 scan + confirm 两次请求 省去getGameToken这一次往返
+    # fetch_fn(account) -> (game_token, error) 为协程 刷新任务运行在调用track时的事件循环上
+    def __init__(self, fetch_fn: Callable[..., Awaitable], ttl: float = 300.0, refresh_margin: float = 60.0):
+        self.fetch_fn = fetch_fn
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self._entries: Dict[str, Tuple[str, float]] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._wakeups: Dict[str, asyncio.Event] = {}
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.errors = 0
+
+    @staticmethod
+    def _key(account) -> str:
+        return str(account.uid)
+
+    def get(self, account) -> Optional[str]:
+        # 返回未过期的缓存token 没有则返回None 由调用方在关键路径上现取
+        entry = self._entries.get(self._key(account))
+        if entry and time.time() - entry[1] < self.ttl:
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        return None
+
+    async def prefetch(self, account) -> Tuple[Optional[str], Optional[str]]:
+        token, error = await self.fetch_fn(account)
+        if token:
+            self._entries[self._key(account)] = (token, time.time())
+            self.refreshes += 1
+        else:
+            self.errors += 1
+        return token, error
+
+    async def _refresh_loop(self, account, wakeup: asyncio.Event):
+        while True:
+            token, _ = await self.prefetch(account)
+            # 成功时在过期前刷新 失败时稍后重试 consume会提前唤醒
+            delay = max(1.0, self.ttl - self.refresh_margin) if token else min(10.0, self.ttl)
+            wakeup.clear()
+            try:
+                await asyncio.wait_for(wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def track(self, account):
+        # 扫描会话开始时调用 立即在后台预取并保持刷新 直到untrack
+        key = self._key(account)
+        if key in self._tasks:
+            return
+        wakeup = asyncio.Event()
+        self._wakeups[key] = wakeup
+        self._tasks[key] = asyncio.create_task(self._refresh_loop(account, wakeup))
+
+    def untrack(self, account=None):
+        keys = [self._key(account)] if account is not None else list(self._tasks)
+        for key in keys:
+            task = self._tasks.pop(key, None)
+            if task:
+                task.cancel()
+            self._wakeups.pop(key, None)
+
+    def consume(self, account):
+        # token用于确认登录后作废 已跟踪的账户立即在后台换一个新的
+        key = self._key(account)
+        self._entries.pop(key, None)
+        if key in self._wakeups:
+            self._wakeups[key].set()
+
+    def stats(self) -> dict:
+        return {
+            "cached": len(self._entries),
+            "tracked": len(self._tasks),
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "errors": self.errors,
+        }
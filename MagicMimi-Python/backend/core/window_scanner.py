@@ -1,153 +1,237 @@
 import asyncio
 import time
-import re
-import cv2
-import numpy as np
-from pyzbar import pyzbar
-
-try:
-    import win32gui
-    import win32ui
-    import win32con
-except ImportError:
-    pass
 
 from .config import AppState, ScanSettings
+from .decode_ladder import DecodeLadder
+from .qr_prefilter import PrefilteredDecoder
+from .executors import run_in
+from .frame_source import FrameSource, WindowFrameSource, open_frame_source
+from .qr_decoders import decoder_registry
+from .scan_pipeline import ScanEngine
+from .scan_supervisor import IDLE, ScanSupervisor
+from .scan_scheduler import AdaptiveScanScheduler
+from .ticket_ledger import extract_expiry, extract_ticket, ticket_ledger
 
 class WindowScanner:
     def __init__(self, app_state: AppState, websocket_manager):
         self.app_state = app_state
         self.websocket_manager = websocket_manager
-        self.last_qr_data = None
-        self.last_qr_time = 0
-        self._scan_task = None # 用于持有asyncio任务
+        self.ticket_ledger = ticket_ledger # 所有扫描会话共享 同一ticket只提交一次
+        self.pipeline = None # 当前扫描引擎 所有目标窗口共享截图和解码线程 用于查询调度与统计指标
+        self.warmer = None # 当前扫描会话的连接预热器
+        self.api = None # 当前扫描会话的MihoyoAPI 用于查询对冲请求统计
+        self.ladder = None # 最近一次扫描会话的解码阶梯 会话结束后保留 用于查看各级命中情况
+        self.prefilter = None # 最近一次扫描会话的定位图案初筛 未启用时为None
+        # 扫描会话运行在监督器的工作线程事件循环中 不占用FastAPI的事件循环
+        self.supervisor = ScanSupervisor(self._scan_loop, on_state=self._on_state_change)
 
     def start(self, settings: ScanSettings):
-        if self.app_state.is_scanning:
-            return False, "扫描任务已在运行中"
-        
-        self.app_state.is_scanning = True
-        # 创建一个异步任务 并在FastAPI的事件循环中运行它
-        self._scan_task = asyncio.create_task(self._scan_loop(settings))
-        return True, "扫描任务已启动"
+        return self.supervisor.start(settings)
+
+    def stop(self, reason: str = "手动停止"):
+        if self.supervisor.stop(reason) is None:
+            return False, "没有正在运行的扫描任务"
+        return True, "扫描任务正在停止"
+
+    async def wait_stopped(self, timeout: float = 5.0) -> bool:
+        return await self.supervisor.wait_stopped(timeout)
+
+    def session_status(self):
+        return self.supervisor.status()
+
+    def _on_state_change(self, status: dict):
+        # 在监督器线程中调用 状态变化直接推送给页面
+        self.app_state.is_scanning = status["state"] != IDLE
+        self.websocket_manager.publish({"type": "scan_state", **status})
+        if status["state"] == IDLE:
+            reason = status["stop_reason"] or "会话结束"
+            if status["last_error"]:
+                self.websocket_manager.log(f"扫描异常结束 {status['last_error']}", "ERROR")
+            elif status["stop_latency_ms"] is not None:
+                self.websocket_manager.log(f"扫描已停止 {reason} 耗时 {status['stop_latency_ms']}ms", "INFO")
+            else:
+                self.websocket_manager.log(f"扫描已停止 {reason}", "INFO")
+            self.websocket_manager.publish({"type": "fps", "value": "0.0"})
+
+    def metrics(self):
+        pipeline = self.pipeline
+        return pipeline.stats() if pipeline else None
 
-    def stop(self):
-        if not self.app_state.is_scanning or not self._scan_task:
+    def connection_metrics(self):
+        # 连接预热状态 以及登录各步骤的对冲请求统计(由首个请求还是对冲请求胜出)
+        warmer, api = self.warmer, self.api
+        if not warmer:
+            return None
+        return {**warmer.stats(), "hedging": api.hedge.stats() if api else {}}
+
+    async def _report_warmup(self, warmer):
+        ready = await warmer.wait_ready(timeout=15)
+        if warmer.state == "stopped":
+            return
+        if ready:
+            await self.websocket_manager.broadcast_log(f"登录连接预热完成 {warmer.warm_connections}条连接就绪", "INFO")
+        else:
+            await self.websocket_manager.broadcast_log(f"登录连接预热未完成 {warmer.last_error or '超时'}", "WARN")
+
+    @staticmethod
+    def target_id(hwnd: int = None, source: str = None) -> str:
+        return source if source else f"hwnd:{hwnd}"
+
+    @staticmethod
+    def _open_source(hwnd: int = None, source: str = None) -> FrameSource:
+        # 指定了source时使用回放帧源 便于在无窗口环境下测试吞吐
+        if source:
+            return open_frame_source(source)
+        return WindowFrameSource(hwnd)
+
+    def _initial_targets(self, settings: ScanSettings):
+        targets = [(settings.hwnd, settings.source)]
+        targets += [(hwnd, None) for hwnd in settings.hwnds if hwnd != settings.hwnd]
+        return targets
+
+    def add_target(self, hwnd: int = None, source: str = None):
+        # 向运行中的扫描会话添加目标窗口 不需要重启扫描
+        engine = self.pipeline
+        if engine is None:
             return False, "没有正在运行的扫描任务"
+        target_id = self.target_id(hwnd, source)
+        if target_id in engine.targets:
+            return False, f"目标 {target_id} 已在扫描中"
+        try:
+            engine.add_target(target_id, self._open_source(hwnd, source), self._new_scheduler())
+        except Exception as e:
+            return False, f"无法打开目标 {e}"
+        return True, target_id
 
-        # 取消异步任务
-        if not self._scan_task.done():
-            self._scan_task.cancel()
+    def remove_target(self, target_id: str):
+        engine = self.pipeline
+        if engine is None:
+            return False, "没有正在运行的扫描任务"
+        if not engine.remove_target(target_id):
+            return False, f"目标 {target_id} 不存在"
+        return True, target_id
+
+    def list_targets(self):
+        engine = self.pipeline
+        return list(engine.targets) if engine else []
+
+    @staticmethod
+    def _new_scheduler():
+        # 截图频率由自适应调度器决定 画面静止时退避到max_interval
+        return AdaptiveScanScheduler(min_interval=0.05, max_interval=0.5)
+
+    async def _handle_qr(self, target_id: str, qr_data: str, settings: ScanSettings, mihoyo_api):
+        ticket = extract_ticket(qr_data)
+        if not ticket:
+            return
+        account = await run_in("io", self.app_state.accounts.get, settings.account_name)
+        if not account:
+            # 只登记不提交 账户补上后同一ticket仍可提交
+            if self.ticket_ledger.observe(ticket, target_id).sightings == 1:
+                await self.websocket_manager.broadcast_log(f"错误 找不到账户 {settings.account_name}", "ERROR")
+            return
+        # 已提交或已结束的ticket直接丢弃 不再请求/qrcode/scan
+        if not self.ticket_ledger.claim(ticket, target_id):
+            return
+        await self.websocket_manager.broadcast_log(f"发现有效游戏二维码 来自 {target_id}", "SUCCESS")
         
-        # 立即更新状态
-        self.app_state.is_scanning = False
-        self._scan_task = None
+        # 登录请求期间流水线仍在继续截图和解码
+        try:
+            success, message, retryable = await mihoyo_api.request_game_login(ticket, settings.game_type, account, extract_expiry(qr_data))
+        except asyncio.CancelledError:
+            # 扫描在登录过程中被停止 票据未得到接口结果 退回seen 其他会话可以立即提交
+            self.ticket_ledger.release(ticket, "扫描已停止", backoff=0)
+            raise
+        if retryable:
+            # 超时或网络异常不代表票据已失效 退避后再次识别到时重新提交
+            self.ticket_ledger.release(ticket, message)
+            await self.websocket_manager.broadcast_log(f"抢码请求失败 稍后重试 {message}", "WARN")
+            return
+        self.ticket_ledger.resolve(ticket, success, message)
         
-        # 创建一个一次性任务来广播停止日志
-        asyncio.create_task(self._post_stop_cleanup())
+        log_level = "SUCCESS" if success else "ERROR"
+        game_name = "原神" if settings.game_type == 4 else "星穹铁道"
+        log_message = f"抢码成功 账户 {account.uid[:4]}... 游戏 {game_name}" if success else f"抢码失败 {message}"
+        await self.websocket_manager.broadcast_log(log_message, log_level)
         
-        return True, "扫描任务已停止"
-    
-    async def _post_stop_cleanup(self):
-        await self.websocket_manager.broadcast_log("扫描已停止", "INFO")
-        await self.websocket_manager.broadcast_fps(0.0)
-
-    def _capture_frame(self, hwnd):
-        # 这是一个纯同步的截图函数 不适合直接await
-        # 它会在异步循环中被调用
-        try:
-            rect = win32gui.GetClientRect(hwnd)
-            width, height = rect[2], rect[3]
-            if width <= 0 or height <= 0: return None
-
-            hwndDC = win32gui.GetWindowDC(hwnd)
-            mfcDC = win32ui.CreateDCFromHandle(hwndDC)
-            saveDC = mfcDC.CreateCompatibleDC()
-            saveBitMap = win32ui.CreateBitmap()
-            saveBitMap.CreateCompatibleBitmap(mfcDC, width, height)
-            saveDC.SelectObject(saveBitMap)
-            # 使用PrintWindow截图 支持后台窗口
-            win32gui.PrintWindow(hwnd, saveDC.GetSafeHdc(), 3)
-            
-            bmpstr = saveBitMap.GetBitmapBits(True)
-            img = np.frombuffer(bmpstr, dtype='uint8').reshape((height, width, 4))
-            img_gray = cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY)
-
-            win32gui.DeleteObject(saveBitMap.GetHandle())
-            saveDC.DeleteDC()
-            mfcDC.DeleteDC()
-            win32gui.ReleaseDC(hwnd, hwndDC)
-            return img_gray
-        except Exception:
-            return None
+        if success: await asyncio.sleep(5) # 成功后等待一下
 
-    async def _scan_loop(self, settings: ScanSettings):
+    async def _scan_loop(self, settings: ScanSettings, mark_running=lambda: None):
+        # 由监督器运行 停止时任务被取消 返回值为会话自行结束的原因
         from .mihoyo_api import MihoyoAPI
         mihoyo_api = MihoyoAPI()
-        
-        scan_interval = 0.5 # 秒
-        
-        while self.app_state.is_scanning:
-            start_time = time.time()
-            
-            # 检查窗口句柄是否有效
-            if not win32gui.IsWindow(settings.hwnd):
-                await self.websocket_manager.broadcast_log("目标窗口已关闭 扫描自动停止", "ERROR")
-                break
-            
-            # 在事件循环中运行同步的截图函数 避免阻塞
-            frame = await asyncio.to_thread(self._capture_frame, settings.hwnd)
+        self.api = mihoyo_api
+        pipeline = None
+        report_task = None
+        # 准备阶段可能因截图源打开失败而出错 也可能被停止取消 同样要走到finally释放资源
+        try:
+            # 扫描开始时即解析DNS并建立TLS连接 抢码时直接复用
+            self.warmer = mihoyo_api.warmer
+            self.warmer.start()
+            report_task = asyncio.create_task(self._report_warmup(self.warmer))
+            # 扫描开始时即预取游戏Token 并在过期前后台刷新 识别到二维码后只需scan+confirm
+            account = await run_in("io", self.app_state.accounts.get, settings.account_name)
+            if account:
+                mihoyo_api.token_cache.track(account)
             
-            if frame is None:
-                # 截图失败可能因为窗口最小化
-                await asyncio.sleep(1)
-                continue
+            # 首次使用时会在后台线程中完成解码后端校准
+            decoder = await run_in("cpu", decoder_registry.get)
+            decoder = self.ladder = DecodeLadder(decoder, settings.decode_steps)
+            # 初筛在阶梯之前 只有含定位图案的区域才进入阶梯
+            self.prefilter = PrefilteredDecoder(decoder) if settings.prefilter else None
+            decoder = self.prefilter or decoder
+            # 截图和解码在引擎线程中进行 这里只作为登录调度方消费识别结果
+            # 所有目标窗口共享截图和解码线程 总帧率和CPU预算按目标数平分
+            pipeline = ScanEngine(
+                decoder,
+                scheduler_factory=self._new_scheduler,
+                max_fps=settings.max_fps,
+                cpu_budget=0.5,
+            )
+            for hwnd, source in self._initial_targets(settings):
+                # 打开截图源涉及窗口句柄查询或读取回放文件 不在事件循环中进行
+                frame_source = await run_in("io", self._open_source, hwnd, source)
+                try:
+                    pipeline.add_target(self.target_id(hwnd, source), frame_source)
+                except Exception:
+                    frame_source.close()
+                    raise
+            self.pipeline = pipeline
+            pipeline.start()
+            mark_running()
+            last_fps_time = time.time()
+            reported_lost = 0
             
-            codes = pyzbar.decode(frame, symbols=[pyzbar.ZBarSymbol.QRCODE])
-            if codes:
-                for code in codes:
-                    try:
-                        qr_data = code.data.decode('utf-8')
-                        if qr_data == self.last_qr_data and time.time() - self.last_qr_time < 5:
-                            continue
-                        
-                        match = re.search(r"ticket=([a-fA-F0-9]+)", qr_data)
-                        if match:
-                            self.last_qr_data = qr_data
-                            self.last_qr_time = time.time()
-                            await self.websocket_manager.broadcast_log("发现有效游戏二维码", "SUCCESS")
-                            
-                            account = self.app_state.accounts.get(settings.account_name)
-                            if not account:
-                                await self.websocket_manager.broadcast_log(f"错误 找不到账户 {settings.account_name}", "ERROR")
-                                continue
-                            
-                            # 在事件循环中运行同步的网络请求函数
-                            success, message = await asyncio.to_thread(
-                                mihoyo_api.attempt_game_login,
-                                match.group(1),
-                                settings.game_type,
-                                account
-                            )
-                            
-                            log_level = "SUCCESS" if success else "ERROR"
-                            game_name = "原神" if settings.game_type == 4 else "星穹铁道"
-                            log_message = f"抢码成功 账户 {account.uid[:4]}... 游戏 {game_name}" if success else f"抢码失败 {message}"
-                            await self.websocket_manager.broadcast_log(log_message, log_level)
-                            
-                            if success: await asyncio.sleep(5) # 成功后等待一下
-                            break
-                    except Exception as e:
-                        await self.websocket_manager.broadcast_log(f"处理二维码时出错 {e}", "WARN")
-
-            elapsed = time.time() - start_time
-            fps = 1 / elapsed if elapsed > 0 else 0
-            await self.websocket_manager.broadcast_fps(fps)
-
-            sleep_time = scan_interval - elapsed
-            if sleep_time > 0:
-                await asyncio.sleep(sleep_time)
+            while pipeline.running:
+                result = await run_in("wait", pipeline.qr_queue.get, 0.5)
+                
+                if time.time() - last_fps_time >= 1:
+                    last_fps_time = time.time()
+                    await self.websocket_manager.broadcast_fps(pipeline.sample_fps())
+                
+                for target_id in pipeline.lost_targets[reported_lost:]:
+                    reported_lost += 1
+                    await self.websocket_manager.broadcast_log(f"目标窗口 {target_id} 已关闭 已从扫描中移除", "WARN")
+                
+                if result is None:
+                    continue
+                try:
+                    await self._handle_qr(*result, settings, mihoyo_api)
+                except Exception as e:
+                    await self.websocket_manager.broadcast_log(f"处理二维码时出错 {e}", "WARN")
+        finally:
+            # 预热结果还未报告时会话已结束 不再报告
+            if report_task is not None:
+                report_task.cancel()
+            await mihoyo_api.close()
+            # 已加入引擎的截图源由引擎关闭 未启动的引擎同样适用
+            if pipeline is not None:
+                await run_in("io", pipeline.stop, wait_decoders=False)
+            self.pipeline = None
+            self.warmer = None
+            self.api = None
         
-        # 循环结束后重置状态 确保主线程知道任务已停止
-        if self.app_state.is_scanning:
-            self.stop()
\ No newline at end of file
+        if pipeline.source_lost:
+            await self.websocket_manager.broadcast_log("所有目标窗口已关闭 扫描自动停止", "ERROR")
+            return "所有目标窗口已关闭"
+        return "扫描引擎已停止"
@@ -1,9 +1,14 @@
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
+import asyncio
 import os
 
-from .api import system, settings, accounts, scanner, ws
+from .api import system, settings, accounts, scanner, ws, metrics
+from .core.qr_decoders import decoder_registry
+from .core.executors import get_executor, shutdown_executors
+from .core.log_ring import log_ring
+from .core.loop_monitor import loop_monitor
 
 # 定义前端静态文件的路径
 STATIC_DIR = os.path.join(os.path.dirname(__file__), "..", "frontend", "dist")
@@ -19,8 +24,30 @@ app.include_router(system.router, prefix="/api", tags=["System"])
 app.include_router(settings.router, prefix="/api", tags=["Settings"])
 app.include_router(accounts.router, prefix="/api", tags=["Accounts & Login"])
 app.include_router(scanner.router, prefix="/api", tags=["Scanner Control"])
+app.include_router(metrics.router, prefix="/api", tags=["Metrics"])
 app.include_router(ws.router, tags=["WebSocket"])
 
+@app.on_event("startup")
+async def calibrate_decoders():
+    # 启动时在后台线程中校准解码后端 不阻塞服务启动
+    asyncio.get_running_loop().run_in_executor(get_executor("cpu"), decoder_registry.calibrate)
+
+@app.on_event("startup")
+async def start_loop_monitor():
+    # 事件循环卡顿时把时长和阻塞位置写入日志
+    def report_stall(stall):
+        where = stall["stack"][-1] if stall["stack"] else "未知位置"
+        ws.manager.log(f"事件循环卡顿 {stall['duration_ms']}ms 位于 {where}", "WARN")
+    loop_monitor.on_stall = report_stall
+    loop_monitor.start()
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    scanner.scanner_instance.supervisor.shutdown()
+    loop_monitor.stop()
+    shutdown_executors()
+    log_ring.close()
+
 # 托管静态文件
 app.mount("/assets", StaticFiles(directory=os.path.join(STATIC_DIR, "assets")), name="assets")
 
@@ -0,0 +1,278 @@
+import argparse
+import asyncio
+import base64
+import io
+import ssl
+import time
+
+import qrcode
+
+from backend.core.config import Account
+from backend.core.hedging import HedgePolicy
+from backend.core.account_health import AccountHealthChecker
+from backend.core.metrics import login_step_seconds
+from backend.core.mihoyo_api import MihoyoAPI
+from backend.core.qr_ticket_pool import QrTicketPool
+from backend.core.request_budget import BULK, RequestBudget
+from backend.core.ticket_ledger import TicketLedger
+from tests.standin import StandInServer
+
+# 登录链路基准 在本地启动一个模拟米哈游接口的替身服务 注入网络延迟
+# 比较识别到二维码之后到确认登录完成的耗时
+# 用法示例 python bench_login.py --latency 40 --rounds 50
+
+# 除出站预算对比外 其余测试不受限速影响
+UNLIMITED = RequestBudget(default_limit=(1e9, 1e9))
+
+
+class FifoBudget(RequestBudget):
+    # 对照组 所有请求不分通道 按先来后到排队
+    async def acquire(self, host, lane=BULK):
+        await super().acquire(host, BULK)
+
+
+async def measure(api, account, rounds, warm):
+    timings = []
+    if warm:
+        api.token_cache.track(account)
+    for i in range(rounds):
+        if warm:
+            # 等待后台预取完成 模拟扫描会话中已有热token的状态
+            deadline = time.time() + 2
+            while api.token_cache.get(account) is None and time.time() < deadline:
+                await asyncio.sleep(0.005)
+        start = time.perf_counter()
+        ok, message = await api.attempt_game_login(f"{i:032x}", 4, account)
+        timings.append(time.perf_counter() - start)
+        if not ok:
+            raise RuntimeError(message)
+    await api.close()
+    timings.sort()
+    return {
+        "p50_ms": timings[len(timings) // 2] * 1000,
+        "p95_ms": timings[int(len(timings) * 0.95) - 1] * 1000,
+        "p99_ms": timings[max(int(len(timings) * 0.99) - 1, 0)] * 1000,
+        "mean_ms": sum(timings) / len(timings) * 1000,
+        "connections": api.http.opened,
+    }
+
+
+async def measure_first_login(make_api, account, rounds, prewarm):
+    # 每轮使用新的MihoyoAPI 只计第一次登录 对比会话开始时是否预热连接
+    timings = []
+    warm_counts = []
+    for i in range(rounds):
+        api = make_api()
+        if prewarm:
+            api.warmer.start()
+            if not await api.warmer.wait_ready(timeout=5):
+                raise RuntimeError(f"连接预热失败 {api.warmer.last_error}")
+            warm_counts.append(api.warmer.warm_connections)
+        start = time.perf_counter()
+        ok, message = await api.attempt_game_login(f"{i:032x}", 4, account)
+        timings.append(time.perf_counter() - start)
+        await api.close()
+        if not ok:
+            raise RuntimeError(message)
+    timings.sort()
+    return {
+        "p50_ms": timings[len(timings) // 2] * 1000,
+        "p95_ms": timings[int(len(timings) * 0.95) - 1] * 1000,
+        "mean_ms": sum(timings) / len(timings) * 1000,
+        "warm_connections": max(warm_counts) if warm_counts else 0,
+    }
+
+
+async def measure_duplicates(server, make_api, account, tickets, windows, repeats):
+    # 模拟多个窗口交替识别到若干二维码 每个ticket被识别 windows*repeats 次
+    # 对比旧的单槽去重(只记住上一个二维码)与票据台账发出的/qrcode/scan请求数
+    sightings = [f"{t:032x}" for _ in range(repeats) for t in range(tickets) for _ in range(windows)]
+    scan_path = "/hk4e_cn/combo/panda/qrcode/scan"
+    results = {}
+    for mode in ("single_slot", "ledger"):
+        api = make_api()
+        before = server.requests[scan_path]
+        ledger = TicketLedger()
+        last = None
+        tasks = []
+        for ticket in sightings:
+            if mode == "single_slot":
+                if ticket == last:
+                    continue
+                last = ticket
+            elif not ledger.claim(ticket):
+                continue
+            tasks.append(asyncio.create_task(api.attempt_game_login(ticket, 4, account)))
+        await asyncio.gather(*tasks)
+        await api.close()
+        results[mode] = {
+            "sightings": len(sightings),
+            "scan_requests": server.requests[scan_path] - before,
+            "redundant": server.requests[scan_path] - before - tickets,
+            "suppressed": ledger.stats()["duplicates"] if mode == "ledger" else len(sightings) - len(tasks),
+        }
+    return results
+
+
+async def measure_qr(make_api, rounds):
+    # 对比 /login/qr 的三种取得二维码方式的耗时
+    # png: 现场申请并用qrcode.make编码PNG(原实现) svg: 现场申请并编码SVG pool: 从预先申请的二维码池中取出
+    def render_png(url):
+        buffered = io.BytesIO()
+        qrcode.make(url).save(buffered, format="PNG")
+        return base64.b64encode(buffered.getvalue()).decode("utf-8")
+
+    results = {}
+    for mode in ("png", "svg", "pool"):
+        api = make_api()
+        pool = QrTicketPool(api)
+        timings = []
+        for _ in range(rounds):
+            if mode == "pool":
+                pool.start()
+                # 等待后台补满 只计取用本身
+                while pool.stats()["available"] < pool.size:
+                    await asyncio.sleep(0.005)
+            start = time.perf_counter()
+            if mode == "png":
+                ticket_data, error = await api.fetch_qr_ticket()
+                if not error:
+                    render_png(ticket_data["url"])
+            elif mode == "svg":
+                _, error = await api.fetch_qr_code()
+            else:
+                _, error = await pool.take()
+            timings.append(time.perf_counter() - start)
+            if error:
+                raise RuntimeError(error)
+        pool.stop()
+        await api.close()
+        timings.sort()
+        results[mode] = {
+            "p50_ms": timings[len(timings) // 2] * 1000,
+            "p95_ms": timings[int(len(timings) * 0.95) - 1] * 1000,
+            "hits": pool.hits,
+        }
+    return results
+
+
+async def measure_health_check(server, count, concurrency, rate):
+    # 批量检查count个账户 其中每10个有1个Stoken失效
+    api = MihoyoAPI(hosts=server.host_map(), max_per_host=concurrency, budget=UNLIMITED)
+    checker = AccountHealthChecker(api, concurrency=concurrency, rate=rate, burst=concurrency)
+    accounts = [
+        (f"acc{i}", Account(uid=str(100000 + i), cookie=f"stuid={100000 + i};stoken={'dead' if i % 10 == 0 else 'ok'};"))
+        for i in range(count)
+    ]
+    start = time.perf_counter()
+    await checker.check_all(accounts)
+    elapsed = time.perf_counter() - start
+    await api.close()
+    return {"elapsed": elapsed, "summary": checker.report()["summary"]}
+
+
+async def measure_under_load(server, ssl_context, account, rounds, budget, count):
+    # 批量检查count个账户的同时逐个登录 两者共用同一个预算
+    # 登录时现取游戏Token 与批量检查争用api-takumi主机的限速
+    api = MihoyoAPI(hosts=server.host_map(), ssl_context=ssl_context, budget=budget)
+    bulk_api = MihoyoAPI(hosts=server.host_map(), ssl_context=ssl_context, max_per_host=32, budget=budget)
+    checker = AccountHealthChecker(bulk_api, concurrency=32, rate=1000.0, burst=32)
+    accounts = [(f"acc{i}", Account(uid=str(100000 + i), cookie=f"stuid={100000 + i};stoken=ok;")) for i in range(count)]
+    bulk = asyncio.create_task(checker.check_all(accounts))
+    # 等批量检查先把队列占满
+    await asyncio.sleep(0.2)
+    timings = []
+    for i in range(rounds):
+        if bulk.done():
+            break
+        start = time.perf_counter()
+        ok, message = await api.attempt_game_login(f"{i:032x}", 4, account)
+        timings.append(time.perf_counter() - start)
+        if not ok:
+            raise RuntimeError(message)
+    await bulk
+    await api.close()
+    await bulk_api.close()
+    if not timings:
+        raise RuntimeError("批量检查结束前没有完成登录 请增大--budget-load")
+    timings.sort()
+    return {
+        "rounds": len(timings),
+        "p50_ms": timings[len(timings) // 2] * 1000,
+        "p95_ms": timings[max(int(len(timings) * 0.95) - 1, 0)] * 1000,
+        "max_ms": timings[-1] * 1000,
+        "budget": budget.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MagicMimi 登录链路基准")
+    parser.add_argument("--latency", type=float, default=30.0, help="替身服务每个请求的基础延迟(ms)")
+    parser.add_argument("--tail", type=float, default=0.0, help="长尾请求追加的延迟(ms)")
+    parser.add_argument("--tail-ratio", type=float, default=0.0, help="出现长尾延迟的概率")
+    parser.add_argument("--rounds", type=int, default=30)
+    parser.add_argument("--certfile", help="启用TLS替身服务 证书需包含localhost 如 openssl req -x509 -newkey rsa:2048 -nodes -subj /CN=localhost -addext subjectAltName=DNS:localhost")
+    parser.add_argument("--keyfile", help="TLS私钥 与证书在同一文件时可省略")
+    parser.add_argument("--windows", type=int, default=3, help="重复识别测试中同时扫描的窗口数")
+    parser.add_argument("--health", type=int, default=200, help="账户批量检查测试的账户数")
+    parser.add_argument("--health-concurrency", type=int, default=16)
+    parser.add_argument("--health-rate", type=float, default=200.0, help="账户批量检查每秒最多发起的请求数")
+    parser.add_argument("--hedge-delay", type=float, default=None, help="对冲请求的延迟(ms) 不填则按各步骤p95自适应")
+    parser.add_argument("--budget-load", type=int, default=300, help="出站预算对比中后台批量检查的账户数 0为跳过")
+    parser.add_argument("--budget-rate", type=float, default=50.0, help="出站预算对比中每台主机每秒的请求数")
+    parser.add_argument("--handshake", type=float, default=0.0, help="每条新连接注入的握手延迟(ms)")
+    args = parser.parse_args()
+
+    server = StandInServer(
+        args.latency, args.tail, args.tail_ratio,
+        certfile=args.certfile, keyfile=args.keyfile, handshake_ms=args.handshake,
+    ).start()
+    ssl_context = ssl.create_default_context(cafile=args.certfile) if args.certfile else None
+    make_api = lambda: MihoyoAPI(hosts=server.host_map(), ssl_context=ssl_context, budget=UNLIMITED)
+    account = Account(uid="100000001", cookie="stuid=100000001;stoken=bench;mid=bench;")
+    try:
+        for warm in (False, True):
+            api = make_api()
+            result = asyncio.run(measure(api, account, args.rounds, warm))
+            label = "预取游戏Token" if warm else "现取游戏Token"
+            print(f"{label}: p50 {result['p50_ms']:.1f} ms  p95 {result['p95_ms']:.1f} ms  平均 {result['mean_ms']:.1f} ms  新建连接 {result['connections']}")
+        # 同样预取游戏Token 对比scan/confirm是否对冲 长尾由--tail和--tail-ratio注入
+        hedge_delay = args.hedge_delay / 1000 if args.hedge_delay is not None else None
+        for label, hedge in (("不对冲", HedgePolicy(max_attempts=1)), ("对冲请求", HedgePolicy(delay=hedge_delay))):
+            api = MihoyoAPI(hosts=server.host_map(), ssl_context=ssl_context, hedge=hedge, budget=UNLIMITED)
+            result = asyncio.run(measure(api, account, args.rounds, True))
+            print(f"{label}: p50 {result['p50_ms']:.1f} ms  p95 {result['p95_ms']:.1f} ms  p99 {result['p99_ms']:.1f} ms  新建连接 {result['connections']}")
+            for step, stats in hedge.stats().items():
+                print(f"  {step:<10} 对冲 {stats['hedged']}/{stats['requests']}  首个请求胜出 {stats['primary_wins']}  对冲请求胜出 {stats['hedge_wins']}  延迟 {stats['delay_ms']} ms")
+        for prewarm in (False, True):
+            result = asyncio.run(measure_first_login(make_api, account, args.rounds, prewarm))
+            label = "首次登录(预热连接)" if prewarm else "首次登录(冷启动)"
+            print(f"{label}: p50 {result['p50_ms']:.1f} ms  p95 {result['p95_ms']:.1f} ms  平均 {result['mean_ms']:.1f} ms  预热连接 {result['warm_connections']}")
+        dup = asyncio.run(measure_duplicates(server, make_api, account, tickets=4, windows=args.windows, repeats=5))
+        for mode, label in (("single_slot", "单槽去重"), ("ledger", "票据台账")):
+            result = dup[mode]
+            print(f"{label}: 识别 {result['sightings']} 次  scan请求 {result['scan_requests']}  冗余 {result['redundant']}  抑制 {result['suppressed']}")
+        qr = asyncio.run(measure_qr(make_api, args.rounds))
+        for mode, label in (("png", "现场申请+PNG"), ("svg", "现场申请+SVG"), ("pool", "二维码池")):
+            result = qr[mode]
+            print(f"登录二维码({label}): p50 {result['p50_ms']:.3f} ms  p95 {result['p95_ms']:.3f} ms")
+        if args.health:
+            result = asyncio.run(measure_health_check(server, args.health, args.health_concurrency, args.health_rate))
+            print(f"账户批量检查: {args.health} 个账户 耗时 {result['elapsed']:.2f}s  结果 {result['summary']}")
+        if args.budget_load:
+            # 后台批量检查占满限速时的登录耗时 对比不分通道排队与按优先级通道调度
+            limit = (args.budget_rate, 20.0)
+            for label, budget in (("不分通道", FifoBudget(default_limit=limit)), ("优先级通道", RequestBudget(default_limit=limit))):
+                result = asyncio.run(measure_under_load(server, ssl_context, account, args.rounds, budget, args.budget_load))
+                takumi = result["budget"]["hosts"]["api-takumi.mihoyo.com"]
+                print(f"批量检查期间登录({label}): 登录 {result['rounds']} 次  p50 {result['p50_ms']:.1f} ms  p95 {result['p95_ms']:.1f} ms  最大 {result['max_ms']:.1f} ms  api-takumi最大排队 {takumi['max_queued']}")
+        for step, child in sorted(login_step_seconds.children.items()):
+            summary = child.summary()
+            print(f"  {step:<10} p50 {summary['p50_ms']} ms  p95 {summary['p95_ms']} ms  共 {summary['count']} 次")
+        print(f"替身服务请求计数 {dict(server.requests)}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
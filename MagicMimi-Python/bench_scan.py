@@ -0,0 +1,364 @@
+import argparse
+import asyncio
+import re
+import time
+
+from backend.core.decode_ladder import DecodeLadder
+from backend.core.executors import run_in
+from backend.core.frame_gate import FrameChangeGate
+from backend.core.frame_source import open_frame_source, to_gray
+from backend.core.loop_monitor import LoopLagMonitor
+from backend.core.qr_decoders import decoder_registry
+from backend.core.qr_prefilter import FinderPrefilter, PrefilteredDecoder, measure_prefilter, prefilter_corpus
+from backend.core.roi_tracker import RoiTracker
+from backend.core.scan_pipeline import ScanEngine, ScanPipeline
+from backend.core.scan_scheduler import AdaptiveScanScheduler
+
+# 无窗口环境下的扫描吞吐基准 截图->解码->提取ticket 登录步骤只计数不发请求
+# 用法示例 python bench_scan.py --source dir:frames/ --frames 500
+#          python bench_scan.py --source synthetic:1920x1080:https://x/?ticket=abc123 --seconds 10
+#          python bench_scan.py --source standin:1920x1080 --frames 1000  (统计截图缓冲的每帧分配次数)
+#          python bench_scan.py --source dir:frames/ --pipeline 4 --seconds 10  (多线程流水线吞吐)
+#          python bench_scan.py --source dir:frames/ --loop-lag --seconds 5  (扫描时的事件循环延迟)
+#          python bench_scan.py --source dir:frames/ --ladder half,full,contrast --frames 200  (解码阶梯各级命中率)
+#          python bench_scan.py --source dir:frames/ --pipeline 2 --prefilter --seconds 10  (开启定位图案初筛 与不加--prefilter对比帧率)
+#          python bench_scan.py --source dir:frames/ --prefilter-check --frames 200  (初筛在测试样本和录制画面上的漏检率)
+
+
+def scan_decoder(decoder_name=None, prefilter=False):
+    decoder = decoder_registry.select(decoder_name) if decoder_name else decoder_registry.get()
+    # 基准中不抽查被拒帧 只计初筛本身
+    return PrefilteredDecoder(decoder, audit_every=0) if prefilter else decoder
+
+
+def run_benchmark(source_spec, max_frames=None, max_seconds=None, fps=None, use_roi=True, use_gate=True, decoder_name=None, prefilter=False):
+    decoder = scan_decoder(decoder_name, prefilter)
+    decode_qr = decoder.decode
+    source = open_frame_source(source_spec, fps=fps)
+    roi_tracker = RoiTracker() if use_roi else None
+    frame_gate = FrameChangeGate() if use_gate else None
+    stage_time = {"capture": 0.0, "gate": 0.0, "convert": 0.0, "decode": 0.0}
+    frames, tickets = 0, 0
+    start = time.perf_counter()
+    try:
+        while source.is_alive():
+            if max_frames is not None and frames >= max_frames:
+                break
+            if max_seconds is not None and time.perf_counter() - start >= max_seconds:
+                break
+
+            t0 = time.perf_counter()
+            frame = source.read()
+            t1 = time.perf_counter()
+            if frame is None:
+                continue
+            changed = frame_gate.should_decode(frame) if frame_gate else True
+            t_gate = time.perf_counter()
+            stage_time["capture"] += t1 - t0
+            stage_time["gate"] += t_gate - t1
+            frames += 1
+            if not changed:
+                continue
+            gray = to_gray(frame)
+            t2 = time.perf_counter()
+            codes = roi_tracker.decode(gray, decode_qr) if roi_tracker else decode_qr(gray)
+            t3 = time.perf_counter()
+
+            for code in codes:
+                if re.search(r"ticket=([a-fA-F0-9]+)", code.data.decode("utf-8", "ignore")):
+                    tickets += 1
+            stage_time["convert"] += t2 - t_gate
+            stage_time["decode"] += t3 - t2
+    finally:
+        source.close()
+
+    elapsed = time.perf_counter() - start
+    backend = getattr(getattr(source, "session", None), "backend", None)
+    return {
+        "decoder": decoder.name,
+        "frames": frames,
+        "tickets": tickets,
+        "elapsed": elapsed,
+        "fps": frames / elapsed if elapsed > 0 else 0.0,
+        "stage_ms": {k: (v / frames * 1000 if frames else 0.0) for k, v in stage_time.items()},
+        "allocations_per_frame": getattr(backend, "allocations_per_frame", None),
+        "roi": roi_tracker.stats() if roi_tracker else None,
+        "gate": frame_gate.stats() if frame_gate else None,
+        "prefilter": decoder.stats() if prefilter else None,
+    }
+
+
+def run_pipeline_benchmark(source_spec, workers, seconds, fps=None, decoder_name=None, adaptive=False, prefilter=False):
+    decoder = scan_decoder(decoder_name, prefilter)
+    # 默认不限速 测量流水线的最大吞吐 adaptive时使用与扫描任务相同的自适应调度
+    scheduler = AdaptiveScanScheduler() if adaptive else AdaptiveScanScheduler(min_interval=0.0, max_interval=0.0, cpu_budget=1.0)
+    pipeline = ScanPipeline(open_frame_source(source_spec, fps=fps), decoder, workers=workers, scheduler=scheduler)
+    tickets = 0
+    start = time.perf_counter()
+    pipeline.start()
+    try:
+        while pipeline.running and time.perf_counter() - start < seconds:
+            result = pipeline.qr_queue.get(timeout=0.2)
+            if result and re.search(r"ticket=([a-fA-F0-9]+)", result[1]):
+                tickets += 1
+    finally:
+        pipeline.stop()
+    elapsed = time.perf_counter() - start
+    stats = pipeline.stats()
+    return {
+        "decoder": decoder.name,
+        "elapsed": elapsed,
+        "capture_fps": stats["captured"] / elapsed,
+        "decode_fps": stats["decoded"] / elapsed,
+        "tickets": tickets,
+        "stats": stats,
+    }
+
+
+def run_engine_benchmark(source_spec, windows, workers, seconds, fps=None, decoder_name=None, max_fps=None, prefilter=False):
+    # 模拟同时扫描多个窗口 每个目标各自打开一份帧源 共享截图和解码线程
+    decoder = scan_decoder(decoder_name, prefilter)
+    engine = ScanEngine(
+        decoder,
+        decode_workers=workers,
+        scheduler_factory=lambda: AdaptiveScanScheduler(min_interval=0.0, max_interval=0.0, cpu_budget=1.0),
+        max_fps=max_fps,
+    )
+    for i in range(windows):
+        engine.add_target(f"window-{i}", open_frame_source(source_spec, fps=fps))
+    start = time.perf_counter()
+    engine.start()
+    try:
+        while engine.running and time.perf_counter() - start < seconds:
+            engine.qr_queue.get(timeout=0.2)
+    finally:
+        stats = engine.stats()
+        engine.stop()
+    elapsed = time.perf_counter() - start
+    return {
+        "decoder": decoder.name,
+        "elapsed": elapsed,
+        "capture_fps": stats["captured"] / elapsed,
+        "decode_fps": stats["decoded"] / elapsed,
+        "targets": {
+            target_id: {
+                "fps": target["captured"] / elapsed,
+                "decode_fps": target["decoded"] / elapsed,
+                "hit_rate": target["hit_rate"],
+            }
+            for target_id, target in stats["targets"].items()
+        },
+    }
+
+
+def run_loop_lag_benchmark(source_spec, windows, workers, seconds, fps=None, decoder_name=None):
+    # 扫描满速运行时测量事件循环延迟
+    # inline: 在事件循环中直接截图和解码(旧版_scan_loop的做法) engine: 截图和解码在引擎线程中 事件循环只等待结果
+    decoder = decoder_registry.select(decoder_name) if decoder_name else decoder_registry.get()
+
+    async def inline(monitor):
+        sources = [open_frame_source(source_spec, fps=fps) for _ in range(windows)]
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            for source in sources:
+                frame = source.read()
+                if frame is not None:
+                    decoder.decode(to_gray(frame))
+            await asyncio.sleep(0)
+
+    async def engine(monitor):
+        engine = ScanEngine(
+            decoder,
+            decode_workers=workers,
+            scheduler_factory=lambda: AdaptiveScanScheduler(min_interval=0.0, max_interval=0.0, cpu_budget=1.0),
+        )
+        for i in range(windows):
+            engine.add_target(f"window-{i}", await run_in("io", open_frame_source, source_spec, fps=fps))
+        engine.start()
+        start = time.perf_counter()
+        try:
+            while engine.running and time.perf_counter() - start < seconds:
+                await run_in("wait", engine.qr_queue.get, 0.2)
+        finally:
+            await run_in("io", engine.stop)
+
+    async def measure(mode):
+        monitor = LoopLagMonitor(name=f"bench-{mode}")
+        monitor.start()
+        try:
+            await (inline if mode == "inline" else engine)(monitor)
+        finally:
+            monitor.stop()
+        return monitor.stats()
+
+    return decoder.name, {mode: asyncio.run(measure(mode)) for mode in ("inline", "engine")}
+
+
+def run_ladder_benchmark(source_spec, steps, max_frames=None, max_seconds=None, decoder_name=None):
+    # 每帧都全帧解码 对比只用原图解码与解码阶梯 阶梯统计各级的命中率和耗时
+    decoder = decoder_registry.select(decoder_name) if decoder_name else decoder_registry.get()
+    grays = []
+    source = open_frame_source(source_spec)
+    start = time.perf_counter()
+    try:
+        while max_frames is None or len(grays) < max_frames:
+            if max_seconds is not None and time.perf_counter() - start >= max_seconds:
+                break
+            frame = source.read()
+            if frame is None:
+                break
+            grays.append(to_gray(frame))
+    finally:
+        source.close()
+    ladder = DecodeLadder(decoder, steps)
+    results = {}
+    for mode, decode in (("full", decoder.decode), ("ladder", ladder.decode)):
+        # 分别统计识别成功与未识别的帧 阶梯在前者上省时间 在后者上多花时间
+        timings = {True: [], False: []}
+        for gray in grays:
+            t0 = time.perf_counter()
+            hit = bool(decode(gray))
+            timings[hit].append(time.perf_counter() - t0)
+        mean_ms = lambda values: sum(values) / len(values) * 1000 if values else 0.0
+        results[mode] = {
+            "hits": len(timings[True]),
+            "mean_ms": mean_ms(timings[True] + timings[False]),
+            "hit_ms": mean_ms(timings[True]),
+            "miss_ms": mean_ms(timings[False]),
+        }
+    return decoder.name, len(grays), results, ladder.stats()
+
+
+def run_prefilter_check(source_spec=None, max_frames=None, decoder_name=None):
+    # 在合成测试样本上按二维码位置统计漏检和误报
+    # 给出帧源时再以整帧解码的结果为准 统计录制画面中整帧能识别 经初筛后却识别不到的帧
+    prefilter = FinderPrefilter()
+    corpus = measure_prefilter(prefilter)
+    if not source_spec:
+        return corpus, None
+    decoder = decoder_registry.select(decoder_name) if decoder_name else decoder_registry.get()
+    filtered = PrefilteredDecoder(decoder, prefilter, audit_every=0)
+    source = open_frame_source(source_spec)
+    frames = positives = missed = 0
+    timings = {"full": 0.0, "prefilter": 0.0}
+    try:
+        while max_frames is None or frames < max_frames:
+            frame = source.read()
+            if frame is None:
+                break
+            gray = to_gray(frame)
+            frames += 1
+            t0 = time.perf_counter()
+            expected = decoder.decode(gray)
+            t1 = time.perf_counter()
+            found = filtered.decode(gray)
+            t2 = time.perf_counter()
+            timings["full"] += t1 - t0
+            timings["prefilter"] += t2 - t1
+            if expected:
+                positives += 1
+                missed += not found
+    finally:
+        source.close()
+    recorded = {
+        "frames": frames,
+        "positives": positives,
+        "missed": missed,
+        "false_negative_rate": missed / positives if positives else None,
+        "full_ms": timings["full"] / frames * 1000 if frames else 0.0,
+        "prefilter_ms": timings["prefilter"] / frames * 1000 if frames else 0.0,
+        "rejected": filtered.rejected,
+    }
+    return corpus, recorded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MagicMimi 扫描吞吐基准")
+    parser.add_argument("--source", help="帧源 dir:路径 / video:路径 / synthetic:宽x高[:内容] / standin:宽x高[:内容]")
+    parser.add_argument("--frames", type=int, default=None, help="最多处理的帧数")
+    parser.add_argument("--seconds", type=float, default=None, help="最长运行时间")
+    parser.add_argument("--fps", type=float, default=None, help="回放帧率 不填则尽快回放")
+    parser.add_argument("--no-roi", action="store_true", help="关闭ROI跟踪 每帧都全帧解码")
+    parser.add_argument("--no-gate", action="store_true", help="关闭画面变化检测 每帧都解码")
+    parser.add_argument("--pipeline", type=int, default=0, metavar="WORKERS", help="使用多线程流水线 指定解码线程数")
+    parser.add_argument("--adaptive", action="store_true", help="流水线模式下使用自适应截图调度")
+    parser.add_argument("--windows", type=int, default=1, help="流水线模式下模拟同时扫描的窗口数")
+    parser.add_argument("--max-fps", type=float, default=None, help="多窗口时所有窗口合计的截图帧率上限")
+    parser.add_argument("--decoder", default=None, help="指定解码后端 pyzbar/opencv/wechat/zxingcpp 不填则自动校准")
+    parser.add_argument("--prefilter", action="store_true", help="解码前先用定位图案初筛 不加此项则每帧都完整解码")
+    parser.add_argument("--prefilter-check", action="store_true", help="测量定位图案初筛的漏检率 给出--source时同时统计录制画面")
+    parser.add_argument("--ladder", nargs="?", const="", default=None, metavar="STEPS", help="对比解码阶梯与只用原图解码 可指定步骤 如 half,full,contrast")
+    parser.add_argument("--loop-lag", action="store_true", help="测量扫描满速运行时事件循环的调度延迟")
+    args = parser.parse_args()
+    if args.frames is None and args.seconds is None:
+        args.seconds = 10.0
+
+    if args.prefilter_check:
+        corpus, recorded = run_prefilter_check(args.source, args.frames, args.decoder)
+        print(f"测试样本: 含二维码 {corpus['positives']} 帧  漏检率 {corpus['false_negative_rate']:.1%}  不含二维码 {corpus['negatives']} 帧  误报率 {corpus['false_positive_rate']:.1%}  p50 {corpus['p50_ms']} ms  最大 {corpus['max_ms']} ms")
+        if recorded:
+            rate = f"{recorded['false_negative_rate']:.1%}" if recorded["false_negative_rate"] is not None else "-"
+            print(f"录制画面: {recorded['frames']} 帧  整帧可识别 {recorded['positives']}  初筛后漏检 {recorded['missed']} ({rate})  初筛拒绝 {recorded['rejected']}")
+            print(f"  整帧解码 {recorded['full_ms']:.1f} ms/帧  初筛+区域解码 {recorded['prefilter_ms']:.1f} ms/帧")
+        return
+
+    if not args.source:
+        parser.error("需要 --source")
+
+    if args.ladder is not None:
+        decoder_name, frames, results, ladder = run_ladder_benchmark(args.source, args.ladder, args.frames, args.seconds, args.decoder)
+        print(f"解码后端 {decoder_name}  帧数 {frames}")
+        for mode, label in (("full", "原图解码"), ("ladder", "解码阶梯")):
+            result = results[mode]
+            print(f"{label}: 识别 {result['hits']}/{frames} 帧  平均 {result['mean_ms']:.1f} ms/帧  识别成功的帧 {result['hit_ms']:.1f} ms  未识别的帧 {result['miss_ms']:.1f} ms")
+        for step in ladder["steps"]:
+            hit_rate = f"{step['hit_rate']:.1%}" if step["hit_rate"] is not None else "-"
+            print(f"  {step['step']:<10} 尝试 {step['attempts']:4d}  命中 {step['hits']:4d} ({hit_rate})  跳过 {step['skipped']}  平均 {step['mean_ms']} ms  p95 {step['p95_ms']} ms")
+        return
+
+    if args.loop_lag:
+        decoder_name, results = run_loop_lag_benchmark(args.source, args.windows, args.pipeline or 2, args.seconds or 10.0, args.fps, args.decoder)
+        print(f"解码后端 {decoder_name}  窗口 {args.windows}")
+        for mode, label in (("inline", "事件循环内解码"), ("engine", "引擎线程解码")):
+            stats = results[mode]
+            lag = stats["lag"]
+            print(f"{label}: 循环延迟 p50 {lag['p50_ms']} ms  p99 {lag['p99_ms']} ms  最大 {stats['max_lag_ms']} ms  卡顿(>{stats['threshold_ms']:.0f}ms) {stats['stall_count']} 次")
+        return
+
+    if args.pipeline and args.windows > 1:
+        result = run_engine_benchmark(args.source, args.windows, args.pipeline, args.seconds or 10.0, args.fps, args.decoder, args.max_fps, args.prefilter)
+        print(f"解码后端 {result['decoder']}  解码线程 {args.pipeline}  窗口 {args.windows}")
+        print(f"合计截图 {result['capture_fps']:.1f} FPS  解码 {result['decode_fps']:.1f} FPS")
+        for target_id, target in result["targets"].items():
+            print(f"  {target_id:<10} 截图 {target['fps']:6.1f} FPS  解码 {target['decode_fps']:6.1f} FPS  命中率 {target['hit_rate']:.1%}")
+        return
+
+    if args.pipeline:
+        result = run_pipeline_benchmark(args.source, args.pipeline, args.seconds or 10.0, args.fps, args.decoder, args.adaptive, args.prefilter)
+        stats = result["stats"]
+        print(f"解码后端 {result['decoder']}  解码线程 {args.pipeline}")
+        print(f"截图 {result['capture_fps']:.1f} FPS  解码 {result['decode_fps']:.1f} FPS  命中ticket {result['tickets']}")
+        print(f"  丢弃过期帧 {stats['dropped_frames']}  跳过未变化帧 {stats['gate']['skipped']}")
+        print(f"  调度器 {stats['scheduler']}")
+        return
+
+    result = run_benchmark(args.source, args.frames, args.seconds, args.fps, use_roi=not args.no_roi, use_gate=not args.no_gate, decoder_name=args.decoder, prefilter=args.prefilter)
+    print(f"解码后端 {result['decoder']}")
+    print(f"帧数 {result['frames']}  耗时 {result['elapsed']:.2f}s  FPS {result['fps']:.1f}  命中ticket {result['tickets']}")
+    for stage, ms in result["stage_ms"].items():
+        print(f"  {stage:<8} {ms:8.3f} ms/帧")
+    if result["allocations_per_frame"] is not None:
+        print(f"  截图缓冲分配 {result['allocations_per_frame']:.4f} 次/帧")
+    if result["roi"]:
+        roi = result["roi"]
+        print(f"  ROI扫描 {roi['roi_scans']} (命中 {roi['roi_hits']})  全帧扫描 {roi['full_scans']} (命中 {roi['full_hits']})")
+    if result["gate"]:
+        gate = result["gate"]
+        print(f"  跳过未变化帧 {gate['skipped']}/{gate['frames']} ({gate['skip_rate']:.1%})  强制解码 {gate['forced']}")
+    if result["prefilter"]:
+        prefilter = result["prefilter"]
+        print(f"  初筛拒绝 {prefilter['rejected']}/{prefilter['frames']}  平均 {prefilter['latency']['mean_ms']} ms")
+
+
+if __name__ == "__main__":
+    main()
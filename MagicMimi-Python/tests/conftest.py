@@ -0,0 +1,71 @@
+import os
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+# 后端配置在导入时按相对路径打开账户库和设置文件 测试在临时目录中运行 不碰真实的账户数据
+# 后端模块一律在切换目录之后(测试模块或fixture内)导入
+os.chdir(tempfile.mkdtemp(prefix="magicmimi-tests-"))
+
+
+def serve(**options):
+    from tests.standin import StandInServer
+
+    server = StandInServer(latency_ms=1.0, **options).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def stand_in():
+    # 本地替身服务 模拟米哈游登录相关接口 见tests/standin.py
+    yield from serve()
+
+
+@pytest.fixture
+def account():
+    from backend.core.config import Account
+
+    return Account(uid="100001", cookie="stuid=100001;stoken=ok;")
+
+
+@pytest.fixture
+def make_api():
+    # 按主机映射构造MihoyoAPI 通常指向替身服务 make_api(stand_in.host_map())
+    from backend.core.mihoyo_api import MihoyoAPI
+    from backend.core.request_budget import RequestBudget
+
+    def make(hosts, **options):
+        # 默认不限速 验证出站预算的测试自行传入budget
+        options.setdefault("budget", RequestBudget(default_limit=(1e9, 1e9)))
+        return MihoyoAPI(hosts=hosts, **options)
+
+    return make
+
+
+@pytest.fixture
+def tls_cert(tmp_path):
+    # 自签名的localhost证书 客户端以它作为信任根
+    path = tmp_path / "standin.pem"
+    try:
+        subprocess.run(
+            ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+             "-subj", "/CN=localhost", "-addext", "subjectAltName=DNS:localhost",
+             "-keyout", str(path), "-out", str(path)],
+            check=True, capture_output=True,
+        )
+    except (OSError, subprocess.CalledProcessError) as e:
+        pytest.skip(f"无法生成测试证书 {e}")
+    return str(path)
+
+
+@pytest.fixture
+def tls_stand_in(tls_cert):
+    # 以自签名证书提供服务的替身 客户端需以tls_cert为信任根
+    yield from serve(certfile=tls_cert)
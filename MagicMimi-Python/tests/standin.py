@@ -0,0 +1,113 @@
+import json
+import random
+import ssl
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 模拟米哈游登录相关接口的本地替身服务 可注入网络延迟 长尾和握手延迟 也可以TLS方式提供服务
+# 测试(tests/conftest.py的stand_in fixture)和登录链路基准bench_login.py共用
+# requests按路径统计收到的请求 另有HEAD(心跳)和connections(新连接)两项
+
+STANDIN_HOSTS = ("hk4e-sdk.mihoyo.com", "api-sdk.mihoyo.com", "api-takumi.mihoyo.com", "passport-api.mihoyo.com")
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 响应头和响应体分两次写出 关闭Nagle避免与客户端延迟ACK叠加出40ms级别的额外延迟
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, data):
+        time.sleep(self.server.latency())
+        body = json.dumps(data).encode("utf-8")
+        # 写出响应之前计数 客户端收到响应时计数一定已经更新
+        self.server.requests[self.path.split("?")[0]] += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        # 连接预热的心跳请求
+        self.server.requests["HEAD"] += 1
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        if self.path.startswith("/auth/api/getGameToken"):
+            # cookie中带stoken=dead的账户模拟Stoken失效
+            if "stoken=dead" in (self.headers.get("cookie") or ""):
+                return self._reply({"retcode": -100, "message": "登录失效"})
+            return self._reply({"retcode": 0, "data": {"game_token": f"gt-{time.time_ns()}"}})
+        self._reply({"retcode": -1, "message": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        if self.path.endswith("/qrcode/scan"):
+            return self._reply({"retcode": 0, "message": "OK"})
+        if self.path.endswith("/qrcode/confirm"):
+            return self._reply({"retcode": 0, "message": "OK"})
+        if self.path.endswith("/qrcode/fetch"):
+            ticket = f"{random.getrandbits(128):032x}"
+            return self._reply({"retcode": 0, "data": {"url": f"https://user.mihoyo.com/?ticket={ticket}", "ticket": ticket}})
+        if self.path.endswith("/qrcode/query"):
+            return self._reply({"retcode": 0, "data": {"stat": "Init"}})
+        self._reply({"retcode": -1, "message": "not found"})
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency_ms=20.0, tail_ms=0.0, tail_ratio=0.0, port=0, certfile=None, keyfile=None, handshake_ms=0.0):
+        super().__init__(("127.0.0.1", port), StandInHandler)
+        self.latency_ms = latency_ms
+        self.tail_ms = tail_ms
+        self.tail_ratio = tail_ratio
+        self.handshake_ms = handshake_ms
+        self.requests = Counter()
+        self.tls = certfile is not None
+        if self.tls:
+            # TLS替身 证书需包含localhost 客户端用同一证书作为信任根
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile, keyfile)
+            self.socket = context.wrap_socket(self.socket, server_side=True, do_handshake_on_connect=False)
+
+    def finish_request(self, request, client_address):
+        # 新连接额外注入握手延迟 模拟真实网络下TCP+TLS握手的往返
+        self.requests["connections"] += 1
+        time.sleep(self.handshake_ms / 1000)
+        if self.tls:
+            request.do_handshake()
+        super().finish_request(request, client_address)
+
+    def handle_error(self, request, client_address):
+        # 被取消的对冲请求由客户端直接关闭连接 不打印断开连接的异常
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+    def latency(self) -> float:
+        # 基础延迟 另有tail_ratio的概率追加长尾延迟
+        extra = self.tail_ms if random.random() < self.tail_ratio else 0.0
+        return (self.latency_ms + extra) / 1000
+
+    @property
+    def base_url(self) -> str:
+        if self.tls:
+            return f"https://localhost:{self.server_address[1]}"
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def host_map(self) -> dict:
+        return {host: self.base_url for host in STANDIN_HOSTS}
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
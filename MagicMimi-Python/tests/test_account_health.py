@@ -0,0 +1,127 @@
+import asyncio
+import socket
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend.core.account_health import ERROR, HEALTHY, INVALID, AccountHealthChecker
+from backend.core.account_store import AccountStore
+from backend.core.config import Account
+
+
+def make_accounts(count):
+    # 每10个账户中有1个Stoken失效 替身服务对stoken=dead返回业务错误
+    return [
+        (f"acc{i}", Account(uid=str(100000 + i), cookie=f"stuid={100000 + i};stoken={'dead' if i % 10 == 0 else 'ok'};"))
+        for i in range(count)
+    ]
+
+
+def test_bulk_check_classifies_accounts(stand_in, make_api):
+    async def main():
+        api = make_api(stand_in.host_map(), max_per_host=16)
+        checker = AccountHealthChecker(api, concurrency=16, rate=1000, burst=100)
+        try:
+            results = await checker.check_all(make_accounts(100))
+        finally:
+            await api.close()
+        report = checker.report()
+        assert report["summary"] == {HEALTHY: 90, INVALID: 10, ERROR: 0}
+        assert report["progress"] == {"done": 100, "total": 100}
+        assert results["acc0"]["status"] == INVALID
+        assert results["acc1"]["status"] == HEALTHY
+        assert all(result["checked_at"] >= report["started_at"] for result in results.values())
+
+    asyncio.run(main())
+
+
+def test_bulk_check_respects_concurrency_cap(stand_in, make_api):
+    async def main():
+        api = make_api(stand_in.host_map(), max_per_host=16)
+        in_flight = peak = 0
+        request = api.request_game_token
+
+        async def counting(account, **kwargs):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            try:
+                return await request(account, **kwargs)
+            finally:
+                in_flight -= 1
+
+        api.request_game_token = counting
+        checker = AccountHealthChecker(api, concurrency=4, rate=1000, burst=100)
+        try:
+            await checker.check_all(make_accounts(40))
+        finally:
+            await api.close()
+        assert peak == 4
+
+    asyncio.run(main())
+
+
+def test_bulk_check_respects_rate_limit(stand_in, make_api):
+    async def main():
+        api = make_api(stand_in.host_map(), max_per_host=16)
+        checker = AccountHealthChecker(api, concurrency=16, rate=50, burst=5)
+        start = time.perf_counter()
+        try:
+            await checker.check_all(make_accounts(20))
+        finally:
+            await api.close()
+        # 突发的5个之后 其余15个按每秒50个发出
+        assert time.perf_counter() - start >= 15 / 50 * 0.9
+
+    asyncio.run(main())
+
+
+def test_unreachable_server_is_error_not_invalid(make_api):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    async def main():
+        api = make_api({"api-takumi.mihoyo.com": f"http://127.0.0.1:{port}"})
+        checker = AccountHealthChecker(api, rate=1000, burst=100)
+        try:
+            results = await checker.check_all(make_accounts(3))
+        finally:
+            await api.close()
+        assert {result["status"] for result in results.values()} == {ERROR}
+
+    asyncio.run(main())
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    from backend.api import accounts, settings
+    from backend.core.config import app_state
+
+    store = AccountStore(
+        str(tmp_path / "accounts.db"),
+        factory=lambda uid, cookie: Account(uid=uid, cookie=cookie),
+        fields=lambda acc: (acc.uid, acc.cookie),
+    )
+    monkeypatch.setattr(app_state, "accounts", store)
+    monkeypatch.setattr(accounts.health_checker, "results", {})
+    # 与main.py相同的注册顺序
+    app = FastAPI()
+    app.include_router(settings.router, prefix="/api")
+    app.include_router(accounts.router, prefix="/api")
+    yield TestClient(app), store, accounts.health_checker
+    store.close()
+
+
+def test_delete_account_forgets_health_result(client):
+    client, store, checker = client
+    store["main"] = Account(uid="100001", cookie="stuid=100001;stoken=ok;")
+    checker.results["main"] = {"uid": "100001", "status": HEALTHY}
+    response = client.delete("/api/accounts/main")
+    assert response.status_code == 200
+    assert "main" not in store
+    assert "main" not in checker.results
+    assert client.get("/api/accounts/health").json()["accounts"] == {}
+    assert client.delete("/api/accounts/main").status_code == 404
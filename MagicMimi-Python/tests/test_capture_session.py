@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from backend.core.capture_session import CaptureSession, CountingCaptureBackend
+from backend.core.frame_source import CaptureFrameSource
+
+
+def make_session(width=64, height=48, slots=4):
+    frames = [np.full((height, width, 4), value, dtype=np.uint8) for value in (10, 20, 30)]
+    backend = CountingCaptureBackend(width, height, frames)
+    return CaptureSession(backend, slots=slots), backend
+
+
+def test_no_allocations_after_warmup():
+    session, backend = make_session()
+    session.read()
+    assert backend.allocations == 4
+    backend.allocations = backend.grabs = 0
+    for _ in range(200):
+        assert session.read() is not None
+    assert backend.grabs == 200
+    assert backend.allocations_per_frame == 0
+
+
+def test_frames_land_in_ring_without_copies():
+    session, backend = make_session(slots=4)
+    frames = [session.read() for _ in range(8)]
+    # 每slots帧复用同一块缓冲 返回的就是缓冲本身
+    assert all(frames[i] is frames[i + 4] for i in range(4))
+    assert len({id(frame) for frame in frames}) == 4
+    # 第5次截图(源图像 grabs % 3 == 1)写回了第1块缓冲
+    assert frames[0][0, 0, 0] == 20 and frames[1][0, 0, 0] == 30
+
+
+def test_rebuild_only_on_resize():
+    session, backend = make_session(width=64, height=48)
+    for _ in range(10):
+        session.read()
+    assert backend.rebuilds == 1
+    backend.frames = None
+    backend.resize(80, 60)
+    frame = session.read()
+    assert frame.shape == (60, 80, 4)
+    for _ in range(10):
+        session.read()
+    assert backend.rebuilds == 2
+    assert backend.allocations == 8
+
+
+def test_close_releases_ring():
+    session, backend = make_session()
+    session.read()
+    session.close()
+    session.read()
+    assert backend.rebuilds == 2
+
+
+class FailingCaptureBackend(CountingCaptureBackend):
+    def __init__(self, error):
+        super().__init__(64, 48)
+        self.error = error
+
+    def grab(self, slot):
+        raise self.error
+
+
+def test_capture_source_drops_only_capture_failures():
+    # 截图调用失败(如窗口已销毁)记为丢帧 其他异常照常抛出
+    source = CaptureFrameSource(CaptureSession(FailingCaptureBackend(OSError("BitBlt失败"))))
+    assert source.read() is None
+    source = CaptureFrameSource(CaptureSession(FailingCaptureBackend(ValueError("程序错误"))))
+    with pytest.raises(ValueError):
+        source.read()
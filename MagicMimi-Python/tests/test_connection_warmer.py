@@ -0,0 +1,130 @@
+import asyncio
+import socket
+import ssl
+import time
+
+import pytest
+
+from backend.core.mihoyo_api import LOGIN_HOSTS
+from backend.core.request_budget import RequestBudget
+
+
+@pytest.fixture
+def make_tls_api(make_api, tls_cert):
+    # 以自签名证书为信任根 连接TLS替身服务
+    def make(hosts, **options):
+        return make_api(hosts, ssl_context=ssl.create_default_context(cafile=tls_cert), **options)
+
+    return make
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_warm_connections_are_reused_by_login(tls_stand_in, make_tls_api, account):
+    async def main():
+        api = make_tls_api(tls_stand_in.host_map())
+        try:
+            api.warmer.start()
+            assert await api.warmer.wait_ready(timeout=5)
+            stats = api.warmer.stats()
+            assert stats["state"] == "ready"
+            assert stats["warm_connections"] == api.warmer.connections
+            opened = api.http.opened
+            success, message = await api.attempt_game_login("ticket", 4, account)
+            assert success, message
+            # 登录链路全部走预热好的TLS连接 没有新的握手
+            assert api.http.opened == opened
+        finally:
+            await api.close()
+
+    asyncio.run(main())
+
+
+def test_heartbeats_keep_connections_alive_within_budget(tls_stand_in, make_tls_api):
+    async def main():
+        budget = RequestBudget(default_limit=(1e9, 1e9))
+        api = make_tls_api(tls_stand_in.host_map(), budget=budget)
+        api.warmer.heartbeat_interval = 0.05
+        try:
+            api.warmer.start()
+            assert await api.warmer.wait_ready(timeout=5)
+            opened = api.http.opened
+            await asyncio.sleep(0.3)
+            assert api.warmer.heartbeats > 0
+            assert api.warmer.state == "ready"
+            assert tls_stand_in.requests["HEAD"] > 0
+            # 心跳复用已有连接 不会反复握手
+            assert api.http.opened == opened
+            # 保活请求走bulk通道 计入主机预算 每个主机至多有一个已取得许可还未送达的心跳
+            granted = sum(host["granted"]["bulk"] for host in budget.stats()["hosts"].values())
+            assert 0 <= granted - tls_stand_in.requests["HEAD"] <= len(api.warmer.urls)
+        finally:
+            await api.close()
+
+    asyncio.run(main())
+
+
+def test_unreachable_host_reports_degraded(make_tls_api):
+    async def main():
+        url = f"https://localhost:{free_port()}"
+        api = make_tls_api({host: url for host in LOGIN_HOSTS})
+        api.warmer.retry_interval = 10
+        try:
+            api.warmer.start()
+            assert not await api.warmer.wait_ready(timeout=5)
+            stats = api.warmer.stats()
+            assert stats["state"] == "degraded"
+            assert stats["warm_connections"] == 0
+            assert stats["last_error"]
+        finally:
+            await api.close()
+
+    asyncio.run(main())
+
+
+def test_stop_releases_waiters(tls_stand_in, make_tls_api):
+    async def main():
+        api = make_tls_api(tls_stand_in.host_map())
+        api.warmer.start()
+        waiter = asyncio.ensure_future(api.warmer.wait_ready(timeout=5))
+        api.warmer.stop()
+        start = time.monotonic()
+        assert not await waiter
+        assert time.monotonic() - start < 1
+        assert api.warmer.state == "stopped"
+        await api.close()
+
+    asyncio.run(main())
+
+
+def test_failed_heartbeat_round_does_not_stop_the_warmer(tls_stand_in, make_tls_api):
+    async def main():
+        api = make_tls_api(tls_stand_in.host_map())
+        api.warmer.heartbeat_interval = 0.05
+        ping, calls = api.http.ping, []
+
+        async def flaky_ping(url, before=None):
+            calls.append(url)
+            if len(calls) == 1:
+                raise RuntimeError("心跳异常")
+            return await ping(url, before)
+
+        api.http.ping = flaky_ping
+        try:
+            api.warmer.start()
+            assert await api.warmer.wait_ready(timeout=5)
+            await asyncio.sleep(0.3)
+            # 首轮心跳抛出异常后保活任务仍在运行
+            assert not api.warmer._task.done()
+            assert api.warmer.failures == 1
+            assert "心跳异常" in api.warmer.last_error
+            assert api.warmer.heartbeats > 0
+            assert api.warmer.state == "ready"
+        finally:
+            await api.close()
+
+    asyncio.run(main())
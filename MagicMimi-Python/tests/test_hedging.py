@@ -0,0 +1,159 @@
+import asyncio
+import itertools
+import time
+
+import pytest
+
+from backend.core.hedging import HedgePolicy
+from backend.core.metrics import Histogram
+from backend.core.mihoyo_api import GAME_TOKEN_ATTEMPT_SECONDS, GAME_TOKEN_SECONDS
+from backend.core.request_budget import RequestBudget
+
+def ok(value):
+    return {"retcode": 0, "value": value}
+
+
+def test_slow_primary_is_won_by_hedge():
+    async def main():
+        policy = HedgePolicy(delay=0.02)
+        delays = iter([0.5, 0.0])
+
+        async def request():
+            delay = next(delays)
+            await asyncio.sleep(delay)
+            return ok(delay)
+
+        start = time.perf_counter()
+        result = await policy.run("step", request)
+        assert result == ok(0.0)
+        assert time.perf_counter() - start < 0.2
+        stats = policy.stats()["step"]
+        assert (stats["hedged"], stats["hedge_wins"], stats["primary_wins"]) == (1, 1, 0)
+
+    asyncio.run(main())
+
+
+def test_fast_primary_is_not_hedged():
+    async def main():
+        policy = HedgePolicy(delay=0.1)
+        calls = itertools.count()
+
+        async def request():
+            next(calls)
+            return ok(1)
+
+        assert await policy.run("step", request) == ok(1)
+        assert next(calls) == 1
+        assert policy.stats()["step"]["hedged"] == 0
+
+    asyncio.run(main())
+
+
+def test_failed_primary_is_retried_immediately():
+    async def main():
+        policy = HedgePolicy(delay=5.0)
+        attempts = iter([ConnectionResetError("reset"), None])
+
+        async def request():
+            error = next(attempts)
+            if error:
+                raise error
+            return ok(2)
+
+        start = time.perf_counter()
+        assert await policy.run("step", request) == ok(2)
+        assert time.perf_counter() - start < 0.5
+
+    asyncio.run(main())
+
+
+def test_business_error_is_returned_when_nothing_better_arrives():
+    async def main():
+        policy = HedgePolicy(delay=0.01)
+
+        async def request():
+            return {"retcode": -1}
+
+        assert await policy.run("step", request, accept=lambda data: data["retcode"] == 0) == {"retcode": -1}
+        assert policy.stats()["step"]["failed"] == 1
+
+    asyncio.run(main())
+
+
+def test_timeout_raises():
+    async def main():
+        policy = HedgePolicy(delay=0.01)
+
+        async def request():
+            await asyncio.sleep(1)
+
+        with pytest.raises(asyncio.TimeoutError, match="超过0.05秒未返回"):
+            await policy.run("step", request, timeout=0.05)
+
+    asyncio.run(main())
+
+
+def test_delay_follows_histogram_p95():
+    policy = HedgePolicy(min_samples=20, default_delay=0.2)
+    histogram = Histogram()
+    assert policy.delay_for(histogram) == 0.2
+    for _ in range(100):
+        histogram.observe(0.03)
+    assert 0.025 <= policy.delay_for(histogram) <= 0.05
+
+
+def test_hedged_game_token_against_stand_in(stand_in, make_api, account):
+    # 第一个请求遇到长尾延迟 对冲请求先返回
+    latencies = iter([0.5])
+    stand_in.latency = lambda: next(latencies, 0.001)
+
+    async def main():
+        api = make_api(stand_in.host_map(), hedge=HedgePolicy(delay=0.05))
+        try:
+            start = time.perf_counter()
+            token, error = await api.fetch_game_token(account)
+            assert token and error is None
+            assert time.perf_counter() - start < 0.4
+            assert api.hedge.stats()["game_token"]["hedge_wins"] == 1
+        finally:
+            await api.close()
+
+    asyncio.run(main())
+
+
+def test_expired_ticket_sends_nothing(stand_in, make_api, account):
+    async def main():
+        api = make_api(stand_in.host_map(), hedge=HedgePolicy(delay=0.05))
+        try:
+            success, message = await api.attempt_game_login("ticket", 4, account, expires_at=time.time() - 1)
+        finally:
+            await api.close()
+        assert (success, message) == (False, "二维码已过期")
+        assert sum(count for path, count in stand_in.requests.items() if path != "connections") == 0
+
+    asyncio.run(main())
+
+
+def test_hedge_delay_ignores_bulk_requests_and_budget_wait(stand_in, make_api, account):
+    async def main():
+        # 每秒10个令牌 突发1个 第二个请求要在预算上等待约0.1秒
+        api = make_api(stand_in.host_map(), hedge=HedgePolicy(delay=0.05), budget=RequestBudget(default_limit=(10.0, 1.0)))
+        try:
+            _, attempts_before, _ = GAME_TOKEN_ATTEMPT_SECONDS.snapshot()
+            # 不对冲的批量检查不计入对冲延迟的样本
+            await api.request_game_token(account)
+            assert GAME_TOKEN_ATTEMPT_SECONDS.snapshot()[1] == attempts_before
+            _, total_before, total_sum_before = GAME_TOKEN_SECONDS.snapshot()
+            _, _, attempt_sum_before = GAME_TOKEN_ATTEMPT_SECONDS.snapshot()
+            await api.fetch_game_token(account)
+            _, attempts, attempt_sum = GAME_TOKEN_ATTEMPT_SECONDS.snapshot()
+            _, total, total_sum = GAME_TOKEN_SECONDS.snapshot()
+        finally:
+            await api.close()
+        assert attempts - attempts_before >= 1
+        assert total - total_before == 1
+        # 用户可见的耗时含排队 单次尝试只有网络时间
+        assert total_sum - total_sum_before >= 0.05
+        assert (attempt_sum - attempt_sum_before) / (attempts - attempts_before) < 0.05
+
+    asyncio.run(main())
@@ -0,0 +1,243 @@
+import asyncio
+import gzip
+import itertools
+import json
+import ssl
+
+import pytest
+
+from backend.core.http_pool import AsyncHttpPool, HttpError
+
+
+class ScriptedServer:
+    # 按脚本逐个回复请求的原始HTTP/1.1服务 respond(连接序号, 连接上的请求序号, 请求) 返回要写出的原始字节
+    # 返回None时不回复直接关闭连接 模拟服务端在连接空闲时将其关闭
+    # close_after_reply为True时每次回复后都关闭连接 且响应中不带Connection: close
+    def __init__(self, respond, close_after_reply=False):
+        self.respond = respond
+        self.close_after_reply = close_after_reply
+        self.connections = 0
+        self.requests = []
+        self._server = None
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._server.close()
+        await self._server.wait_closed()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.sockets[0].getsockname()[1]}"
+
+    async def _handle(self, reader, writer):
+        index = self.connections
+        self.connections += 1
+        try:
+            for number in itertools.count():
+                head = await reader.readuntil(b"\r\n\r\n")
+                request_line, *lines = head.decode("latin-1").split("\r\n")
+                headers = {k.strip().lower(): v.strip() for k, v in (line.split(":", 1) for line in lines if ":" in line)}
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                request = {"line": request_line, "headers": headers, "body": body}
+                self.requests.append(request)
+                reply = self.respond(index, number, request)
+                if reply is None:
+                    break
+                writer.write(reply)
+                await writer.drain()
+                if self.close_after_reply or b"connection: close" in reply.lower():
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+def response(body=b"", headers=(), status="200 OK"):
+    lines = [f"HTTP/1.1 {status}", *headers]
+    if not any(h.lower().startswith(("content-length", "transfer-encoding")) for h in headers):
+        lines.append(f"Content-Length: {len(body)}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+
+def idle_connections(pool, url):
+    key, _ = pool._split(url)
+    return len(pool._idle.get(key, ()))
+
+
+def run(respond, scenario, **server_options):
+    async def main():
+        async with ScriptedServer(respond, **server_options) as server:
+            pool = AsyncHttpPool()
+            try:
+                return await scenario(server, pool)
+            finally:
+                await pool.close()
+
+    return asyncio.run(main())
+
+
+def test_chunked_body_with_extensions_and_trailer():
+    chunked = b"4;name=value\r\nWiki\r\n6\r\npedia \r\nE\r\nin \r\n\r\nchunks.\r\n0\r\nExpires: never\r\n\r\n"
+
+    async def scenario(server, pool):
+        res = await pool.request("GET", server.url + "/chunked")
+        assert res.body == b"Wikipedia in \r\n\r\nchunks."
+        # 读完trailer后连接可以继续使用
+        res = await pool.request("GET", server.url + "/chunked")
+        assert res.status == 200
+        assert (pool.opened, pool.reused, server.connections) == (1, 1, 1)
+
+    run(lambda index, number, request: response(chunked, ["Transfer-Encoding: chunked"]), scenario)
+
+
+def test_gzip_body_is_decompressed():
+    payload = json.dumps({"retcode": 0, "data": "x" * 1000}).encode()
+
+    def respond(index, number, request):
+        assert request["headers"]["accept-encoding"] == "gzip"
+        return response(gzip.compress(payload), ["Content-Encoding: gzip"])
+
+    async def scenario(server, pool):
+        res = await pool.request("GET", server.url + "/gzip")
+        assert res.json()["data"] == "x" * 1000
+
+    run(respond, scenario)
+
+
+def test_gzip_inside_chunked_encoding():
+    compressed = gzip.compress(b'{"retcode": 0}')
+    half = len(compressed) // 2
+    chunks = b"".join(b"%x\r\n%s\r\n" % (len(part), part) for part in (compressed[:half], compressed[half:])) + b"0\r\n\r\n"
+
+    async def scenario(server, pool):
+        assert (await pool.request("GET", server.url + "/")).json() == {"retcode": 0}
+
+    run(lambda index, number, request: response(chunks, ["Transfer-Encoding: chunked", "Content-Encoding: gzip"]), scenario)
+
+
+def test_keep_alive_connection_is_reused():
+    async def scenario(server, pool):
+        for _ in range(3):
+            assert (await pool.request("GET", server.url + "/")).body == b"ok"
+        assert (pool.opened, pool.reused, server.connections) == (1, 2, 1)
+        assert idle_connections(pool, server.url) == 1
+
+    run(lambda index, number, request: response(b"ok"), scenario)
+
+
+def test_connection_close_is_not_reused():
+    async def scenario(server, pool):
+        for _ in range(2):
+            await pool.request("GET", server.url + "/")
+        assert (pool.opened, pool.reused, server.connections) == (2, 0, 2)
+        assert idle_connections(pool, server.url) == 0
+
+    run(lambda index, number, request: response(b"bye", ["Connection: close"]), scenario)
+
+
+def test_idle_connection_closed_by_server_is_replaced():
+    # 第一条连接上的第二个请求到达时服务端直接关闭连接 与客户端复用空闲连接的时机重叠
+    def respond(index, number, request):
+        return None if (index, number) == (0, 1) else response(b"ok")
+
+    async def scenario(server, pool):
+        assert (await pool.request("GET", server.url + "/")).body == b"ok"
+        # 复用的连接发送后读不到响应 幂等请求自动换新连接重试一次
+        assert (await pool.request("GET", server.url + "/again", params={"a": 1})).body == b"ok"
+        assert (server.connections, pool.opened) == (2, 2)
+        assert server.requests[-1]["line"] == "GET /again?a=1 HTTP/1.1"
+
+    run(respond, scenario)
+
+
+def test_post_on_dropped_idle_connection_is_not_replayed():
+    # 服务端可能已经处理了请求才断开 POST不自动重发 由调用方决定是否重试
+    def respond(index, number, request):
+        return None if (index, number) == (0, 1) else response(b"ok")
+
+    async def scenario(server, pool):
+        await pool.request("GET", server.url + "/")
+        with pytest.raises(HttpError):
+            await pool.request("POST", server.url + "/scan", json={"a": 1})
+        assert (server.connections, pool.opened) == (1, 1)
+        assert [request["line"] for request in server.requests] == ["GET / HTTP/1.1", "POST /scan HTTP/1.1"]
+
+    run(respond, scenario)
+
+
+def test_idle_connection_dropped_before_reuse_is_discarded():
+    async def scenario(server, pool):
+        await pool.request("GET", server.url + "/")
+        # 客户端取用前已收到EOF 直接丢弃这条连接 不会发出注定失败的请求
+        await asyncio.sleep(0.05)
+        assert (await pool.request("GET", server.url + "/")).body == b"ok"
+        assert (pool.opened, pool.reused, server.connections) == (2, 0, 2)
+
+    run(lambda index, number, request: response(b"ok"), scenario, close_after_reply=True)
+
+
+def test_fresh_connection_dropped_mid_response_raises():
+    async def scenario(server, pool):
+        with pytest.raises(HttpError):
+            await pool.request("GET", server.url + "/")
+        assert server.connections == 1
+
+    run(lambda index, number, request: b"HTTP/1.1 200 OK\r\nContent-Length: 100\r\nConnection: close\r\n\r\npartial", scenario)
+
+
+def test_ping_discards_connection_on_tls_error():
+    async def scenario(server, pool):
+        await pool.request("GET", server.url + "/")
+        conn = pool._idle[pool._split(server.url)[0]][0]
+
+        async def broken_send(*args):
+            raise ssl.SSLError("bad record mac")
+
+        pool._send = broken_send
+        # TLS层错误不会抛出到保活任务 失败的连接关闭后丢弃
+        assert await pool.ping(server.url) == 0
+        assert idle_connections(pool, server.url) == 0
+        assert conn.writer.is_closing()
+
+    run(lambda index, number, request: response(b"ok"), scenario)
+
+
+def test_body_until_eof_without_length():
+    async def scenario(server, pool):
+        assert (await pool.request("GET", server.url + "/")).body == b"streamed"
+        assert idle_connections(pool, server.url) == 0
+
+    run(lambda index, number, request: b"HTTP/1.1 200 OK\r\n\r\nstreamed", scenario, close_after_reply=True)
+
+
+def test_head_response_has_no_body():
+    async def scenario(server, pool):
+        res = await pool.request("HEAD", server.url + "/")
+        assert res.body == b""
+        # 响应头中的Content-Length不代表有响应体 连接仍可复用
+        assert (await pool.request("GET", server.url + "/")).body == b"0123456789"
+        assert (pool.opened, pool.reused) == (1, 1)
+
+    def respond(index, number, request):
+        if request["line"].startswith("HEAD"):
+            return b"HTTP/1.1 200 OK\r\nContent-Length: 10\r\n\r\n"
+        return response(b"0123456789")
+
+    run(respond, scenario)
+
+
+def test_request_line_headers_and_params():
+    async def scenario(server, pool):
+        await pool.request("POST", server.url + "/path?a=1", params={"b": "x y"}, json={"k": "v"}, headers={"cookie": "c=1"})
+        request = server.requests[0]
+        assert request["line"] == "POST /path?a=1&b=x+y HTTP/1.1"
+        assert request["headers"]["host"] == server.url.split("//")[1]
+        assert request["headers"]["content-type"] == "application/json"
+        assert request["headers"]["cookie"] == "c=1"
+        assert json.loads(request["body"]) == {"k": "v"}
+
+    run(lambda index, number, request: response(b"{}"), scenario)
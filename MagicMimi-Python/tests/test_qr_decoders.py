@@ -0,0 +1,32 @@
+import threading
+
+from backend.core.frame_source import synthetic_qr_frame, to_gray
+from backend.core.qr_decoders import OpenCvDecoder
+
+PAYLOAD = "https://user.mihoyo.com/qr_code_in_game.html?app_id=4&ticket=0123456789abcdef"
+
+
+def test_opencv_decoder_is_safe_to_share_across_threads():
+    decoder = OpenCvDecoder()
+    frames = [to_gray(synthetic_qr_frame(640, 360, PAYLOAD, position=(40 + 60 * i, 40))) for i in range(4)]
+    detectors, results, errors = [], [], []
+    barrier = threading.Barrier(4)
+
+    def decode(frame):
+        try:
+            barrier.wait()
+            for _ in range(10):
+                results.append([code.data for code in decoder.decode(frame)])
+            detectors.append(decoder._detector)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=decode, args=(frame,)) for frame in frames]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert results == [[PAYLOAD.encode()]] * 40
+    # 每个解码线程使用各自的检测器
+    assert len({id(detector) for detector in detectors}) == 4
@@ -0,0 +1,67 @@
+import numpy as np
+
+from backend.core.frame_source import synthetic_qr_frame, to_gray
+from backend.core.qr_decoders import DecodedQr, OpenCvDecoder, QrDecoder
+from backend.core.qr_prefilter import FinderPrefilter, PrefilteredDecoder, measure_prefilter, prefilter_corpus
+
+PAYLOAD = "https://user.mihoyo.com/qr_code_in_game.html?app_id=4&ticket=0123456789abcdef0123456789abcdef"
+
+# 合成样本上的上限 初筛漏检会直接丢掉二维码 因此比误报的要求严得多
+MAX_FALSE_NEGATIVE_RATE = 0.05
+MAX_FALSE_POSITIVE_RATE = 0.10
+
+
+class CountingDecoder(QrDecoder):
+    name = "counting"
+
+    def __init__(self, codes=()):
+        self.codes = list(codes)
+        self.calls = []
+
+    def decode(self, gray):
+        self.calls.append(gray.shape)
+        return list(self.codes)
+
+
+def test_false_negative_rate_on_corpus():
+    result = measure_prefilter(FinderPrefilter(), prefilter_corpus(count=40, seed=1))
+    assert result["positives"] == result["negatives"] == 40
+    assert result["false_negative_rate"] <= MAX_FALSE_NEGATIVE_RATE
+    assert result["false_positive_rate"] <= MAX_FALSE_POSITIVE_RATE
+
+
+def test_blank_frame_skips_decoder():
+    decoder = CountingDecoder()
+    prefiltered = PrefilteredDecoder(decoder, audit_every=0)
+    gray = to_gray(synthetic_qr_frame(1280, 720, noise=8))
+    assert prefiltered.decode(gray) == []
+    assert decoder.calls == []
+    assert prefiltered.stats()["rejected"] == 1
+
+
+def test_region_decode_reports_full_frame_coordinates():
+    position = (700, 300)
+    gray = to_gray(synthetic_qr_frame(1280, 720, PAYLOAD, position=position, module_size=5))
+    prefiltered = PrefilteredDecoder(OpenCvDecoder())
+    codes = prefiltered.decode(gray)
+    assert [code.data.decode() for code in codes] == [PAYLOAD]
+    x, y, w, h = codes[0].rect
+    # 识别结果的矩形在整帧坐标系中 位于二维码(含四个模块的空白区)之内
+    assert position[0] <= x <= position[0] + 5 * 4 + 2
+    assert position[1] <= y <= position[1] + 5 * 4 + 2
+    assert w > 0 and h > 0
+
+
+def test_audit_counts_missed_codes():
+    class NoCandidates(FinderPrefilter):
+        def candidates(self, gray):
+            return []
+
+    decoder = CountingDecoder([DecodedQr(b"x", (0, 0, 10, 10))])
+    prefiltered = PrefilteredDecoder(decoder, prefilter=NoCandidates(), audit_every=2)
+    gray = np.zeros((100, 100), dtype=np.uint8)
+    results = [prefiltered.decode(gray) for _ in range(4)]
+    # 每2个被拒帧完整解码一次 解出的二维码照常返回并计为漏检
+    assert [len(codes) for codes in results] == [0, 1, 0, 1]
+    stats = prefiltered.stats()
+    assert (stats["audits"], stats["missed"], stats["miss_rate"]) == (2, 2, 1.0)
@@ -0,0 +1,47 @@
+import asyncio
+import time
+
+from backend.core.qr_ticket_pool import QrTicketPool
+
+
+class FakeQrApi:
+    # 每次申请耗时delay秒 记录同时进行的申请数
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def fetch_qr_ticket(self):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        ticket = f"{self.calls:032x}"
+        url = f"https://user.mihoyo.com/qr_code_in_game.html?app_id=4&ticket={ticket}&expire={int(time.time()) + 600}"
+        return {"ticket": ticket, "device": "device", "url": url}, None
+
+
+def test_miss_fetches_once_before_refilling():
+    async def main():
+        api = FakeQrApi()
+        pool = QrTicketPool(api, size=2)
+        try:
+            data, error = await pool.take()
+            assert error is None and data["ticket"] == f"{1:032x}"
+            # 池为空时只现场申请一次 补充任务在此之后才开始
+            assert (api.calls, api.max_in_flight) == (1, 1)
+            for _ in range(100):
+                if pool.stats()["available"] == 2:
+                    break
+                await asyncio.sleep(0.01)
+            assert pool.stats()["available"] == 2
+            assert (await pool.take())[0]["ticket"] == f"{2:032x}"
+            assert pool.stats()["hits"] == 1 and pool.stats()["misses"] == 1
+        finally:
+            pool.stop()
+
+    asyncio.run(main())
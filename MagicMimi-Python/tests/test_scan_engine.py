@@ -0,0 +1,73 @@
+import time
+
+import numpy as np
+
+from backend.core.frame_source import SyntheticFrameSource
+from backend.core.qr_decoders import QrDecoder
+from backend.core.scan_pipeline import FairFrameQueue, ScanEngine
+from backend.core.scan_scheduler import AdaptiveScanScheduler
+
+
+class SleepDecoder(QrDecoder):
+    # 固定耗时且从不命中的解码器
+    name = "sleep"
+
+    def __init__(self, seconds=0.0):
+        self.seconds = seconds
+
+    def decode(self, gray):
+        time.sleep(self.seconds)
+        return []
+
+
+def changing_frames(seed):
+    # 两帧交替 每一帧都能通过变化检测进入解码队列
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, (48, 64, 3), dtype=np.uint8) for _ in range(2)]
+
+
+def run_engine(decoder, targets=3, seconds=1.0, **options):
+    # 调度器不设下限和CPU预算 截图速度只受帧率预算和线程数限制
+    engine = ScanEngine(
+        decoder,
+        scheduler_factory=lambda: AdaptiveScanScheduler(min_interval=0.001, cpu_budget=1.0),
+        **options,
+    )
+    for i in range(targets):
+        engine.add_target(f"window{i}", SyntheticFrameSource(changing_frames(i)))
+    engine.start()
+    time.sleep(seconds)
+    stats = engine.stats()
+    engine.stop()
+    return stats
+
+
+def test_fair_queue_rotates_targets_and_keeps_latest_frame():
+    queue = FairFrameQueue()
+    for i in range(100):
+        queue.put("busy", i)
+    queue.put("quiet", "q")
+    queue.put("busy", 100)
+    # 频繁出帧的目标只保留最新一帧 不会排在安静目标前面占满队列
+    assert queue.get(timeout=0) == ("busy", 100)
+    assert queue.get(timeout=0) == ("quiet", "q")
+    assert queue.get(timeout=0) is None
+    assert queue.dropped == 100
+
+
+def test_saturated_decoder_is_shared_evenly():
+    # 截图远快于解码 解码线程按目标轮转 每个目标分到几乎相同的解码次数
+    stats = run_engine(SleepDecoder(0.004), capture_workers=2, decode_workers=1)
+    decoded = [target["decoded"] for target in stats["targets"].values()]
+    assert stats["dropped_frames"] > 0
+    assert min(decoded) >= 20
+    assert min(decoded) >= 0.8 * max(decoded)
+
+
+def test_frame_budget_is_split_across_targets():
+    stats = run_engine(SleepDecoder(), max_fps=300, capture_workers=2, decode_workers=2)
+    captured = [target["captured"] for target in stats["targets"].values()]
+    # 每个目标每秒约100帧
+    assert sum(captured) <= 1.2 * 300
+    assert min(captured) >= 50
+    assert min(captured) >= 0.8 * max(captured)
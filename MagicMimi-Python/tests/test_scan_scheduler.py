@@ -0,0 +1,27 @@
+import pytest
+
+from backend.core.scan_scheduler import AdaptiveScanScheduler
+
+
+@pytest.mark.parametrize("cpu_budget", [0, -0.5])
+def test_non_positive_cpu_budget_is_rejected(cpu_budget):
+    with pytest.raises(ValueError, match="cpu_budget必须大于0"):
+        AdaptiveScanScheduler(cpu_budget=cpu_budget)
+
+
+def test_cpu_budget_stretches_the_interval():
+    # 每帧工作0.1秒 预算25%时每帧至少间隔0.3秒 扣除工作时间后等待0.2秒
+    scheduler = AdaptiveScanScheduler(min_interval=0.01, max_interval=1.0, cpu_budget=0.25, window=0.0)
+    delay = scheduler.observe(True, 0.1)
+    assert delay == pytest.approx(0.2)
+    assert scheduler.state == "throttled"
+
+
+def test_hit_bursts_to_min_interval():
+    scheduler = AdaptiveScanScheduler(min_interval=0.02, max_interval=0.5, cpu_budget=1.0)
+    for _ in range(20):
+        scheduler.observe(False, 0.0)
+    assert scheduler.interval == 0.5
+    scheduler.note_hit()
+    assert scheduler.observe(False, 0.0) == 0.02
+    assert scheduler.state == "burst"
@@ -0,0 +1,145 @@
+import asyncio
+import functools
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from backend.core.config import ScanSettings
+from backend.core.connection_warmer import ConnectionWarmer
+from backend.core.scan_supervisor import IDLE, RUNNING, ScanSupervisor
+
+
+def wait_for_state(supervisor, state, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while supervisor.state != state:
+        assert time.monotonic() < deadline, f"等待{state}超时 当前{supervisor.state}"
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def supervisor_factory():
+    supervisors = []
+
+    def make(run_session, **options):
+        supervisor = ScanSupervisor(run_session, **options)
+        supervisors.append(supervisor)
+        return supervisor
+
+    yield make
+    for supervisor in supervisors:
+        supervisor.shutdown()
+
+
+def test_stop_interrupts_a_waiting_session_at_once(supervisor_factory):
+    cleaned = []
+
+    async def session(settings, mark_running):
+        mark_running()
+        try:
+            # 等待识别结果或登录响应
+            await asyncio.sleep(60)
+        finally:
+            cleaned.append(settings)
+
+    supervisor = supervisor_factory(session)
+    assert supervisor.start("s1")[0]
+    wait_for_state(supervisor, RUNNING)
+    supervisor.stop().result(timeout=1)
+    assert supervisor.state == IDLE
+    assert cleaned == ["s1"]
+    assert supervisor.stop_reason == "手动停止"
+    assert supervisor.stop_latency_ms < 50
+
+
+def test_stop_latency_is_the_cleanup_time(supervisor_factory):
+    async def session(settings, mark_running):
+        mark_running()
+        try:
+            await asyncio.sleep(60)
+        finally:
+            # 清理时等待正在进行的一次截图或解码结束
+            await asyncio.to_thread(time.sleep, 0.1)
+
+    supervisor = supervisor_factory(session)
+    supervisor.start(None)
+    wait_for_state(supervisor, RUNNING)
+    supervisor.stop().result(timeout=1)
+    assert 100 <= supervisor.stop_latency_ms < 200
+
+
+def test_state_changes_are_reported_and_sessions_restart(supervisor_factory):
+    states = []
+
+    async def session(settings, mark_running):
+        mark_running()
+        return "会话结束"
+
+    supervisor = supervisor_factory(session, on_state=lambda status: states.append(status["state"]))
+    for _ in range(2):
+        assert supervisor.start(None)[0]
+        wait_for_state(supervisor, IDLE)
+    assert states == ["starting", "running", "idle"] * 2
+    assert supervisor.session_id == 2
+    assert supervisor.stop_reason == "会话结束"
+
+
+def test_window_scanner_stops_within_budget(stand_in, monkeypatch):
+    from backend.api.ws import WebSocketManager
+    from backend.core import mihoyo_api
+    from backend.core.log_ring import LogRing
+    from backend.core.window_scanner import WindowScanner
+
+    # 会话内创建的MihoyoAPI指向替身服务 连接预热不访问外网
+    monkeypatch.setattr(mihoyo_api, "MihoyoAPI", functools.partial(mihoyo_api.MihoyoAPI, hosts=stand_in.host_map()))
+    scanner = WindowScanner(SimpleNamespace(accounts={}, is_scanning=False), WebSocketManager(log_ring=LogRing()))
+    try:
+        settings = ScanSettings(account_name="main", hwnd=0, game_type=4, source="synthetic:1280x720")
+        assert scanner.start(settings)[0]
+        wait_for_state(scanner.supervisor, RUNNING)
+        time.sleep(0.3)
+        assert scanner.stop()[0]
+        assert asyncio.run(scanner.wait_stopped(2))
+        status = scanner.session_status()
+        assert status["state"] == IDLE and status["last_error"] is None
+        # 不再等待解码线程 停止耗时与解码耗时无关
+        assert status["stop_latency_ms"] < 100
+        assert scanner.pipeline is None
+    finally:
+        scanner.supervisor.shutdown()
+
+
+def test_failed_setup_releases_session_resources(stand_in, monkeypatch):
+    from backend.api.ws import WebSocketManager
+    from backend.core import mihoyo_api
+    from backend.core.log_ring import LogRing
+    from backend.core.window_scanner import WindowScanner
+
+    monkeypatch.setattr(mihoyo_api, "MihoyoAPI", functools.partial(mihoyo_api.MihoyoAPI, hosts=stand_in.host_map()))
+
+    async def never_ready(self, timeout=None):
+        await asyncio.sleep(3600)
+
+    # 预热结果迟迟不出 报告预热的任务只能随会话结束被取消
+    monkeypatch.setattr(ConnectionWarmer, "wait_ready", never_ready)
+    scanner = WindowScanner(SimpleNamespace(accounts={}, is_scanning=False), WebSocketManager(log_ring=LogRing()))
+    try:
+        settings = ScanSettings(account_name="main", hwnd=0, game_type=4, source="dir:/nonexistent")
+        for _ in range(3):
+            assert scanner.start(settings)[0]
+            assert asyncio.run(scanner.wait_stopped(5))
+            assert scanner.session_status()["last_error"]
+        # 截图源打开失败时 预热任务 预热报告和连接池随会话一起释放
+        assert scanner.warmer is None and scanner.pipeline is None
+        async def warmer_tasks():
+            # 被取消的预热任务要再经过几次事件循环迭代才结束
+            for _ in range(100):
+                tasks = [task for task in asyncio.all_tasks() if "ConnectionWarmer" in repr(task.get_coro()) or "_report_warmup" in repr(task.get_coro())]
+                if not tasks:
+                    break
+                await asyncio.sleep(0.01)
+            return tasks
+
+        assert asyncio.run_coroutine_threadsafe(warmer_tasks(), scanner.supervisor._loop).result(1) == []
+    finally:
+        scanner.supervisor.shutdown()
@@ -0,0 +1,115 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+from backend.core.config import ScanSettings
+from backend.core.ticket_ledger import EXPIRED, SEEN, SUBMITTED, WON, TicketLedger
+from backend.core.window_scanner import WindowScanner
+
+SCAN = "/hk4e_cn/combo/panda/qrcode/scan"
+TICKET = "0123456789abcdef"
+
+
+class LogRecorder:
+    def __init__(self):
+        self.logs = []
+
+    async def broadcast_log(self, message, level="INFO"):
+        self.logs.append((level, message))
+
+
+def game_qr(ticket):
+    return f"https://user.mihoyo.com/qr_code_in_game.html?app_id=4&app_name=%E5%8E%9F%E7%A5%9E&bbs=true&biz_key=hk4e_cn&ticket={ticket}"
+
+
+def test_claim_lets_a_ticket_through_once_across_threads():
+    ledger = TicketLedger()
+    results = []
+    barrier = threading.Barrier(8)
+
+    def claim(source):
+        barrier.wait()
+        results.append(ledger.claim("abcdef", source))
+
+    threads = [threading.Thread(target=claim, args=(f"hwnd:{i}",)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results.count(True) == 1
+    assert ledger.state("abcdef") == SUBMITTED
+    assert ledger.stats()["duplicates"] == 7
+
+
+def test_unresolved_ticket_expires_after_ttl():
+    ledger = TicketLedger(ttl=0.0)
+    ledger.observe("abcdef", "hwnd:1")
+    # 过期的票据不再提交
+    assert not ledger.claim("abcdef", "hwnd:2")
+    assert ledger.state("abcdef") == EXPIRED
+
+
+def test_windows_seeing_the_same_ticket_send_one_scan(stand_in, make_api, account):
+    # 三个窗口交替识别到同一张二维码 并发处理 只向/qrcode/scan提交一次
+    scanner = WindowScanner(SimpleNamespace(accounts={"main": account}), LogRecorder())
+    scanner.ticket_ledger = TicketLedger()
+    settings = ScanSettings(account_name="main", hwnd=1, game_type=4)
+    qr = game_qr(TICKET)
+
+    async def main():
+        api = make_api(stand_in.host_map())
+        sightings = [asyncio.create_task(scanner._handle_qr(f"hwnd:{i % 3}", qr, settings, api)) for i in range(30)]
+        try:
+            while scanner.ticket_ledger.state(TICKET) == SUBMITTED:
+                await asyncio.sleep(0.01)
+            # 登录完成后各窗口仍在识别到这张二维码
+            for i in range(30):
+                await scanner._handle_qr(f"hwnd:{i % 3}", qr, settings, api)
+        finally:
+            for task in sightings:
+                task.cancel()
+            await asyncio.gather(*sightings, return_exceptions=True)
+            await api.close()
+
+    asyncio.run(main())
+    assert stand_in.requests[SCAN] == 1
+    assert scanner.ticket_ledger.state(TICKET) == WON
+    assert scanner.ticket_ledger.stats()["duplicates"] == 59
+
+
+def test_released_ticket_waits_out_the_backoff():
+    ledger = TicketLedger(retry_backoff=60.0)
+    assert ledger.claim("abcdef", "hwnd:1")
+    ledger.release("abcdef", "请求超时")
+    assert ledger.state("abcdef") == SEEN
+    # 退避期内再次识别到不会重复提交
+    assert not ledger.claim("abcdef", "hwnd:2")
+    ledger.release("abcdef")
+    assert ledger.stats()["duplicates_by_state"] == {"backoff": 1}
+
+
+def test_timed_out_ticket_is_submitted_again_when_seen(stand_in, make_api, account):
+    # 第一次登录时替身服务过慢 超时后票据退回seen 再次识别到时登录成功
+    scanner = WindowScanner(SimpleNamespace(accounts={"main": account}), LogRecorder())
+    scanner.ticket_ledger = TicketLedger(retry_backoff=0.05)
+    settings = ScanSettings(account_name="main", hwnd=1, game_type=4)
+    qr = game_qr(TICKET)
+    latency = stand_in.latency
+
+    async def main():
+        api = make_api(stand_in.host_map(), step_timeout=0.1)
+        try:
+            stand_in.latency = lambda: 0.3
+            await scanner._handle_qr("hwnd:1", qr, settings, api)
+            assert scanner.ticket_ledger.state(TICKET) == SEEN
+            stand_in.latency = latency
+            await asyncio.sleep(0.05)
+            await scanner._handle_qr("hwnd:1", qr, settings, api)
+        finally:
+            stand_in.latency = latency
+            await api.close()
+
+    asyncio.run(main())
+    assert scanner.ticket_ledger.state(TICKET) == WON
+    assert scanner.ticket_ledger.recent()[0]["retries"] == 1
+    assert scanner.websocket_manager.logs[-1][0] == "SUCCESS"
@@ -0,0 +1,83 @@
+import asyncio
+import time
+
+from backend.core.token_cache import GameTokenCache
+
+GAME_TOKEN = "/auth/api/getGameToken"
+SCAN = "/hk4e_cn/combo/panda/qrcode/scan"
+CONFIRM = "/hk4e_cn/combo/panda/qrcode/confirm"
+
+
+async def wait_cached(cache, account, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if cache._entries.get(str(account.uid)):
+            return True
+        await asyncio.sleep(0.01)
+    return False
+
+
+def test_login_skips_game_token_when_prefetched(stand_in, make_api, account):
+    async def main():
+        api = make_api(stand_in.host_map())
+        api.token_cache.track(account)
+        try:
+            assert await wait_cached(api.token_cache, account)
+            success, message = await api.attempt_game_login("ticket", 4, account)
+            assert success, message
+            # 识别到二维码之后只有scan和confirm两次请求
+            assert api.token_cache.stats()["misses"] == 0
+            assert stand_in.requests[SCAN] == 1
+            assert stand_in.requests[CONFIRM] == 1
+            # 用过的token作废 后台立即换一个新的
+            assert await wait_cached(api.token_cache, account)
+            assert stand_in.requests[GAME_TOKEN] == 2
+        finally:
+            await api.close()
+
+    asyncio.run(main())
+
+
+def test_login_fetches_game_token_on_cache_miss(stand_in, make_api, account):
+    async def main():
+        api = make_api(stand_in.host_map())
+        try:
+            success, message = await api.attempt_game_login("ticket", 4, account)
+            assert success, message
+            assert stand_in.requests[GAME_TOKEN] == 1
+            assert api.token_cache.stats()["misses"] == 1
+        finally:
+            await api.close()
+
+    asyncio.run(main())
+
+
+def test_cached_token_expires_after_ttl(account):
+    async def fetch(account):
+        return f"gt-{account.uid}", None
+
+    async def main():
+        cache = GameTokenCache(fetch, ttl=0.05)
+        assert await cache.prefetch(account) == ("gt-100001", None)
+        assert cache.get(account) == "gt-100001"
+        await asyncio.sleep(0.06)
+        assert cache.get(account) is None
+
+    asyncio.run(main())
+
+
+def test_untrack_stops_refresh(account):
+    async def fetch(account):
+        return "gt", None
+
+    async def main():
+        cache = GameTokenCache(fetch)
+        cache.track(account)
+        await asyncio.sleep(0)
+        assert cache.stats()["tracked"] == 1
+        cache.untrack()
+        await asyncio.sleep(0.01)
+        assert cache.stats()["tracked"] == 0
+        assert all(task.done() for task in asyncio.all_tasks() if task is not asyncio.current_task())
+
+    asyncio.run(main())
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import threading
+
+from backend.api.ws import WebSocketManager
+from backend.core.log_ring import LogRing
+
+
+def new_manager(**options):
+    # 每个测试使用独立的日志环 不补发其他测试留下的日志
+    return WebSocketManager(log_ring=LogRing(), **options)
+
+
+class FakeWebSocket:
+    # 记录收到的帧 stall为True时send_text永不返回 模拟卡死的客户端
+    def __init__(self, stall=False):
+        self.stall = stall
+        self.frames = []
+        self.closed_with = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        if self.stall:
+            await asyncio.Event().wait()
+        self.frames.append(json.loads(text))
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+def test_logs_and_fps_are_coalesced_per_tick():
+    async def main():
+        manager = new_manager(tick=0.05)
+        client = FakeWebSocket()
+        await manager.connect(client)
+        for i in range(100):
+            await manager.broadcast_fps(float(i))
+            if i % 2 == 0:
+                await manager.broadcast_log(f"line {i}")
+        await asyncio.sleep(0.15)
+        manager.disconnect(client)
+        return manager, client
+
+    manager, client = asyncio.run(main())
+    # 一个tick内的50条日志合并为一帧 100次fps只发送最后一次
+    logs = [frame for frame in client.frames if frame["type"] == "logs"]
+    fps = [frame for frame in client.frames if frame["type"] == "fps"]
+    assert len(logs) == 1 and [entry["message"] for entry in logs[0]["entries"]] == [f"line {i}" for i in range(0, 100, 2)]
+    assert fps == [{"type": "fps", "value": "99.0"}]
+    assert manager.coalesced == 99
+
+
+def test_publish_from_other_threads_does_not_block():
+    async def main():
+        manager = new_manager(tick=0.05)
+        client = FakeWebSocket()
+        await manager.connect(client)
+        threads = [threading.Thread(target=lambda: [manager.publish({"type": "log", "message": "x"}) for _ in range(100)]) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        await asyncio.sleep(0.15)
+        manager.disconnect(client)
+        return client
+
+    client = asyncio.run(main())
+    assert sum(len(frame["entries"]) for frame in client.frames) == 400
+
+
+def test_stalled_client_is_evicted_without_slowing_others():
+    async def main():
+        manager = new_manager(tick=0.02, max_queue=4, send_timeout=0.2)
+        fast, stalled = FakeWebSocket(), FakeWebSocket(stall=True)
+        await manager.connect(fast)
+        await manager.connect(stalled)
+        for i in range(20):
+            await manager.broadcast({"type": "status", "value": i})
+            await asyncio.sleep(0.03)
+        manager.disconnect(fast)
+        return manager, fast, stalled
+
+    manager, fast, stalled = asyncio.run(main())
+    assert stalled.closed_with == 1013
+    assert manager.evicted == 1
+    assert [frame["value"] for frame in fast.frames] == list(range(20))
+
+
+def test_reconnect_replays_missed_logs_before_live_frames():
+    async def main():
+        manager = new_manager(tick=0.02)
+        for i in range(5):
+            manager.log(f"line {i}")
+        client = FakeWebSocket()
+        # 客户端已收到seq 2 只补发之后的日志
+        await manager.connect(client, since=2)
+        manager.log("live")
+        await asyncio.sleep(0.1)
+        manager.disconnect(client)
+        return client
+
+    client = asyncio.run(main())
+    replay, live = client.frames
+    assert replay["replay"] and [entry["seq"] for entry in replay["entries"]] == [3, 4, 5]
+    assert [entry["message"] for entry in live["entries"]] == ["live"]
+
+
+def test_spilled_logs_are_replayed_and_removed_on_close(tmp_path):
+    path = tmp_path / "spill.log"
+    ring = LogRing(capacity=10, spill_path=str(path), spill_size=4096)
+    for i in range(50):
+        ring.append("INFO", f"日志 {i}")
+    # 挤出内存环的记录仍可从溢出文件补发 文件写满后最旧的记录被覆盖
+    records = ring.since(0)
+    assert [record["seq"] for record in records] == list(range(records[0]["seq"], 51))
+    assert records[0]["seq"] > 1 and ring.stats()["spilled"] > 0
+    ring.close()
+    ring.close()
+    assert not path.exists()
+    assert ring.stats()["spilled"] == 0
+    assert [record["seq"] for record in ring.since(0)] == list(range(41, 51))
@@ -1,17 +1,10 @@
 import sys
 import os
-import json
 import time
-import uuid
 import re
-import http.client
-import numpy
-import cv2
-from pyzbar.pyzbar import decode
+import asyncio
+from collections import namedtuple
 import win32gui
-import win32ui
-import win32con
-import win32api
 
 from PySide6.QtCore import Qt, QThread, Signal, QObject, QDateTime
 from PySide6.QtWidgets import (
@@ -21,7 +14,35 @@ from PySide6.QtWidgets import (
 )
 from PySide6.QtGui import QPainter, QPen, QColor
 
+# 扫描核心模块与Web版共用 位于 MagicMimi-Python/backend/core
+# 需要保持仓库中的目录结构 MagicMini-PySide6 与 MagicMimi-Python 并列
+# 单独拷贝本目录运行时 用环境变量MAGICMIMI_BACKEND_ROOT指定MagicMimi-Python所在目录
+BACKEND_ROOT = os.path.abspath(os.environ.get(
+    "MAGICMIMI_BACKEND_ROOT",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "MagicMimi-Python"),
+))
+if not os.path.isfile(os.path.join(BACKEND_ROOT, "backend", "core", "__init__.py")):
+    sys.exit(f"找不到扫描核心模块 {os.path.join(BACKEND_ROOT, 'backend', 'core')} 请在完整的仓库中运行 或设置MAGICMIMI_BACKEND_ROOT")
+# 放在最前 避免被环境中其他名为backend的包覆盖
+sys.path.insert(0, BACKEND_ROOT)
+from backend.core.account_store import AccountStore
+from backend.core.decode_ladder import DecodeLadder
+from backend.core.frame_source import DesktopRegionFrameSource, WindowFrameSource, open_frame_source
+from backend.core.qr_decoders import decoder_registry
+from backend.core.qr_prefilter import PrefilteredDecoder
+from backend.core.scan_pipeline import ScanPipeline
+from backend.core.scan_scheduler import AdaptiveScanScheduler
+from backend.core.mihoyo_api import MihoyoAPI
+from backend.core.ticket_ledger import extract_expiry, extract_ticket, ticket_ledger
+
+ACCOUNTS_DB_PATH = "accounts.db"
+# 旧版整文件JSON存储 首次启动时导入ACCOUNTS_DB_PATH
 ACCOUNTS_FILE_PATH = "accounts.json"
+# 日志框最多保留的行数
+LOG_DISPLAY_MAX_LINES = 2000
+
+# 登录流程所需的账户凭据 cookie即用户粘贴的Stoken文本
+LoginAccount = namedtuple("LoginAccount", ["uid", "cookie"])
 
 style_sheet_string = """
 QWidget {
@@ -65,17 +86,15 @@ QPushButton {
 #FpsLabel { font-size: 16px; font-weight: bold; color: #67C23A; }
 """
 
-def load_saved_accounts():
-    if not os.path.exists(ACCOUNTS_FILE_PATH): return {}
-    try:
-        with open(ACCOUNTS_FILE_PATH, 'r', encoding='utf-8') as file: return json.load(file)
-    except (json.JSONDecodeError, IOError): return {}
-
-def save_accounts_to_file(accounts):
-    try:
-        with open(ACCOUNTS_FILE_PATH, 'w', encoding='utf-8') as file:
-            json.dump(accounts, file, indent=4, ensure_ascii=False)
-    except IOError as e: print(f"保存账户失败: {e}")
+def open_account_store():
+    # 账户保存在SQLite中 增删改只写入变化的一行 值仍为 {"uid", "stoken"} 字典
+    store = AccountStore(
+        ACCOUNTS_DB_PATH,
+        factory=lambda uid, stoken: {"uid": uid, "stoken": stoken},
+        fields=lambda data: (data["uid"], data["stoken"]),
+    )
+    store.migrate_json(ACCOUNTS_FILE_PATH, cookie_key="stoken")
+    return store
 
 def get_active_windows():
     windows = {}
@@ -112,6 +131,7 @@ class ScannerThread(QThread):
     class ThreadSignals(QObject):
         log_message = Signal(str)
         fps_update = Signal(int)
+        scheduler_update = Signal(dict)
         scan_successful = Signal()
 
     def __init__(self, parent=None):
@@ -122,118 +142,152 @@ class ScannerThread(QThread):
         self.game_type = 4
         self.user_stoken = ""
         self.user_uid = ""
-        self.device_id = str(uuid.uuid1())
-
-    def capture_target_area(self):
-        is_window_mode = self.target_window_handle is not None
-        hwnd = self.target_window_handle if is_window_mode else win32gui.GetDesktopWindow()
-        
-        if is_window_mode:
-            rect = win32gui.GetClientRect(hwnd)
-            width, height, source_x, source_y = rect[2], rect[3], 0, 0
-        else:
-            width, height = 300, 300
-            screen_width = win32api.GetSystemMetrics(win32con.SM_CXSCREEN)
-            screen_height = win32api.GetSystemMetrics(win32con.SM_CYSCREEN)
-            source_x, source_y = (screen_width - width) // 2, (screen_height - height) // 2
-        
-        if width <= 0 or height <= 0: return None
-        
-        window_dc_handle = win32gui.GetWindowDC(hwnd)
-        device_context = win32ui.CreateDCFromHandle(window_dc_handle)
-        compatible_dc = device_context.CreateCompatibleDC()
-        bitmap = win32ui.CreateBitmap()
+        self.frame_source_spec = os.environ.get("MAGICMIMI_FRAME_SOURCE")
+        # 解码阶梯 如 half,full,contrast 不设置则使用默认阶梯
+        self.decode_steps = os.environ.get("MAGICMIMI_DECODE_STEPS")
+        # 设为1时开启定位图案初筛 默认每帧都完整解码 初筛的漏检率尚未在真实画面上确认
+        self.use_prefilter = os.environ.get("MAGICMIMI_PREFILTER", "0") == "1"
+        # 停止时用于从界面线程唤醒扫描线程
+        self._loop = None
+        self._dispatch_task = None
+        self._pipeline = None
+
+    def create_frame_source(self):
+        # 设置了frame_source_spec时使用回放帧源 便于离线测试扫描吞吐
+        if self.frame_source_spec:
+            return open_frame_source(self.frame_source_spec)
+        if self.target_window_handle is not None:
+            return WindowFrameSource(self.target_window_handle, print_window=False)
+        return DesktopRegionFrameSource(300, 300)
+
+    def login_account(self):
+        return LoginAccount(self.user_uid, self.user_stoken)
+
+    async def execute_login_process(self, api, ticket, expires_at=None):
+        # scan和confirm复用MihoyoAPI连接池中的keep-alive连接 游戏Token优先取预取缓存
+        self.signals.log_message.emit("识别到二维码, 正在抢码并确认登录...")
         try:
-            bitmap.CreateCompatibleBitmap(device_context, width, height)
-            compatible_dc.SelectObject(bitmap)
-            compatible_dc.BitBlt((0, 0), (width, height), device_context, (source_x, source_y), win32con.SRCCOPY)
-            img_bits = bitmap.GetBitmapBits(True)
-            image = numpy.frombuffer(img_bits, dtype='uint8').reshape((height, width, 4))
-            return image[:, :, :3]
-        finally:
-            device_context.DeleteDC()
-            compatible_dc.DeleteDC()
-            win32gui.ReleaseDC(hwnd, window_dc_handle)
-            win32gui.DeleteObject(bitmap.GetHandle())
-
-    def execute_login_process(self, ticket):
-        try:
-            conn = http.client.HTTPSConnection("api-sdk.mihoyo.com", timeout=10)
-            payload = json.dumps({"app_id": self.game_type, "device": self.device_id, "ticket": ticket})
-            endpoint = "/hk4e_cn/combo/panda/qrcode/scan" if self.game_type == 4 else "/hkrpg_cn/combo/panda/qrcode/scan"
-            conn.request("POST", endpoint, payload, {})
-            data = json.loads(conn.getresponse().read().decode("utf-8"))
-            conn.close()
-            self.signals.log_message.emit(f"抢码请求返回: {data}")
-            if data.get("retcode") != 0:
-                self.signals.log_message.emit(f"抢码失败: {data.get('message', '未知错误')}")
-                return
-
-            self.signals.log_message.emit("抢码成功, 正在获取游戏Token...")
-            conn = http.client.HTTPSConnection("api-takumi.miyoushe.com", timeout=10)
-            headers = {'cookie': self.user_stoken}
-            conn.request("GET", "/auth/api/getGameToken", '', headers)
-            token_data = json.loads(conn.getresponse().read().decode("utf-8"))
-            conn.close()
-            if token_data.get("retcode") != 0 or not token_data.get("data"):
-                self.signals.log_message.emit(f"获取Token失败: {token_data.get('message')}, 请检查Stoken。")
-                return
-
-            game_token = token_data["data"]["game_token"]
-            self.signals.log_message.emit("Token获取成功, 正在确认登录...")
-            conn = http.client.HTTPSConnection("api-sdk.mihoyo.com", timeout=10)
-            confirm_payload = json.dumps({
-                "app_id": self.game_type, "device": self.device_id, "ticket": ticket,
-                "payload": {"proto": "Account", "raw": f'{{"uid":"{self.user_uid}","token":"{game_token}"}}'}
-            })
-            conn.request("POST", "/hk4e_cn/combo/panda/qrcode/confirm", confirm_payload, headers)
-            conn.getresponse().read()
-            conn.close()
+            success, message, retryable = await api.request_game_login(ticket, self.game_type, self.login_account(), expires_at)
+        except asyncio.CancelledError:
+            ticket_ledger.release(ticket, "扫描已停止", backoff=0)
+            raise
+        if retryable:
+            # 超时或网络异常 票据退回台账 退避后再次识别到时重新提交
+            ticket_ledger.release(ticket, message)
+            self.signals.log_message.emit(f"登录请求失败, 稍后重试: {message}")
+            return
+        ticket_ledger.resolve(ticket, success, message)
+        if success:
             self.signals.log_message.emit("登录流程全部成功完成。")
             self.signals.scan_successful.emit()
-        except Exception as e:
-            self.signals.log_message.emit(f"网络请求或处理时发生错误: {e}")
+        else:
+            self.signals.log_message.emit(f"登录失败: {message}")
 
-    def stoppable_sleep(self, duration_seconds):
-        for _ in range(int(duration_seconds * 20)):
-            if not self.is_running: break
-            self.msleep(50)
+    async def report_warmup(self, warmer):
+        ready = await warmer.wait_ready(timeout=15)
+        if warmer.state == "stopped":
+            return
+        if ready:
+            self.signals.log_message.emit(f"登录连接预热完成, {warmer.warm_connections}条连接就绪。")
+        else:
+            self.signals.log_message.emit(f"登录连接预热未完成: {warmer.last_error or '超时'}")
+
+    async def dispatch_logins(self, pipeline, scheduler):
+        self._loop = asyncio.get_running_loop()
+        self._dispatch_task = asyncio.current_task()
+        api = MihoyoAPI()
+        # 启动时即解析DNS并建立TLS连接 扫描期间心跳保活 抢码时直接复用
+        api.warmer.start()
+        report_task = asyncio.create_task(self.report_warmup(api.warmer))
+        # 扫描期间在后台保持一个未过期的游戏Token
+        api.token_cache.track(self.login_account())
+        last_unknown, fps_time = None, time.time()
+        try:
+            while self.is_running and pipeline.running:
+                result = await asyncio.to_thread(pipeline.qr_queue.get, 0.5)
+                qr_data = result[1] if result else None
+                if time.time() - fps_time >= 1:
+                    fps_time = time.time()
+                    self.signals.fps_update.emit(round(pipeline.sample_fps()))
+                    self.signals.scheduler_update.emit(scheduler.metrics())
+                if qr_data is None:
+                    continue
+                ticket = extract_ticket(qr_data)
+                if not ticket:
+                    if qr_data != last_unknown:
+                        last_unknown = qr_data
+                        self.signals.log_message.emit("无法识别的二维码格式, 已忽略。")
+                    continue
+                # 流水线不会因登录而暂停 票据台账保证同一ticket只提交一次
+                if ticket_ledger.claim(ticket, "pyside"):
+                    await self.execute_login_process(api, ticket, extract_expiry(qr_data))
+        finally:
+            report_task.cancel()
+            await api.close()
 
     # 运行
     def run(self):
         self.is_running = True
         self.signals.log_message.emit("扫描线程已启动。")
-        frame_count, start_time = 0, time.time()
-        while self.is_running:
-            try:
-                img = self.capture_target_area()
-                if img is not None:
-                    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-                    codes = decode(gray)
-                    if codes:
-                        self.signals.log_message.emit("识别到二维码, 正在处理。")
-                        match = re.search(r"ticket=([a-f0-9]+)", codes[0].data.decode())
-                        if match:
-                            self.execute_login_process(match.group(1))
-                            self.stoppable_sleep(3)
-                        else:
-                            self.signals.log_message.emit("无法识别的二维码格式, 已忽略。")
-                            self.stoppable_sleep(1)
-                else: self.msleep(1000)
-                
-                frame_count += 1
-                if time.time() - start_time >= 1:
-                    self.signals.fps_update.emit(frame_count)
-                    frame_count, start_time = 0, time.time()
-                self.msleep(50)
-            except Exception as e:
-                self.signals.log_message.emit(f"扫描循环发生致命错误: {e}")
-                break
+        try:
+            ladder = DecodeLadder(decoder_registry.get(), self.decode_steps)
+        except ValueError as e:
+            self.signals.log_message.emit(f"解码阶梯配置错误: {e}")
+            return
+        latency = decoder_registry.report()["latency_ms"]
+        steps = " > ".join(step.name for step in ladder.steps)
+        self.signals.log_message.emit(f"解码后端: {ladder.decoder.name} (校准耗时 {latency} ms/帧) 阶梯 {steps} 初筛 {'开' if self.use_prefilter else '关'}")
+        prefilter = PrefilteredDecoder(ladder) if self.use_prefilter else None
+        decoder = prefilter or ladder
+        # 截图和解码在流水线线程中进行 本线程运行一个事件循环 只负责消费识别结果并执行登录
+        # 截图频率由自适应调度器决定 画面静止时退避 识别到二维码时提速
+        scheduler = AdaptiveScanScheduler(min_interval=0.05, max_interval=0.5)
+        pipeline = ScanPipeline(self.create_frame_source(), decoder, scheduler=scheduler)
+        self._pipeline = pipeline
+        pipeline.start()
+        if not self.is_running:
+            # 启动过程中已被要求停止
+            pipeline.request_stop()
+        try:
+            asyncio.run(self.dispatch_logins(pipeline, scheduler))
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self.signals.log_message.emit(f"扫描循环发生致命错误: {e}")
+        # 正在进行的解码在后台完成后自行退出 不拖慢停止
+        pipeline.stop(wait_decoders=False)
+        self._loop, self._dispatch_task, self._pipeline = None, None, None
+        if pipeline.source_lost:
+            self.signals.log_message.emit("目标窗口已关闭, 扫描自动停止。")
+        self.report_ladder(ladder, prefilter)
         self.signals.log_message.emit("扫描线程已停止。")
 
+    def report_ladder(self, ladder, prefilter=None):
+        # 初筛拒绝率与抽查漏检 以及阶梯各级命中情况 用于调整MAGICMIMI_DECODE_STEPS和MAGICMIMI_PREFILTER
+        if prefilter is not None and prefilter.frames:
+            stats = prefilter.stats()
+            self.signals.log_message.emit(
+                f"初筛 {stats['frames']} 帧 拒绝 {stats['rejected']} 抽查 {stats['audits']} 漏检 {stats['missed']} 平均 {stats['latency']['mean_ms']} ms"
+            )
+        stats = ladder.stats()
+        if not stats["frames"]:
+            return
+        parts = [f"{s['step']} 命中 {s['hits']}/{s['attempts']} 平均 {s['mean_ms']} ms" for s in stats["steps"] if s["attempts"]]
+        self.signals.log_message.emit(f"解码阶梯 {stats['frames']} 帧 未识别 {stats['misses']} | " + " | ".join(parts))
+
     # 结束
     def stop_processing(self):
+        # 不等待任何轮询间隔 关闭流水线唤醒等待识别结果的读取 同时取消正在进行的登录
         self.is_running = False
+        pipeline, loop, task = self._pipeline, self._loop, self._dispatch_task
+        if pipeline is not None:
+            pipeline.request_stop()
+        if loop is not None and task is not None:
+            try:
+                loop.call_soon_threadsafe(task.cancel)
+            except RuntimeError:
+                # 事件循环已经结束
+                pass
 
 # 创建一个主窗口
 class MainApplicationWindow(QMainWindow):
@@ -242,7 +296,7 @@ class MainApplicationWindow(QMainWindow):
         self.setWindowTitle("MagicMini - v1.0.0 @MacacaTaurus")
         self.setFixedWidth(380) # 固定宽度
         self.resize(380, 800) # 设置初始尺寸
-        self.accounts = {}
+        self.accounts = open_account_store()
         self.scan_thread = ScannerThread()
         self.overlay_rectangle = OverlayRectangle()
         
@@ -322,6 +376,8 @@ class MainApplicationWindow(QMainWindow):
         log_group = QGroupBox("操作日志")
         log_layout = QVBoxLayout()
         self.log_display_box = QTextEdit(); self.log_display_box.setObjectName("LogDisplayBox")
+        # 只保留最近的日志行 长时间扫描时内存和重绘开销不再随日志增长
+        self.log_display_box.document().setMaximumBlockCount(LOG_DISPLAY_MAX_LINES)
         self.log_display_box.setReadOnly(True)
         log_layout.addWidget(self.log_display_box)
         log_group.setLayout(log_layout)
@@ -338,6 +394,7 @@ class MainApplicationWindow(QMainWindow):
         self.pin_button.toggled.connect(self.toggle_window_on_top)
         self.scan_thread.signals.log_message.connect(self.add_log_entry)
         self.scan_thread.signals.fps_update.connect(lambda fps: self.fps_label.setText(f"FPS: {fps}"))
+        self.scan_thread.signals.scheduler_update.connect(self.show_scheduler_metrics)
         self.scan_thread.finished.connect(self.handle_scan_finished)
         self.scan_thread.signals.scan_successful.connect(self.stop_scan_process)
 
@@ -351,6 +408,12 @@ class MainApplicationWindow(QMainWindow):
             self.add_log_entry("窗口已取消置顶。")
         self.show()
 
+    def show_scheduler_metrics(self, metrics):
+        self.fps_label.setToolTip(
+            f"调度状态: {metrics['state']}\n截图间隔: {metrics['interval_ms']} ms\n"
+            f"CPU占用: {metrics['cpu_share']:.0%} / 预算 {metrics['cpu_budget']:.0%}"
+        )
+
     def add_log_entry(self, message):
         timestamp = QDateTime.currentDateTime().toString("hh:mm:ss")
         self.log_display_box.append(f"{timestamp} > {message}")
@@ -365,12 +428,11 @@ class MainApplicationWindow(QMainWindow):
         self.pin_button.setEnabled(is_enabled)
 
     def load_and_display_accounts(self):
-        self.accounts = load_saved_accounts()
         self.account_selector.clear()
         if not self.accounts:
             self.account_selector.addItem("无账户")
         else:
-            self.account_selector.addItems(self.accounts.keys())
+            self.account_selector.addItems(list(self.accounts))
         self.on_account_selection_change()
 
     def on_account_selection_change(self):
@@ -395,7 +457,6 @@ class MainApplicationWindow(QMainWindow):
             return
 
         self.accounts[name] = {"uid": uid, "stoken": stoken}
-        save_accounts_to_file(self.accounts)
         self.add_log_entry(f"账户 '{name}' 已保存 (UID: {uid})")
         self.load_and_display_accounts()
         self.account_selector.setCurrentText(name)
@@ -407,7 +468,6 @@ class MainApplicationWindow(QMainWindow):
                                      QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         if reply == QMessageBox.Yes:
             del self.accounts[name]
-            save_accounts_to_file(self.accounts)
             self.add_log_entry(f"账户 '{name}' 已删除。")
             self.load_and_display_accounts()
 
@@ -461,6 +521,7 @@ class MainApplicationWindow(QMainWindow):
             self.scan_thread.stop_processing()
             self.scan_thread.wait(1000)
         self.overlay_rectangle.close()
+        self.accounts.close()
         event.accept()
 
 if __name__ == "__main__":